@@ -74,6 +74,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def user_from_token(token: str) -> Optional[str]:
+    """Username of a valid access token, or None."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get the current user from the token."""
     credentials_exception = HTTPException(
@@ -0,0 +1,252 @@
+"""Request batching for the Omnia AI platform."""
+from typing import Dict, List, Any, Optional, Tuple, Hashable
+import logging
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchStats:
+    """Counters describing how a batcher is coalescing requests."""
+    
+    def __init__(self, window: int = 1000):
+        """Initialize the batch statistics."""
+        self.requests = 0
+        self.batches = 0
+        self.batch_size_histogram = defaultdict(int)
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.recent_wait_times = deque(maxlen=window)
+    
+    def record_batch(self, wait_times: List[float]):
+        """Record a dispatched batch and the queueing time of its requests."""
+        self.batches += 1
+        self.requests += len(wait_times)
+        self.batch_size_histogram[len(wait_times)] += 1
+        for wait_time in wait_times:
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.recent_wait_times.append(wait_time)
+    
+    def to_dict(self, queue_depth: int = 0) -> Dict[str, Any]:
+        """Return the statistics as a JSON-serializable dict."""
+        recent = sorted(self.recent_wait_times)
+        
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+        
+        return {
+            "queue_depth": queue_depth,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items())),
+            "wait_time_ms": {
+                "mean": (self.total_wait_time / self.requests * 1000) if self.requests else 0.0,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": self.max_wait_time * 1000,
+            },
+        }
+
+
+class MicroBatcher:
+    """Coalesce concurrent requests into batches.
+    
+    Requests submitted while a batch is being collected are held for at most
+    ``max_wait_ms`` (or until ``max_batch_size`` requests are queued) and then
+    dispatched together. Subclasses define how requests are grouped and how a
+    group is processed.
+    """
+    
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        """Initialize the batcher."""
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.stats = BatchStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be batched."""
+        return self._queue.qsize() if self._queue is not None else 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics."""
+        stats = self.stats.to_dict(self.queue_depth)
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000
+        return stats
+    
+    async def submit(self, item: Any) -> Any:
+        """Submit a request and wait for its result."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+    
+    def _ensure_worker(self):
+        """Start the batching worker on the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._worker = loop.create_task(self._run())
+    
+    async def _run(self):
+        """Collect requests into batches and dispatch them."""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Pick up anything that arrived while we were waiting
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            try:
+                await self._dispatch(batch)
+            except Exception as e:
+                logger.exception(f"Error dispatching batch: {e}")
+    
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        """Group a collected batch and process each group."""
+        now = time.perf_counter()
+        # Requests whose caller has gone away are dropped before doing any work
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+        
+        self.stats.record_batch([now - enqueued_at for _, _, enqueued_at in batch])
+        
+        groups: Dict[Hashable, List[Tuple[Any, asyncio.Future, float]]] = defaultdict(list)
+        for entry in batch:
+            groups[self._group_key(entry[0])].append(entry)
+        
+        for key, entries in groups.items():
+            try:
+                results = await self._process_batch(key, [item for item, _, _ in entries])
+            except Exception as e:
+                for _, future, _ in entries:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future, _), result in zip(entries, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    def _group_key(self, item: Any) -> Hashable:
+        """Key of the group a request can be batched with."""
+        return None
+    
+    async def _process_batch(self, key: Hashable, items: List[Any]) -> List[Any]:
+        """Process a group of requests, returning one result per request."""
+        raise NotImplementedError
+
+
+class GenerationBatcher(MicroBatcher):
+    """Batch concurrent text generation requests into one ``generate`` call."""
+    
+    def __init__(self, model_loader, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        """Initialize the generation batcher."""
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("GENERATION_MAX_BATCH_SIZE", "8"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("GENERATION_BATCH_WINDOW_MS", "10"))
+        super().__init__(max_batch_size, max_wait_ms)
+        self.model_loader = model_loader
+    
+    async def generate(self, model_id: str, prompt: str, max_length: int = 100,
+                       params: Optional[Dict[str, Any]] = None,
+                       max_new_tokens: Optional[int] = None) -> Optional[str]:
+        """Generate text for a prompt as part of the next batch.
+        
+        With ``max_new_tokens`` the limit does not depend on the prompt
+        length, so prompts of any length can share a batch.
+        """
+        params_key = tuple(sorted(params.items())) if params else ()
+        if max_new_tokens is not None:
+            max_length = None
+        return await self.submit((model_id, prompt, max_length, max_new_tokens, params_key))
+    
+    def _group_key(self, item: Any) -> Hashable:
+        """Only requests for the same model, length limit and decoding parameters share a batch."""
+        model_id, _, max_length, max_new_tokens, params_key = item
+        return (model_id, max_length, max_new_tokens, params_key)
+    
+    async def _process_batch(self, key: Hashable, items: List[Any]) -> List[Any]:
+        """Run one batched generation for a group of prompts."""
+        model_id, max_length, max_new_tokens, params_key = key
+        prompts = [item[1] for item in items]
+        return await self.model_loader.generate_batch(
+            model_id, prompts, max_length, dict(params_key) or None, max_new_tokens
+        )
+
+
+class EmbeddingBatcher(MicroBatcher):
+    """Merge in-flight embedding requests into one ``encode`` call per tick."""
+    
+    def __init__(self, model_loader, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None):
+        """Initialize the embedding batcher."""
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "64"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", "2"))
+        super().__init__(max_batch_size, max_wait_ms)
+        self.model_loader = model_loader
+        self.texts_requested = 0
+        self.texts_encoded = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batching statistics."""
+        stats = super().get_stats()
+        stats["texts_requested"] = self.texts_requested
+        stats["texts_encoded"] = self.texts_encoded
+        return stats
+    
+    async def embed(self, model_id: str, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed texts as part of the next batch, one row per text."""
+        return await self.submit((model_id, tuple(texts)))
+    
+    def _group_key(self, item: Any) -> Hashable:
+        """Only requests for the same model share an ``encode`` call."""
+        return item[0]
+    
+    async def _process_batch(self, key: Hashable, items: List[Any]) -> List[Any]:
+        """Encode the distinct texts of a group and fan the rows back out."""
+        rows: Dict[str, int] = {}
+        for _, texts in items:
+            for text in texts:
+                rows.setdefault(text, len(rows))
+        
+        self.texts_requested += sum(len(texts) for _, texts in items)
+        self.texts_encoded += len(rows)
+        
+        embeddings = await self.model_loader.get_embedding(key, list(rows))
+        if embeddings is None:
+            return [None] * len(items)
+        
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return [embeddings[[rows[text] for text in texts]] for _, texts in items]
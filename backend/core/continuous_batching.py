@@ -0,0 +1,304 @@
+"""Continuous batching of text generation for the Omnia AI platform.
+
+Static batching runs a batch until its longest request finishes, so short
+requests wait for long ones and new requests wait for the whole batch. Here
+the decode loop is driven one token at a time: new sequences join the
+running batch between steps and finished ones leave it immediately.
+
+The running batch shares one key/value cache. Sequences of different
+lengths are left-padded to a common length and masked; padding columns no
+sequence needs any more are trimmed when sequences leave. Enable with
+``GENERATION_SCHEDULER=continuous``.
+"""
+from typing import Dict, List, Any, Optional
+import logging
+import asyncio
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def _to_legacy(past_key_values) -> tuple:
+    """Per-layer ``(key, value)`` tensors of a cache."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    if hasattr(past_key_values, "layers"):
+        return tuple((layer.keys, layer.values) for layer in past_key_values.layers)
+    return tuple(past_key_values)
+
+
+def _from_legacy(legacy: tuple):
+    """Cache object ``model.forward`` accepts for per-layer tensors."""
+    from transformers import DynamicCache
+    
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(legacy)
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(legacy):
+        cache.update(key, value, layer_idx)
+    return cache
+
+
+class Sequence:
+    """A generation request in the continuous batch."""
+    
+    def __init__(self, prompt: str, max_length: int, params: Dict[str, Any], future: asyncio.Future,
+                 max_new_tokens: Optional[int] = None):
+        """Initialize the sequence."""
+        self.prompt = prompt
+        self.max_length = max_length
+        self.max_new_tokens = max_new_tokens
+        self.params = params
+        self.future = future
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.prompt_ids: List[int] = []
+        self.generated_ids: List[int] = []
+        self.finished = False
+
+
+class DecodeBatch:
+    """State of the running batch of one model.
+    
+    Only touched from the inference executor, one step at a time.
+    """
+    
+    def __init__(self, model, tokenizer):
+        """Initialize the decode batch."""
+        self.model = model
+        self.tokenizer = tokenizer
+        self.sequences: List[Sequence] = []
+        # Per-layer (key, value) tensors of shape (batch, heads, length, head_dim)
+        self.past: Optional[tuple] = None
+        self.attention_mask = None
+        self.eos_token_id = getattr(tokenizer, "eos_token_id", None)
+    
+    def step(self, newcomers: List[Sequence]) -> List[Sequence]:
+        """Decode one token for every running sequence, then admit newcomers.
+        
+        Sequences whose caller has gone away are dropped first. Returns the
+        sequences that finished.
+        """
+        import torch
+        
+        finished = []
+        with torch.no_grad():
+            for sequence in self.sequences:
+                if sequence.future.done():
+                    sequence.finished = True
+            finished.extend(self._retire())
+            if self.sequences:
+                self._decode()
+                finished.extend(self._retire())
+            for sequence in newcomers:
+                sequence.started_at = time.perf_counter()
+                self._prefill(sequence)
+                finished.extend(self._retire())
+        return finished
+    
+    def _sample(self, logits, params: Dict[str, Any]) -> int:
+        """Pick the next token from the logits of one sequence."""
+        import torch
+        
+        if not params.get("do_sample", True):
+            return int(torch.argmax(logits))
+        
+        logits = logits / max(params.get("temperature", 0.7), 1e-5)
+        probs = torch.softmax(logits.float(), dim=-1)
+        top_p = params.get("top_p", 0.9)
+        if top_p < 1.0:
+            sorted_probs, sorted_ids = torch.sort(probs, descending=True)
+            # Keep the smallest set of tokens whose probability reaches top_p
+            keep = torch.cumsum(sorted_probs, dim=-1) - sorted_probs < top_p
+            sorted_probs = sorted_probs * keep
+            return int(sorted_ids[torch.multinomial(sorted_probs, 1)])
+        return int(torch.multinomial(probs, 1))
+    
+    def _accept(self, sequence: Sequence, token_id: int):
+        """Append a generated token and check whether the sequence is done."""
+        sequence.generated_ids.append(token_id)
+        max_new_tokens = sequence.max_new_tokens
+        if max_new_tokens is None:
+            max_new_tokens = max(1, sequence.max_length - len(sequence.prompt_ids))
+        if len(sequence.generated_ids) >= max_new_tokens or token_id == self.eos_token_id:
+            sequence.finished = True
+    
+    def _prefill(self, sequence: Sequence):
+        """Run a new sequence's prompt and merge its cache into the batch."""
+        import torch
+        import torch.nn.functional as F
+        
+        sequence.prompt_ids = list(self.tokenizer.encode(sequence.prompt)) or [self.eos_token_id or 0]
+        input_ids = torch.tensor([sequence.prompt_ids])
+        output = self.model(input_ids=input_ids, use_cache=True)
+        self._accept(sequence, self._sample(output.logits[0, -1], sequence.params))
+        
+        past = _to_legacy(output.past_key_values)
+        mask = torch.ones(1, len(sequence.prompt_ids), dtype=torch.long)
+        if self.past is None:
+            self.past, self.attention_mask = past, mask
+        else:
+            # Left-pad whichever side is shorter so both share one length
+            length = max(self.attention_mask.shape[1], mask.shape[1])
+            
+            def pad(tensor, to):
+                return F.pad(tensor, (0, 0, to - tensor.shape[-2], 0))
+            
+            self.past = tuple(
+                (torch.cat([pad(k, length), pad(new_k, length)]), torch.cat([pad(v, length), pad(new_v, length)]))
+                for (k, v), (new_k, new_v) in zip(self.past, past)
+            )
+            self.attention_mask = torch.cat([
+                F.pad(self.attention_mask, (length - self.attention_mask.shape[1], 0)),
+                F.pad(mask, (length - mask.shape[1], 0)),
+            ])
+        self.sequences.append(sequence)
+    
+    def _decode(self):
+        """Feed every sequence its last token and sample the next one."""
+        import torch
+        
+        input_ids = torch.tensor([[sequence.generated_ids[-1]] for sequence in self.sequences])
+        self.attention_mask = torch.cat(
+            [self.attention_mask, torch.ones(len(self.sequences), 1, dtype=torch.long)], dim=1
+        )
+        # Positions count only real tokens, so left padding does not shift them
+        position_ids = self.attention_mask.sum(dim=1, keepdim=True) - 1
+        output = self.model(
+            input_ids=input_ids, attention_mask=self.attention_mask, position_ids=position_ids,
+            past_key_values=_from_legacy(self.past), use_cache=True
+        )
+        self.past = _to_legacy(output.past_key_values)
+        for row, sequence in enumerate(self.sequences):
+            self._accept(sequence, self._sample(output.logits[row, -1], sequence.params))
+    
+    def _retire(self) -> List[Sequence]:
+        """Remove finished sequences from the batch and trim unused padding."""
+        import torch
+        
+        finished = [sequence for sequence in self.sequences if sequence.finished]
+        if not finished:
+            return []
+        
+        keep = [row for row, sequence in enumerate(self.sequences) if not sequence.finished]
+        self.sequences = [self.sequences[row] for row in keep]
+        if not keep:
+            self.past, self.attention_mask = None, None
+            return finished
+        
+        rows = torch.tensor(keep)
+        mask = self.attention_mask[rows]
+        # Columns that are padding for every remaining sequence can go
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.attention_mask = mask[:, start:]
+        self.past = tuple((k[rows, :, start:], v[rows, :, start:]) for k, v in self.past)
+        return finished
+
+
+class ContinuousBatcher:
+    """Generation with iteration-level batching, one decode loop per model.
+    
+    Offers the same ``generate`` interface as ``GenerationBatcher``. Models
+    that cannot be driven token by token (no ``forward``) fall back to
+    ``ModelLoader.generate_batch``.
+    """
+    
+    def __init__(self, model_loader, max_batch_size: Optional[int] = None, window: int = 1000):
+        """Initialize the continuous batcher."""
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("CONTINUOUS_MAX_BATCH_SIZE", "16"))
+        
+        self.model_loader = model_loader
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: Dict[str, deque] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        
+        self.requests = 0
+        self.fallback_requests = 0
+        self.tokens_generated = 0
+        self.decode_steps = 0
+        self.batch_size_total = 0
+        self.busy_seconds = 0.0
+        self.recent_queue_times = deque(maxlen=window)
+    
+    async def generate(self, model_id: str, prompt: str, max_length: int = 100,
+                       params: Optional[Dict[str, Any]] = None,
+                       max_new_tokens: Optional[int] = None) -> Optional[str]:
+        """Generate text for a prompt as part of the running batch."""
+        self.requests += 1
+        loaded = await self.model_loader.ensure_loaded(model_id)
+        if not loaded or not hasattr(self.model_loader.models.get(model_id), "forward"):
+            self.fallback_requests += 1
+            return await self.model_loader.generate_text(model_id, prompt, max_length, params, max_new_tokens)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(model_id, deque()).append(
+            Sequence(prompt, max_length, params or {"do_sample": True}, future, max_new_tokens)
+        )
+        if model_id not in self._workers:
+            self._workers[model_id] = asyncio.get_running_loop().create_task(self._run(model_id))
+        return await future
+    
+    async def _run(self, model_id: str):
+        """Decode loop of one model; exits once no sequences are left."""
+        batch = DecodeBatch(self.model_loader.models[model_id], self.model_loader.tokenizers[model_id])
+        pending = self._pending[model_id]
+        try:
+            while batch.sequences or pending:
+                newcomers = []
+                while pending and len(batch.sequences) + len(newcomers) < self.max_batch_size:
+                    sequence = pending.popleft()
+                    # Requests whose caller has gone away are dropped before doing any work
+                    if not sequence.future.done():
+                        newcomers.append(sequence)
+                
+                running = len(batch.sequences) + len(newcomers)
+                start = time.perf_counter()
+                try:
+                    finished = await self.model_loader.executor.run(model_id, batch.step, newcomers)
+                except Exception as e:
+                    logger.exception(f"Error generating text with model {model_id}: {e}")
+                    for sequence in batch.sequences + newcomers:
+                        if not sequence.future.done():
+                            sequence.future.set_result(None)
+                    batch = DecodeBatch(batch.model, batch.tokenizer)
+                    continue
+                
+                self.busy_seconds += time.perf_counter() - start
+                self.decode_steps += 1
+                self.batch_size_total += running
+                self.tokens_generated += running
+                for sequence in newcomers:
+                    self.recent_queue_times.append(sequence.started_at - sequence.submitted_at)
+                for sequence in finished:
+                    if not sequence.future.done():
+                        text = batch.tokenizer.decode(
+                            sequence.prompt_ids + sequence.generated_ids, skip_special_tokens=True
+                        )
+                        sequence.future.set_result(text)
+        finally:
+            del self._workers[model_id]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get continuous batching statistics."""
+        recent = sorted(self.recent_queue_times)
+        
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+        
+        return {
+            "scheduler": "continuous",
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": sum(len(pending) for pending in self._pending.values()),
+            "requests": self.requests,
+            "fallback_requests": self.fallback_requests,
+            "decode_steps": self.decode_steps,
+            "mean_batch_size": self.batch_size_total / self.decode_steps if self.decode_steps else 0.0,
+            "tokens_generated": self.tokens_generated,
+            "tokens_per_second": self.tokens_generated / self.busy_seconds if self.busy_seconds else 0.0,
+            "queue_time_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
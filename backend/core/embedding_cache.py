@@ -0,0 +1,361 @@
+"""Embedding cache for the Omnia AI platform.
+
+Embeddings are cached by model id, backend, precision and a hash of the text in two tiers: a
+bounded in-process LRU and a memory-mapped store on disk that survives
+restarts and is shared by every worker process on the node. Both tiers
+store vectors at the precision of their embedding model (``float32``,
+``float16``, or ``int8`` with one scale per vector).
+"""
+from typing import Dict, List, Any, Optional, Tuple, Union
+import logging
+import asyncio
+import os
+import re
+import json
+import fcntl
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from .precision import quantize_int8, dequantize_int8
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# A cached vector: an array, or int8 codes with their scale
+StoredVector = Union[np.ndarray, Tuple[np.ndarray, np.float32]]
+
+
+def text_digest(text: str) -> bytes:
+    """Content address of a text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def storage_precision(precision: Optional[str]) -> str:
+    """Name of the precision vectors are stored at; ``float32`` for anything unknown."""
+    return precision if precision in VECTOR_DTYPES else "float32"
+
+
+def encode_vector(vector: np.ndarray, precision: str) -> StoredVector:
+    """Compact form of a vector at a storage precision."""
+    if precision == "int8":
+        codes, scales = quantize_int8(vector)
+        return codes[0], scales[0]
+    return np.array(vector, dtype=VECTOR_DTYPES.get(precision, np.float32))
+
+
+def decode_vector(stored: StoredVector) -> np.ndarray:
+    """Float32 vector from its compact form."""
+    if isinstance(stored, tuple):
+        return dequantize_int8(*stored)
+    return stored.astype(np.float32)
+
+
+class DiskEmbeddingStore:
+    """Memory-mapped embedding table for one model.
+    
+    The table is a fixed-capacity open-addressing hash table stored in two
+    files: ``keys.bin`` (one 16-byte text digest per slot, all zeros when the
+    slot is empty) and ``vectors.bin`` (one vector per slot at the store's
+    precision), plus ``scales.bin`` for int8 vectors, described by
+    ``meta.json``. A table with a different layout is written under new
+    file names and swapped in by replacing ``meta.json``. Writers
+    take an exclusive ``flock`` and readers a shared one, so several processes
+    can use the same directory. When every probed slot holds another digest
+    the first one, the digest's home slot, is overwritten.
+    """
+    
+    PROBES = 8
+    
+    def __init__(self, directory: str, capacity: int, precision: str = "float32"):
+        """Initialize the store."""
+        self.directory = directory
+        self.capacity = capacity
+        self.precision = storage_precision(precision)
+        self.dim: Optional[int] = None
+        self.keys: Optional[np.memmap] = None
+        self.vectors: Optional[np.memmap] = None
+        self.scales: Optional[np.memmap] = None
+        self._inode: Optional[int] = None
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, ".lock")
+        self._meta_path = os.path.join(directory, "meta.json")
+    
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        """Hold the cross-process lock of the store."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _path(self, name: str, generation: int) -> str:
+        """Path of a table file; generation 0 is the layout from before files were swapped."""
+        suffix = f".{generation}" if generation else ""
+        return os.path.join(self.directory, f"{name}{suffix}.bin")
+    
+    def _meta_inode(self) -> Optional[int]:
+        """Inode of the metadata file, which changes whenever a new table is swapped in."""
+        try:
+            return os.stat(self._meta_path).st_ino
+        except FileNotFoundError:
+            return None
+    
+    def _open(self, dim: Optional[int] = None) -> bool:
+        """Map the table files, creating them when ``dim`` is given."""
+        if self.keys is not None:
+            if self._meta_inode() == self._inode:
+                return True
+            # Another process swapped in a new table
+            self.keys = self.vectors = self.scales = None
+        
+        with self._locked(exclusive=dim is not None):
+            meta = previous = None
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path) as f:
+                    meta = previous = json.load(f)
+                # Stores written before precisions existed hold float32 vectors
+                if meta.get("precision", "float32") != self.precision:
+                    if dim is None:
+                        return False
+                    meta = None
+                elif dim is not None and (meta["dim"] != dim or meta["capacity"] != self.capacity):
+                    meta = None
+                if meta is None:
+                    logger.warning(f"Discarding embedding store {self.directory} with a different layout")
+            
+            if meta is None:
+                if dim is None:
+                    return False
+                meta = self._create(dim, previous)
+            
+            dtype = VECTOR_DTYPES[self.precision]
+            generation = meta.get("generation", 0)
+            self.dim = meta["dim"]
+            self.capacity = meta["capacity"]
+            self.keys = np.memmap(self._path("keys", generation), dtype=np.uint8,
+                                  mode="r+", shape=(self.capacity, 16))
+            self.vectors = np.memmap(self._path("vectors", generation), dtype=dtype,
+                                     mode="r+", shape=(self.capacity, self.dim))
+            if self.precision == "int8":
+                self.scales = np.memmap(self._path("scales", generation), dtype=np.float32,
+                                        mode="r+", shape=(self.capacity,))
+            self._inode = self._meta_inode()
+        return True
+    
+    def _create(self, dim: int, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Write empty table files and swap them in; the caller holds the exclusive lock.
+        
+        The files get new names, so other processes that still map the
+        previous table keep valid mappings until they notice the swap.
+        """
+        generation = previous.get("generation", 0) + 1 if previous else 1
+        dtype = VECTOR_DTYPES[self.precision]
+        np.memmap(self._path("keys", generation), dtype=np.uint8,
+                  mode="w+", shape=(self.capacity, 16)).flush()
+        np.memmap(self._path("vectors", generation), dtype=dtype,
+                  mode="w+", shape=(self.capacity, dim)).flush()
+        if self.precision == "int8":
+            np.memmap(self._path("scales", generation), dtype=np.float32,
+                      mode="w+", shape=(self.capacity,)).flush()
+        
+        meta = {"dim": dim, "capacity": self.capacity, "precision": self.precision, "generation": generation}
+        temporary_path = f"{self._meta_path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary_path, self._meta_path)
+        
+        if previous:
+            # Unlinking leaves existing mappings of the old files intact
+            for name in ("keys", "vectors", "scales"):
+                try:
+                    os.remove(self._path(name, previous.get("generation", 0)))
+                except FileNotFoundError:
+                    pass
+        return meta
+    
+    def _slots(self, digest: bytes) -> List[int]:
+        """Slots probed for a digest."""
+        start = int.from_bytes(digest[:8], "little") % self.capacity
+        return [(start + i) % self.capacity for i in range(min(self.PROBES, self.capacity))]
+    
+    def get_many(self, digests: List[bytes]) -> List[Optional[StoredVector]]:
+        """Look up the stored vectors of several digests under one lock."""
+        if not digests or not self._open():
+            return [None] * len(digests)
+        
+        results: List[Optional[StoredVector]] = []
+        with self._locked(exclusive=False):
+            for digest in digests:
+                results.append(self._find(digest))
+        return results
+    
+    def _find(self, digest: bytes) -> Optional[StoredVector]:
+        """Stored vector of a digest; the caller holds the lock."""
+        key = np.frombuffer(digest, dtype=np.uint8)
+        for slot in self._slots(digest):
+            stored = self.keys[slot]
+            if np.array_equal(stored, key):
+                if self.scales is not None:
+                    return np.array(self.vectors[slot]), np.float32(self.scales[slot])
+                return np.array(self.vectors[slot])
+            if not stored.any():
+                return None
+        return None
+    
+    def put_many(self, digests: List[bytes], vectors: List[StoredVector]):
+        """Store the vectors of several digests, already in the store's precision, under one lock."""
+        if not digests:
+            return
+        codes = vectors[0][0] if isinstance(vectors[0], tuple) else vectors[0]
+        if not self._open(dim=len(codes)) or len(codes) != self.dim:
+            return
+        
+        with self._locked(exclusive=True):
+            for digest, vector in zip(digests, vectors):
+                self._store(digest, vector)
+    
+    def _store(self, digest: bytes, vector: StoredVector):
+        """Write the vector of a digest; the caller holds the lock."""
+        key = np.frombuffer(digest, dtype=np.uint8)
+        slots = self._slots(digest)
+        target = slots[0]
+        for slot in slots:
+            stored = self.keys[slot]
+            if np.array_equal(stored, key) or not stored.any():
+                target = slot
+                break
+        else:
+            self.evictions += 1
+        
+        # Write the vector before publishing its key
+        self.vectors[target] = vector[0] if isinstance(vector, tuple) else vector
+        if self.scales is not None:
+            self.scales[target] = vector[1]
+        self.keys[target] = key
+
+
+class EmbeddingCache:
+    """Two-tier cache of embeddings keyed by (model id, backend, precision, text hash).
+    
+    The backend and precision are part of the key because the same model
+    served by another runtime, such as ONNX Runtime, or loaded at another
+    precision gives slightly different vectors. Disk
+    lookups and writes block on a file lock, so they run on the default
+    executor, one lock acquisition per batch.
+    """
+    
+    def __init__(self, cache_dir: str, max_entries: Optional[int] = None,
+                 disk_capacity: Optional[int] = None):
+        """Initialize the embedding cache."""
+        if max_entries is None:
+            max_entries = int(os.environ.get("EMBEDDING_CACHE_SIZE", "10000"))
+        if disk_capacity is None:
+            disk_capacity = int(os.environ.get("EMBEDDING_DISK_CACHE_CAPACITY", "100000"))
+        
+        self.cache_dir = os.path.join(cache_dir, "embeddings")
+        self.max_entries = max_entries
+        self.disk_capacity = disk_capacity
+        self.memory: "OrderedDict[Tuple[str, str, str, bytes], StoredVector]" = OrderedDict()
+        self.stores: Dict[Tuple[str, str], DiskEmbeddingStore] = {}
+        
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _get_store(self, model_id: str, backend: str, precision: str) -> Optional[DiskEmbeddingStore]:
+        """Get the disk store of a model and backend, if the disk tier is enabled."""
+        if self.disk_capacity <= 0:
+            return None
+        precision = storage_precision(precision)
+        store = self.stores.get((model_id, backend))
+        if store is None or store.precision != precision:
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{model_id}--{backend}")
+            store = DiskEmbeddingStore(os.path.join(self.cache_dir, name), self.disk_capacity, precision)
+            self.stores[(model_id, backend)] = store
+        return store
+    
+    def _remember(self, key: Tuple[str, str, str, bytes], vector: StoredVector):
+        """Insert into the in-memory LRU, evicting the least recently used entry."""
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+    
+    async def get_many(self, model_id: str, texts: List[str], precision: str = "float32",
+                       backend: str = "torch") -> List[Optional[np.ndarray]]:
+        """Look up cached embeddings as float32 vectors, ``None`` for every miss."""
+        precision = storage_precision(precision)
+        keys = [(model_id, backend, precision, text_digest(text)) for text in texts]
+        vectors: List[Optional[StoredVector]] = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+            vectors.append(vector)
+        
+        store = self._get_store(model_id, backend, precision)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if store is not None and missing:
+            loop = asyncio.get_running_loop()
+            try:
+                found = await loop.run_in_executor(None, store.get_many, [keys[i][3] for i in missing])
+            except OSError as e:
+                logger.warning(f"Could not read embedding cache for {model_id}: {e}")
+                found = [None] * len(missing)
+            for i, vector in zip(missing, found):
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(keys[i], vector)
+                    vectors[i] = vector
+        
+        self.misses += sum(1 for vector in vectors if vector is None)
+        return [decode_vector(vector) if vector is not None else None for vector in vectors]
+    
+    async def put_many(self, model_id: str, texts: List[str], vectors: np.ndarray,
+                       precision: str = "float32", backend: str = "torch"):
+        """Cache freshly computed embeddings at a storage precision."""
+        precision = storage_precision(precision)
+        digests = [text_digest(text) for text in texts]
+        stored = [encode_vector(vector, precision) for vector in vectors]
+        for digest, vector in zip(digests, stored):
+            self._remember((model_id, backend, precision, digest), vector)
+        
+        store = self._get_store(model_id, backend, precision)
+        if store is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, store.put_many, digests, stored)
+        except OSError as e:
+            logger.warning(f"Could not write embedding cache for {model_id}: {e}")
+    
+    def invalidate(self, model_id: Optional[str] = None):
+        """Drop in-memory entries of a model, or of every model."""
+        if model_id is None:
+            self.memory.clear()
+            return
+        for key in [key for key in self.memory if key[0] == model_id]:
+            del self.memory[key]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self.memory),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "disk_capacity": self.disk_capacity,
+            "disk_evictions": sum(store.evictions for store in self.stores.values()),
+        }
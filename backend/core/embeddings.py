@@ -3,6 +3,10 @@ from typing import Dict, List, Any, Optional, Union
 import logging
 import numpy as np
 from .model_loader import ModelLoader
+from .batching import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .precision import round_trip
+from .similarity import cosine_scores, top_k as top_k_scores
 
 logger = logging.getLogger(__name__)
 
@@ -13,31 +17,73 @@ class EmbeddingService:
     def __init__(self):
         """Initialize the embedding service."""
         self.model_loader = ModelLoader()
-        self.default_model_id = "sentence-transformers/all-MiniLM-L6-v2"
+        self.batcher = EmbeddingBatcher(self.model_loader)
+        self.cache = EmbeddingCache(self.model_loader.model_cache_dir)
+        self._default_model_id = "sentence-transformers/all-MiniLM-L6-v2"
+    
+    @property
+    def default_model_id(self) -> str:
+        """Model used for embeddings."""
+        return self._default_model_id
+    
+    @default_model_id.setter
+    def default_model_id(self, model_id: str):
+        """Switch the embedding model, dropping cached vectors of the old one."""
+        if model_id != self._default_model_id:
+            self.cache.invalidate(self._default_model_id)
+            self.model_loader.unpin(self._default_model_id)
+        self._default_model_id = model_id
     
     async def initialize(self):
         """Initialize the embedding service."""
+        self.model_loader.pin(self.default_model_id)
         await self.model_loader.load_model(self.default_model_id, model_type="embedding")
     
-    async def get_embedding(self, text: str) -> Optional[List[float]]:
-        """Get embedding for a text."""
-        return await self.model_loader.get_embedding(self.default_model_id, text)
+    async def get_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Get embedding for a text as a float32 vector."""
+        embeddings = await self.embed([text])
+        return embeddings[0] if embeddings is not None else None
+    
+    async def get_embeddings(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Get embeddings for multiple texts as a float32 matrix, one row per text."""
+        return await self.embed(texts)
+    
+    async def embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed texts as a float32 matrix, serving repeated texts from the cache."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        
+        model_id = self.default_model_id
+        precision = self.model_loader.get_precision(model_id, model_type="embedding")
+        backend = self.model_loader.get_backend(model_id)
+        vectors = await self.cache.get_many(model_id, texts, precision, backend)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        
+        if missing:
+            embeddings = await self.batcher.embed(model_id, missing)
+            if embeddings is None:
+                return None
+            await self.cache.put_many(model_id, missing, embeddings, precision, backend)
+            # Fresh vectors match what later cache hits return
+            computed = dict(zip(missing, round_trip(embeddings, precision)))
+            vectors = [computed[text] if vector is None else vector
+                       for text, vector in zip(texts, vectors)]
+        
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
     
-    async def get_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
-        """Get embeddings for multiple texts."""
-        return await self.model_loader.get_embedding(self.default_model_id, texts)
+    def get_stats(self) -> Dict[str, Any]:
+        """Get embedding statistics."""
+        return {"batching": self.batcher.get_stats(), "cache": self.cache.get_stats()}
     
     async def compute_similarity(self, text1: str, text2: str) -> float:
         """Compute similarity between two texts."""
-        embedding1 = await self.get_embedding(text1)
-        embedding2 = await self.get_embedding(text2)
+        embeddings = await self.embed([text1, text2])
         
-        if embedding1 is None or embedding2 is None:
+        if embeddings is None:
             return 0.0
         
         # Compute cosine similarity
-        embedding1 = np.array(embedding1)
-        embedding2 = np.array(embedding2)
+        embedding1, embedding2 = embeddings
         
         dot_product = np.dot(embedding1, embedding2)
         norm1 = np.linalg.norm(embedding1)
@@ -46,38 +92,43 @@ class EmbeddingService:
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return float(dot_product / (norm1 * norm2))
     
     async def find_most_similar(self, query: str, candidates: List[str]) -> Dict[str, Any]:
         """Find the most similar text among candidates."""
-        query_embedding = await self.get_embedding(query)
-        candidate_embeddings = await self.get_embeddings(candidates)
+        results = await self.search([query], candidates, top_k=len(candidates))
         
-        if query_embedding is None or candidate_embeddings is None:
+        if not results or not results[0]:
             return {"most_similar": None, "score": 0.0, "all_scores": []}
         
-        # Compute similarities
-        query_embedding = np.array(query_embedding)
-        candidate_embeddings = np.array(candidate_embeddings)
+        similarities = results[0]
+        return {
+            "most_similar": similarities[0]["text"],
+            "score": similarities[0]["score"],
+            "all_scores": [{"text": hit["text"], "score": hit["score"]} for hit in similarities]
+        }
+    
+    async def search(self, queries: List[str], candidates: List[str],
+                     top_k: int = 5) -> Optional[List[List[Dict[str, Any]]]]:
+        """Find the ``top_k`` most similar candidates for each query."""
+        if not queries:
+            return []
+        if not candidates:
+            return [[] for _ in queries]
         
-        similarities = []
-        for i, candidate_embedding in enumerate(candidate_embeddings):
-            dot_product = np.dot(query_embedding, candidate_embedding)
-            norm1 = np.linalg.norm(query_embedding)
-            norm2 = np.linalg.norm(candidate_embedding)
-            
-            if norm1 == 0 or norm2 == 0:
-                similarity = 0.0
-            else:
-                similarity = dot_product / (norm1 * norm2)
-            
-            similarities.append((candidates[i], similarity))
+        embeddings = await self.embed(queries + candidates)
         
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        if embeddings is None:
+            return None
         
-        return {
-            "most_similar": similarities[0][0] if similarities else None,
-            "score": similarities[0][1] if similarities else 0.0,
-            "all_scores": [{"text": text, "score": score} for text, score in similarities]
-        }
+        # Score every query against every candidate with one matrix product
+        scores = cosine_scores(embeddings[:len(queries)], embeddings[len(queries):])
+        indices, best_scores = top_k_scores(scores, top_k)
+        
+        return [
+            [
+                {"text": candidates[index], "index": int(index), "score": float(score)}
+                for index, score in zip(row_indices, row_scores)
+            ]
+            for row_indices, row_scores in zip(indices, best_scores)
+        ]
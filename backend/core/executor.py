@@ -0,0 +1,143 @@
+"""Inference executor for the Omnia AI platform.
+
+Model calls are blocking (torch releases the GIL during the heavy kernels,
+but the Python side still runs synchronously), so they are dispatched to a
+dedicated thread pool instead of running on the asyncio event loop. HTTP
+handling and inference can then be scaled independently.
+
+Models are in-process objects, so there is no process pool here; scaling
+across processes is done by forking server workers after the models are
+preloaded (see ``ModelLoader._reset_after_fork``), which share the weights.
+"""
+from typing import Dict, List, Any, Optional, Callable
+import logging
+import asyncio
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _configure_torch_threads(intra_op_threads: Optional[int], inter_op_threads: Optional[int]):
+    """Apply torch thread settings in the current process."""
+    try:
+        import torch
+    except ImportError:
+        return
+    
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            # Only allowed once, before any inter-op parallel work has started
+            logger.warning(f"Could not set torch inter-op threads: {e}")
+
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class InferenceExecutor:
+    """Run blocking model inference off the event loop."""
+    
+    def __init__(self, max_workers: Optional[int] = None, model_concurrency: Optional[int] = None):
+        """Initialize the inference executor."""
+        self.max_workers = max_workers or _env_int("INFERENCE_THREADS", min(4, os.cpu_count() or 1))
+        self.model_concurrency = model_concurrency or _env_int("MODEL_CONCURRENCY", 2)
+        self.intra_op_threads = _env_int("TORCH_INTRA_OP_THREADS")
+        self.inter_op_threads = _env_int("TORCH_INTER_OP_THREADS")
+        
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._completed: Dict[str, int] = {}
+        
+        # Worker threads do not survive a fork, so a forked server worker
+        # starts with a fresh pool
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+    
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        """Create the thread pool on first use."""
+        if self._thread_pool is None:
+            _configure_torch_threads(self.intra_op_threads, self.inter_op_threads)
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="omnia-inference"
+            )
+            logger.info(
+                f"Started inference thread pool with {self.max_workers} workers "
+                f"(torch intra-op threads: {self.intra_op_threads or 'default'})"
+            )
+        return self._thread_pool
+    
+    def _get_semaphore(self, model_id: str) -> asyncio.Semaphore:
+        """Get the concurrency limiter of a model."""
+        if model_id not in self._semaphores:
+            self._semaphores[model_id] = asyncio.Semaphore(self.model_concurrency)
+        return self._semaphores[model_id]
+    
+    async def run(self, model_id: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call for a model on the inference thread pool.
+        
+        A call that has started keeps its thread until it returns, even when
+        the awaiting task is cancelled, so the model's slot is only released
+        once the call itself finishes.
+        """
+        semaphore = self._get_semaphore(model_id)
+        self._waiting[model_id] = self._waiting.get(model_id, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[model_id] -= 1
+        self._active[model_id] = self._active.get(model_id, 0) + 1
+        
+        def finished(_future: Optional[asyncio.Future] = None):
+            self._active[model_id] -= 1
+            self._completed[model_id] = self._completed.get(model_id, 0) + 1
+            semaphore.release()
+        
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_thread_pool(), functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            finished()
+            raise
+        future.add_done_callback(finished)
+        return await asyncio.shield(future)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get executor statistics."""
+        return {
+            "thread_workers": self.max_workers,
+            "model_concurrency": self.model_concurrency,
+            "torch_intra_op_threads": self.intra_op_threads,
+            "torch_inter_op_threads": self.inter_op_threads,
+            "models": {
+                model_id: {
+                    "active": self._active.get(model_id, 0),
+                    "waiting": self._waiting.get(model_id, 0),
+                    "completed": self._completed.get(model_id, 0),
+                }
+                for model_id in self._semaphores
+            },
+        }
+    
+    def _reset_after_fork(self):
+        """Forget the parent's pool and loop-bound semaphores in a forked child."""
+        self._thread_pool = None
+        self._semaphores = {}
+        self._active = {}
+        self._waiting = {}
+        self._completed = {}
+    
+    def shutdown(self, wait: bool = True):
+        """Shut down the worker pool."""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait)
+            self._thread_pool = None
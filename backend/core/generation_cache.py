@@ -0,0 +1,195 @@
+"""Generation result cache for the Omnia AI platform.
+
+Greedy decoding always produces the same text for the same model, prompt and
+parameters, so its results can be served from a cache instead of running the
+model again. Sampled generation is random and always bypasses the cache.
+
+The cache is opt-in through ``GENERATION_CACHE_BACKEND``:
+
+- ``none`` (default): disabled
+- ``memory``: per-process LRU cache bounded by ``GENERATION_CACHE_SIZE``
+- ``mongo``: shared between nodes through a MongoDB collection
+  (``GENERATION_CACHE_COLLECTION``), expired by a TTL index
+
+Entries live for ``GENERATION_CACHE_TTL_SECONDS`` in both backends.
+"""
+from typing import Dict, Any, Optional
+import logging
+import os
+import time
+import json
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def generation_cache_key(model_id: str, prompt: str, max_length: int, params: Dict[str, Any]) -> str:
+    """Cache key of a generation request."""
+    payload = json.dumps([model_id, prompt, max_length, params], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InMemoryGenerationBackend:
+    """Per-process LRU store with a TTL."""
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        """Initialize the in-memory backend."""
+        if max_entries is None:
+            max_entries = int(os.environ.get("GENERATION_CACHE_SIZE", "1024"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("GENERATION_CACHE_TTL_SECONDS", "3600"))
+        
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Get a cached result."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, text = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        
+        self.entries.move_to_end(key)
+        return text
+    
+    async def set(self, key: str, text: str):
+        """Store a result, evicting the least recently used ones over capacity."""
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, text)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get backend statistics."""
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "evictions": self.evictions}
+
+
+class MongoGenerationBackend:
+    """Store shared between nodes through a MongoDB collection."""
+    
+    name = "mongo"
+    
+    def __init__(self, collection, ttl_seconds: Optional[float] = None):
+        """Initialize the MongoDB backend."""
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("GENERATION_CACHE_TTL_SECONDS", "3600"))
+        
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self._index_created = False
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Get a cached result."""
+        # The TTL monitor only runs once a minute, so expiry is checked here too
+        document = await self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        return document["text"] if document else None
+    
+    async def set(self, key: str, text: str):
+        """Store a result."""
+        if not self._index_created:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._index_created = True
+        
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        await self.collection.replace_one(
+            {"_id": key}, {"_id": key, "text": text, "expires_at": expires_at}, upsert=True
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get backend statistics."""
+        return {"collection": self.collection.name}
+
+
+class GenerationCache:
+    """Cache of deterministic generation results in front of a pluggable backend."""
+    
+    def __init__(self, backend=None):
+        """Initialize the generation cache; without a backend it is disabled."""
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.errors = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether a backend is configured."""
+        return self.backend is not None
+    
+    def is_cacheable(self, params: Dict[str, Any]) -> bool:
+        """Only greedy decoding is deterministic."""
+        return self.enabled and not params.get("do_sample", True)
+    
+    async def get(self, model_id: str, prompt: str, max_length: int,
+                  params: Dict[str, Any]) -> Optional[str]:
+        """Look up the result of a generation request."""
+        if not self.is_cacheable(params):
+            self.bypassed += 1
+            return None
+        
+        try:
+            text = await self.backend.get(generation_cache_key(model_id, prompt, max_length, params))
+        except Exception as e:
+            logger.exception(f"Error reading generation cache: {e}")
+            self.errors += 1
+            return None
+        
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+    
+    async def put(self, model_id: str, prompt: str, max_length: int,
+                  params: Dict[str, Any], text: str):
+        """Store the result of a generation request."""
+        if not self.is_cacheable(params):
+            return
+        
+        try:
+            await self.backend.set(generation_cache_key(model_id, prompt, max_length, params), text)
+        except Exception as e:
+            logger.exception(f"Error writing generation cache: {e}")
+            self.errors += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get generation cache statistics."""
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": self.backend.name if self.enabled else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+        if self.enabled:
+            stats.update(self.backend.get_stats())
+        return stats
+
+
+def create_generation_cache(db=None) -> GenerationCache:
+    """Create the generation cache configured by ``GENERATION_CACHE_BACKEND``."""
+    backend_name = os.environ.get("GENERATION_CACHE_BACKEND", "none")
+    if backend_name == "memory":
+        return GenerationCache(InMemoryGenerationBackend())
+    if backend_name == "mongo":
+        if db is None:
+            logger.warning("Generation cache backend mongo needs a database, cache disabled")
+            return GenerationCache()
+        collection = db[os.environ.get("GENERATION_CACHE_COLLECTION", "generation_cache")]
+        return GenerationCache(MongoGenerationBackend(collection))
+    if backend_name not in ("", "none"):
+        logger.warning(f"Unknown generation cache backend {backend_name}, cache disabled")
+    return GenerationCache()
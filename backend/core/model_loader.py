@@ -1,18 +1,148 @@
-"""AI model loader for the Omnia AI platform."""
-from typing import Dict, List, Any, Optional, Union
+"""AI model loader for the Omnia AI platform.
+
+torch, transformers and sentence_transformers take seconds to import, so
+they are only imported when a model is first loaded or used, or ahead of
+time by ``import_ml_libraries`` from a background warm-up task.
+"""
+from typing import Dict, List, Any, Optional, Union, AsyncIterator
 import logging
+import asyncio
+import threading
+import time
 import os
 import json
+import importlib
+import numpy as np
+from collections import OrderedDict
 from pathlib import Path
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from sentence_transformers import SentenceTransformer
+from .executor import InferenceExecutor
+from .onnx_backend import load_onnx_embedding_model
+from .precision import parse_precision_overrides, resolve_precision, apply_weight_precision, module_size_bytes
+from .session_cache import ConversationSession, common_prefix_length, kv_cache_length
 
 logger = logging.getLogger(__name__)
 
+ML_LIBRARIES = ("torch", "transformers", "sentence_transformers")
+
+
+def generation_params(temperature: float = 0.7, top_p: float = 0.9,
+                      do_sample: Optional[bool] = None) -> Dict[str, Any]:
+    """Decoding keyword arguments for ``generate``.
+    
+    A temperature of 0 selects greedy decoding. Greedy requests always map to
+    the same parameters, whatever temperature or top_p they passed.
+    """
+    if do_sample is None:
+        do_sample = temperature > 0
+    if not do_sample:
+        return {"do_sample": False}
+    return {"do_sample": True, "temperature": temperature, "top_p": top_p}
+
+
+def import_ml_libraries() -> Dict[str, float]:
+    """Import the heavy ML libraries, returning the seconds each import took.
+    
+    Blocking; meant to run on a worker thread so the first model load does
+    not stall the event loop.
+    """
+    timings = {}
+    for name in ML_LIBRARIES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Could not import {name}: {e}")
+            continue
+        timings[name] = round(time.perf_counter() - start, 3)
+        logger.info(f"Imported {name} in {timings[name]:.2f}s")
+    return timings
+
+
+class TokenStreamer:
+    """Streamer for ``model.generate`` that hands decoded text to an asyncio queue.
+    
+    ``generate`` runs on an inference thread and calls ``put`` with every new
+    token; the decoded text delta is passed to the event loop thread-safely.
+    """
+    
+    def __init__(self, tokenizer, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        """Initialize the token streamer."""
+        self.tokenizer = tokenizer
+        self.loop = loop
+        self.queue = queue
+        self.token_ids: List[int] = []
+        self.emitted_text = ""
+        self.prompt_skipped = False
+    
+    def put(self, value):
+        """Receive new token ids from ``generate``."""
+        # The first call carries the prompt, which the client already has
+        if not self.prompt_skipped:
+            self.prompt_skipped = True
+            return
+        
+        self.token_ids.extend(value.reshape(-1).tolist())
+        text = self.tokenizer.decode(self.token_ids, skip_special_tokens=True)
+        
+        # Hold back incomplete multi-byte characters until the next token
+        if text.endswith("\ufffd") or len(text) <= len(self.emitted_text):
+            return
+        
+        delta = text[len(self.emitted_text):]
+        self.emitted_text = text
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, delta)
+    
+    def end(self):
+        """Signal that generation finished."""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+
+class CancellationCriteria:
+    """Stopping criteria for ``model.generate`` that fires once a cancellation event is set."""
+    
+    def __init__(self, cancel_event: threading.Event):
+        """Initialize the cancellation criteria."""
+        self.cancel_event = cancel_event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        """Check whether generation should stop."""
+        import torch
+        
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool)
+
+
+class ModelRecord:
+    """Bookkeeping for a resident model."""
+    
+    def __init__(self, model_id: str, model_type: str, size_bytes: int, precision: str):
+        """Initialize the model record."""
+        self.model_id = model_id
+        self.model_type = model_type
+        self.size_bytes = size_bytes
+        self.precision = precision
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+    
+    def to_dict(self, pinned: bool) -> Dict[str, Any]:
+        """Return the record as a JSON-serializable dict."""
+        return {
+            "type": self.model_type,
+            "precision": self.precision,
+            "size_mb": round(self.size_bytes / (1024 * 1024), 2),
+            "pinned": pinned,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
 
 class ModelLoader:
-    """Loader for AI models."""
+    """Loader for AI models.
+    
+    Keeps a registry of resident models under a RAM budget
+    (``MODEL_MEMORY_BUDGET_MB``, unlimited when unset). When a load pushes the
+    resident size over budget, the least recently used unpinned models are
+    evicted; they are reloaded on demand the next time they are used, with
+    concurrent requests sharing a single load.
+    """
     
     _instance = None
     
@@ -33,25 +163,234 @@ class ModelLoader:
         self.tokenizers = {}
         self.embedding_models = {}
         self.model_cache_dir = os.environ.get("MODEL_CACHE_DIR", "/tmp/omnia_ai/models")
+        self.executor = InferenceExecutor()
+        
+        # Registry of resident models, least recently used first
+        self.records: "OrderedDict[str, ModelRecord]" = OrderedDict()
+        self.known_models: Dict[str, Dict[str, Any]] = {}
+        self.pinned = set()
+        self.memory_budget_bytes = int(float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024)
+        self.evictions = 0
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Load state of every model ever requested: loading, loaded, evicted or failed
+        self.load_states: Dict[str, str] = {}
+        self.load_errors: Dict[str, str] = {}
+        # Small models proposing tokens for speculative decoding, by main model
+        self.draft_models: Dict[str, str] = {}
+        # Precision each model is loaded at; see core.precision
+        self.precision_overrides = parse_precision_overrides()
+        self.precisions: Dict[str, str] = {}
+        
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
         
         # Create cache directory if it doesn't exist
         os.makedirs(self.model_cache_dir, exist_ok=True)
     
-    async def load_model(self, model_id: str, model_type: str = "causal_lm") -> bool:
-        """Load an AI model."""
-        if model_id in self.models:
-            logger.info(f"Model {model_id} already loaded")
+    def get_stats(self) -> Dict[str, Any]:
+        """Get model loader statistics."""
+        return {
+            "registry": {
+                "memory_budget_mb": round(self.memory_budget_bytes / (1024 * 1024), 2),
+                "resident_mb": round(self.resident_bytes / (1024 * 1024), 2),
+                "evictions": self.evictions,
+                "models": {
+                    model_id: record.to_dict(model_id in self.pinned)
+                    for model_id, record in self.records.items()
+                },
+            },
+            "executor": self.executor.get_stats(),
+        }
+    
+    @property
+    def resident_bytes(self) -> int:
+        """Estimated memory held by resident models."""
+        return sum(record.size_bytes for record in self.records.values())
+    
+    def pin(self, model_id: str):
+        """Exempt a model from eviction."""
+        self.pinned.add(model_id)
+    
+    def unpin(self, model_id: str):
+        """Make a model evictable again."""
+        self.pinned.discard(model_id)
+    
+    async def load_model(self, model_id: str, model_type: str = "causal_lm",
+                         backend: Optional[str] = None, precision: Optional[str] = None) -> bool:
+        """Load an AI model, or mark it as used if it is already resident.
+        
+        Embedding models can be served through ONNX Runtime by passing
+        ``backend="onnx"`` or setting ``EMBEDDING_BACKEND=onnx``. ``precision``
+        (or the model's ``MODEL_PRECISION`` entry) selects reduced-precision
+        weights for causal language models and reduced-precision storage of
+        the vectors of embedding models.
+        """
+        self.known_models[model_id] = {"model_type": model_type, "backend": backend, "precision": precision}
+        
+        if model_id in self.records:
+            self._touch(model_id)
+            return True
+        
+        # Single-flight: concurrent callers wait for the load already in progress
+        if model_id in self._loading:
+            return await asyncio.shield(self._loading[model_id])
+        
+        future = asyncio.get_running_loop().create_future()
+        self._loading[model_id] = future
+        self.load_states[model_id] = "loading"
+        self.load_errors.pop(model_id, None)
+        loaded = False
+        try:
+            precision = resolve_precision(model_type, precision or self.precision_overrides.get(model_id))
+            loaded = await self._load_model(model_id, model_type, backend, precision)
+            if loaded:
+                size_bytes = self._estimate_size(model_id)
+                self.precisions[model_id] = precision
+                self.records[model_id] = ModelRecord(model_id, model_type, size_bytes, precision)
+                self.load_states[model_id] = "loaded"
+                logger.info(f"Model {model_id} resident at {precision} ({size_bytes / (1024 * 1024):.1f} MB)")
+                self._enforce_budget(keep=model_id)
+            return loaded
+        finally:
+            if not loaded:
+                self.load_states[model_id] = "failed"
+            future.set_result(loaded)
+            del self._loading[model_id]
+    
+    async def ensure_loaded(self, model_id: str) -> bool:
+        """Make sure a model is resident, reloading it if it was evicted."""
+        if model_id in self.records:
+            self._touch(model_id)
             return True
+        if model_id not in self.known_models:
+            return False
+        
+        logger.info(f"Reloading evicted model {model_id}")
+        return await self.load_model(model_id, **self.known_models[model_id])
+    
+    def register_draft_model(self, model_id: str, draft_model_id: str):
+        """Use a smaller model sharing the tokenizer of ``model_id`` to draft its tokens."""
+        self.draft_models[model_id] = draft_model_id
+    
+    def get_draft_model(self, model_id: str) -> Optional[str]:
+        """Draft model registered for a model, if any."""
+        return self.draft_models.get(model_id)
+    
+    def get_precision(self, model_id: str, model_type: Optional[str] = None) -> str:
+        """Precision a model was loaded at, or the default of its model type."""
+        model_type = model_type or self.known_models.get(model_id, {}).get("model_type", "causal_lm")
+        return self.precisions.get(model_id) or resolve_precision(model_type)
+    
+    def get_backend(self, model_id: str) -> str:
+        """Runtime serving an embedding model: ``torch``, ``onnx`` or ``onnx_int8``."""
+        backend = self.known_models.get(model_id, {}).get("backend") or os.environ.get("EMBEDDING_BACKEND")
+        if backend == "onnx" and os.environ.get("ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes"):
+            return "onnx_int8"
+        return backend or "torch"
+    
+    def get_context_length(self, model_id: str) -> int:
+        """Maximum number of tokens a model attends to, prompt and reply together."""
+        config = getattr(self.models.get(model_id), "config", None)
+        for name in ("max_position_embeddings", "n_positions", "max_sequence_length"):
+            value = getattr(config, name, None)
+            if isinstance(value, int) and value > 0:
+                return value
         
+        # Tokenizers without a known limit report a huge sentinel value
+        value = getattr(self.tokenizers.get(model_id), "model_max_length", None)
+        if isinstance(value, int) and 0 < value < 1_000_000:
+            return value
+        return int(os.environ.get("MODEL_CONTEXT_LENGTH", "1024"))
+    
+    def get_load_states(self) -> Dict[str, Dict[str, Any]]:
+        """Load state of every requested model, for readiness checks."""
+        states = {}
+        for model_id, state in self.load_states.items():
+            states[model_id] = {"state": state, "pinned": model_id in self.pinned}
+            if model_id in self.load_errors:
+                states[model_id]["error"] = self.load_errors[model_id]
+        return states
+    
+    def unload_model(self, model_id: str):
+        """Drop a model from memory."""
+        self.records.pop(model_id, None)
+        self.models.pop(model_id, None)
+        self.tokenizers.pop(model_id, None)
+        self.embedding_models.pop(model_id, None)
+        if model_id in self.load_states:
+            self.load_states[model_id] = "evicted"
+    
+    def _reset_after_fork(self):
+        """Prepare models loaded before a fork for use in the child process.
+        
+        torch weights are kept: the child shares their pages copy-on-write.
+        ONNX Runtime sessions own thread pools that do not survive a fork, so
+        they are dropped and reloaded on first use.
+        """
+        self._loading = {}
+        for model_id, model in list(self.embedding_models.items()):
+            if getattr(model, "model_path", None):
+                self.unload_model(model_id)
+    
+    def _touch(self, model_id: str):
+        """Mark a model as most recently used."""
+        self.records[model_id].last_used = time.monotonic()
+        self.records.move_to_end(model_id)
+    
+    def _enforce_budget(self, keep: str):
+        """Evict least recently used unpinned models until within budget.
+        
+        Requests already running on an evicted model keep their own reference,
+        so its memory is released once they finish.
+        """
+        if self.memory_budget_bytes <= 0:
+            return
+        
+        for model_id in list(self.records):
+            if self.resident_bytes <= self.memory_budget_bytes:
+                return
+            if model_id == keep or model_id in self.pinned:
+                continue
+            logger.info(f"Evicting model {model_id} to stay within the memory budget")
+            self.unload_model(model_id)
+            self.evictions += 1
+        
+        if self.resident_bytes > self.memory_budget_bytes:
+            logger.warning(
+                f"Resident models use {self.resident_bytes / (1024 * 1024):.1f} MB, over the "
+                f"{self.memory_budget_bytes / (1024 * 1024):.1f} MB budget, but none can be evicted"
+            )
+    
+    def _estimate_size(self, model_id: str) -> int:
+        """Estimate the resident size of a model's weights."""
+        size_bytes = 0
+        for registry in (self.models, self.tokenizers, self.embedding_models):
+            obj = registry.get(model_id)
+            if obj is None:
+                continue
+            if hasattr(obj, "state_dict"):
+                # torch modules, counted from their state so quantized weights are included
+                size_bytes += module_size_bytes(obj)
+            elif getattr(obj, "model_path", None) and os.path.exists(obj.model_path):
+                # ONNX Runtime sessions hold roughly the size of the model file
+                size_bytes += os.path.getsize(obj.model_path)
+        return size_bytes
+    
+    async def _load_model(self, model_id: str, model_type: str, backend: Optional[str],
+                          precision: str) -> bool:
+        """Load the weights of a model into the registry dicts."""
         logger.info(f"Loading model {model_id} of type {model_type}")
         
         try:
             if model_type == "causal_lm":
+                import torch
+                
                 # For demonstration, we'll create a tiny mock model
                 # In a real implementation, this would load a model from Hugging Face
                 # or a local file
                 
-                # self.models[model_id] = AutoModelForCausalLM.from_pretrained(
+                # from transformers import AutoModelForCausalLM, AutoTokenizer
+                # model = AutoModelForCausalLM.from_pretrained(
                 #     model_id, cache_dir=self.model_cache_dir
                 # )
                 # self.tokenizers[model_id] = AutoTokenizer.from_pretrained(
@@ -60,27 +399,57 @@ class ModelLoader:
                 
                 # Mock implementation
                 class MockModel:
-                    def generate(self, *args, **kwargs):
-                        return torch.tensor([0, 1, 2])
+                    def generate(self, input_ids=None, *args, streamer=None, **kwargs):
+                        batch_size = input_ids.shape[0] if input_ids is not None else 1
+                        if streamer is not None:
+                            streamer.put(input_ids)
+                            for token_id in [0, 1, 2]:
+                                streamer.put(torch.tensor([token_id]))
+                            streamer.end()
+                        return torch.tensor([[0, 1, 2]] * batch_size)
                 
                 class MockTokenizer:
-                    def encode(self, text, *args, **kwargs):
+                    pad_token = "<pad>"
+                    pad_token_id = 0
+                    
+                    def __call__(self, texts, *args, **kwargs):
+                        input_ids = torch.tensor([[0, 1, 2] for _ in texts])
+                        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+                    
+                    def encode(self, text, *args, return_tensors=None, **kwargs):
+                        if return_tensors == "pt":
+                            return torch.tensor([[0, 1, 2]])
                         return [0, 1, 2]
                     
                     def decode(self, ids, *args, **kwargs):
                         return "This is a mock response from Omnia AI."
                 
-                self.models[model_id] = MockModel()
+                model = MockModel()
+                self.models[model_id] = await self.executor.run(
+                    model_id, apply_weight_precision, model, precision
+                )
                 self.tokenizers[model_id] = MockTokenizer()
                 logger.info(f"Loaded mock model for {model_id}")
                 
                 return True
             
             elif model_type == "embedding":
+                backend = backend or os.environ.get("EMBEDDING_BACKEND")
+                if backend == "onnx":
+                    self.embedding_models[model_id] = await self.executor.run(
+                        model_id, load_onnx_embedding_model, model_id, self.model_cache_dir,
+                        quantize=os.environ.get("ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes"),
+                        intra_op_threads=self.executor.intra_op_threads,
+                        inter_op_threads=self.executor.inter_op_threads
+                    )
+                    logger.info(f"Loaded ONNX embedding model for {model_id}")
+                    return True
+                
                 # For demonstration, we'll create a tiny mock model
                 # In a real implementation, this would load a model from Hugging Face
                 # or a local file
                 
+                # from sentence_transformers import SentenceTransformer
                 # self.embedding_models[model_id] = SentenceTransformer(
                 #     model_id, cache_folder=self.model_cache_dir
                 # )
@@ -103,40 +472,221 @@ class ModelLoader:
         
         except Exception as e:
             logger.exception(f"Error loading model {model_id}: {e}")
+            self.load_errors[model_id] = str(e)
             return False
     
     async def generate_text(self, model_id: str, prompt: str, 
-                           max_length: int = 100) -> Optional[str]:
+                           max_length: int = 100,
+                           params: Optional[Dict[str, Any]] = None,
+                           max_new_tokens: Optional[int] = None) -> Optional[str]:
         """Generate text using a causal language model."""
-        if model_id not in self.models or model_id not in self.tokenizers:
+        results = await self.generate_batch(model_id, [prompt], max_length, params, max_new_tokens)
+        return results[0]
+    
+    async def generate_batch(self, model_id: str, prompts: List[str],
+                             max_length: int = 100,
+                             params: Optional[Dict[str, Any]] = None,
+                             max_new_tokens: Optional[int] = None) -> List[Optional[str]]:
+        """Generate text for several prompts with a single batched forward pass.
+        
+        ``params`` are decoding arguments from ``generation_params``; sampling
+        with temperature 0.7 and top_p 0.9 by default. ``max_length`` counts
+        the prompt; ``max_new_tokens``, when given, replaces it with a limit
+        on the generated tokens alone.
+        """
+        if not await self.ensure_loaded(model_id) or model_id not in self.models:
             logger.error(f"Model {model_id} not loaded")
-            return None
+            return [None] * len(prompts)
         
         try:
             model = self.models[model_id]
             tokenizer = self.tokenizers[model_id]
             
-            # Tokenize the prompt
-            input_ids = tokenizer.encode(prompt, return_tensors="pt")
-            
-            # Generate text
-            output_ids = model.generate(
-                input_ids, max_length=max_length, do_sample=True, 
-                temperature=0.7, top_p=0.9
+            return await self.executor.run(
+                model_id, self._generate_batch_sync, model, tokenizer, prompts, max_length,
+                params or generation_params(), max_new_tokens
             )
+        
+        except Exception as e:
+            logger.exception(f"Error generating text with model {model_id}: {e}")
+            return [None] * len(prompts)
+    
+    @staticmethod
+    def _generate_batch_sync(model, tokenizer, prompts: List[str], max_length: int,
+                             params: Dict[str, Any], max_new_tokens: Optional[int] = None) -> List[str]:
+        """Run batched generation; blocks, so it is called on the inference executor."""
+        # Decoder-only models must be left-padded so every prompt ends
+        # right where generation starts
+        if getattr(tokenizer, "pad_token", None) is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        
+        # Tokenize the prompts
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        input_ids = inputs["input_ids"]
+        prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        padded_length = input_ids.shape[1]
+        
+        if max_new_tokens is None:
+            # max_length includes the prompt, so the shortest prompt decides
+            # how many new tokens the batch needs; longer prompts are trimmed below
+            limits = [max(0, max_length - prompt_length) for prompt_length in prompt_lengths]
+            max_new_tokens = max(1, max(limits))
+        else:
+            limits = [max_new_tokens] * len(prompts)
+        
+        # Generate text
+        output_ids = model.generate(
+            input_ids, attention_mask=inputs["attention_mask"],
+            max_new_tokens=max_new_tokens, pad_token_id=tokenizer.pad_token_id, **params
+        )
+        
+        # Decode the generated text, dropping padding and any tokens past
+        # each prompt's own limit
+        generated_texts = []
+        for row, prompt_length, limit in zip(output_ids, prompt_lengths, limits):
+            start = padded_length - prompt_length
+            end = padded_length + limit
+            generated_texts.append(tokenizer.decode(row[start:end], skip_special_tokens=True))
+        
+        return generated_texts
+    
+    async def generate_with_session(self, model_id: str, prompt: str, max_new_tokens: int,
+                                    session: ConversationSession,
+                                    params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Generate a reply, reusing the cached prefix of a conversation session.
+        
+        ``params`` are decoding arguments from ``generation_params``, as for
+        ``generate_batch``. Returns the reply, without the prompt, together
+        with how many prompt tokens were served from the session's key/value
+        cache and how many had to be computed.
+        """
+        if not await self.ensure_loaded(model_id) or model_id not in self.models:
+            logger.error(f"Model {model_id} not loaded")
+            return None
+        
+        try:
+            model = self.models[model_id]
+            tokenizer = self.tokenizers[model_id]
             
-            # Decode the generated text
-            generated_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-            
-            return generated_text
+            return await self.executor.run(
+                model_id, self._generate_with_session_sync, model, tokenizer,
+                prompt, max_new_tokens, session, params or generation_params()
+            )
         
         except Exception as e:
             logger.exception(f"Error generating text with model {model_id}: {e}")
+            # The cache may have been modified mid-generation, so start over next turn
+            session.past_key_values = None
+            session.cache_ids = []
             return None
     
-    async def get_embedding(self, model_id: str, text: Union[str, List[str]]) -> Optional[List[float]]:
-        """Get embedding for a text or list of texts."""
-        if model_id not in self.embedding_models:
+    @staticmethod
+    def _generate_with_session_sync(model, tokenizer, prompt: str, max_new_tokens: int,
+                                    session: ConversationSession, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run session generation; blocks, so it is called on the inference executor."""
+        import torch
+        from transformers import DynamicCache
+        
+        # Only tokenize the text added since the previous turn
+        if session.text and prompt.startswith(session.text):
+            input_ids = session.text_ids + list(tokenizer.encode(prompt[len(session.text):]))
+        else:
+            input_ids = list(tokenizer.encode(prompt))
+        
+        # Keep the cached keys/values of the longest shared token prefix; at
+        # least one prompt token has to be fed to the model
+        past_key_values = session.past_key_values
+        reused = min(common_prefix_length(session.cache_ids, input_ids), len(input_ids) - 1)
+        if past_key_values is not None and reused > 0:
+            if isinstance(past_key_values, tuple):
+                past_key_values = DynamicCache.from_legacy_cache(past_key_values)
+            past_key_values.crop(reused)
+        else:
+            past_key_values = None
+            reused = 0
+        
+        pad_token_id = getattr(tokenizer, "pad_token_id", None)
+        if pad_token_id is None:
+            pad_token_id = tokenizer.eos_token_id
+        
+        output = model.generate(
+            torch.tensor([input_ids]), attention_mask=torch.ones(1, len(input_ids), dtype=torch.long),
+            past_key_values=past_key_values, max_new_tokens=max_new_tokens,
+            pad_token_id=pad_token_id, use_cache=True, return_dict_in_generate=True, **params
+        )
+        
+        sequence = getattr(output, "sequences", output)[0].tolist()
+        new_ids = sequence[len(input_ids):]
+        reply = tokenizer.decode(new_ids, skip_special_tokens=True)
+        
+        session.past_key_values = getattr(output, "past_key_values", None)
+        session.cache_ids = sequence[:kv_cache_length(session.past_key_values)]
+        session.text = prompt + reply
+        session.text_ids = input_ids + new_ids
+        
+        return {"text": reply, "reused_tokens": reused, "computed_tokens": len(input_ids) - reused}
+    
+    async def stream_text(self, model_id: str, prompt: str, max_length: int = 100,
+                          cancel_event: Optional[threading.Event] = None,
+                          params: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Generate text, yielding decoded text increments as tokens are produced.
+        
+        ``params`` are decoding arguments from ``generation_params``. Setting ``cancel_event`` (or closing the iterator) stops generation at
+        the next decoding step, freeing the inference worker.
+        """
+        if not await self.ensure_loaded(model_id) or model_id not in self.models:
+            logger.error(f"Model {model_id} not loaded")
+            return
+        
+        model = self.models[model_id]
+        tokenizer = self.tokenizers[model_id]
+        cancel_event = cancel_event or threading.Event()
+        queue: asyncio.Queue = asyncio.Queue()
+        streamer = TokenStreamer(tokenizer, asyncio.get_running_loop(), queue)
+        
+        generation = asyncio.ensure_future(self.executor.run(
+            model_id, self._stream_generate_sync, model, tokenizer, prompt,
+            max_length, streamer, cancel_event, params or generation_params()
+        ))
+        
+        def finished(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Error streaming text with model {model_id}: {task.exception()}")
+            # Make sure the consumer wakes up even if generate failed before streaming
+            queue.put_nowait(None)
+        
+        generation.add_done_callback(finished)
+        
+        try:
+            while True:
+                delta = await queue.get()
+                if delta is None:
+                    break
+                yield delta
+        finally:
+            cancel_event.set()
+    
+    @staticmethod
+    def _stream_generate_sync(model, tokenizer, prompt: str, max_length: int,
+                              streamer: TokenStreamer, cancel_event: threading.Event,
+                              params: Dict[str, Any]):
+        """Run streaming generation; blocks, so it is called on the inference executor."""
+        from transformers import StoppingCriteriaList
+        
+        input_ids = tokenizer.encode(prompt, return_tensors="pt")
+        pad_token_id = getattr(tokenizer, "pad_token_id", None)
+        if pad_token_id is None:
+            pad_token_id = tokenizer.eos_token_id
+        
+        model.generate(
+            input_ids, max_length=max_length, pad_token_id=pad_token_id, streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([CancellationCriteria(cancel_event)]), **params
+        )
+    
+    async def get_embedding(self, model_id: str, text: Union[str, List[str]]) -> Optional[np.ndarray]:
+        """Get embedding for a text or list of texts as a float32 vector or matrix."""
+        if not await self.ensure_loaded(model_id) or model_id not in self.embedding_models:
             logger.error(f"Embedding model {model_id} not loaded")
             return None
         
@@ -144,9 +694,9 @@ class ModelLoader:
             model = self.embedding_models[model_id]
             
             # Get embedding
-            embedding = model.encode(text)
+            embedding = await self.executor.run(model_id, model.encode, text)
             
-            return embedding
+            return np.ascontiguousarray(embedding, dtype=np.float32)
         
         except Exception as e:
             logger.exception(f"Error getting embedding with model {model_id}: {e}")
@@ -0,0 +1,184 @@
+"""ONNX Runtime backend for embedding models in the Omnia AI platform.
+
+The transformer of a sentence embedding model is exported once to ONNX under
+``MODEL_CACHE_DIR/onnx/<model>``, optionally quantized to dynamic int8, and
+served through an ONNX Runtime session with mean pooling done in NumPy. A
+parity report against the PyTorch model is written next to the export.
+"""
+from typing import Dict, List, Any, Optional, Union
+import logging
+import os
+import re
+import json
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PARITY_TEXTS = [
+    "Omnia AI is a platform for building AI agents.",
+    "The quick brown fox jumps over the lazy dog.",
+    "How do I reset my password?",
+    "Embeddings map text to vectors so similar texts end up close together.",
+    "短い日本語の文章です。",
+]
+
+
+class OnnxEmbeddingModel:
+    """Sentence embedding model served by an ONNX Runtime session.
+    
+    Mirrors the ``SentenceTransformer.encode`` interface used by ``ModelLoader``.
+    """
+    
+    def __init__(self, model_path: str, tokenizer, normalize: bool = True,
+                 max_seq_length: int = 256, intra_op_threads: Optional[int] = None,
+                 inter_op_threads: Optional[int] = None):
+        """Initialize the ONNX embedding model."""
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        
+        self.model_path = model_path
+        self.tokenizer = tokenizer
+        self.normalize = normalize
+        self.max_seq_length = max_seq_length
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+    
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embed a text or a list of texts."""
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            encoded = self.tokenizer(
+                batch, padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors="np"
+            )
+            feeds = {}
+            for name in self.input_names:
+                if name in encoded:
+                    feeds[name] = encoded[name].astype(np.int64)
+                else:
+                    feeds[name] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+            
+            token_embeddings = self.session.run(None, feeds)[0]
+            
+            # Mean pooling over the non-padding tokens
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled.astype(np.float32))
+        
+        embeddings = np.concatenate(embeddings, axis=0)
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        
+        return embeddings[0] if single else embeddings
+
+
+def export_embedding_model(model_id: str, output_dir: str, cache_dir: str, opset: int = 17) -> str:
+    """Export the transformer of an embedding model to ONNX."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, "model.onnx")
+    
+    tokenizer = AutoTokenizer.from_pretrained(model_id, cache_dir=cache_dir)
+    model = AutoModel.from_pretrained(model_id, cache_dir=cache_dir)
+    model.eval()
+    
+    dummy = tokenizer(["Omnia AI export"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    
+    logger.info(f"Exporting {model_id} to ONNX at {model_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(dummy[name] for name in input_names), model_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=opset
+        )
+    tokenizer.save_pretrained(output_dir)
+    
+    return model_path
+
+
+def quantize_embedding_model(model_path: str) -> str:
+    """Quantize the weights of an exported model to dynamic int8."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    quantized_path = model_path.replace(".onnx", ".int8.onnx")
+    logger.info(f"Quantizing {model_path} to {quantized_path}")
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+def check_parity(model: OnnxEmbeddingModel, model_id: str, cache_dir: str,
+                 texts: Optional[List[str]] = None, min_cosine: float = 0.999) -> Dict[str, Any]:
+    """Compare ONNX embeddings with the PyTorch SentenceTransformer outputs."""
+    from sentence_transformers import SentenceTransformer
+    
+    texts = texts or PARITY_TEXTS
+    reference = SentenceTransformer(model_id, cache_folder=cache_dir)
+    expected = np.asarray(reference.encode(texts), dtype=np.float32)
+    actual = np.asarray(model.encode(texts), dtype=np.float32)
+    
+    expected /= np.clip(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12, None)
+    actual /= np.clip(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12, None)
+    cosines = (expected * actual).sum(axis=1)
+    
+    return {
+        "model_id": model_id,
+        "model_path": model.model_path,
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_abs_diff": float(np.abs(expected - actual).max()),
+        "threshold": min_cosine,
+        "passed": bool(cosines.min() >= min_cosine),
+    }
+
+
+def load_onnx_embedding_model(model_id: str, cache_dir: str, quantize: bool = False,
+                              parity_check: bool = True, intra_op_threads: Optional[int] = None,
+                              inter_op_threads: Optional[int] = None) -> OnnxEmbeddingModel:
+    """Load an embedding model through ONNX Runtime, exporting it on first use."""
+    from transformers import AutoTokenizer
+    
+    output_dir = os.path.join(cache_dir, "onnx", re.sub(r"[^A-Za-z0-9_.-]", "_", model_id))
+    model_path = os.path.join(output_dir, "model.onnx")
+    if not os.path.exists(model_path):
+        export_embedding_model(model_id, output_dir, cache_dir)
+    
+    if quantize:
+        quantized_path = model_path.replace(".onnx", ".int8.onnx")
+        model_path = quantized_path if os.path.exists(quantized_path) else quantize_embedding_model(model_path)
+    
+    tokenizer = AutoTokenizer.from_pretrained(output_dir)
+    model = OnnxEmbeddingModel(
+        model_path, tokenizer,
+        intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads
+    )
+    
+    # Check each exported variant once; int8 is expected to drift a little more
+    report_path = model_path.replace(".onnx", ".parity.json")
+    if parity_check and not os.path.exists(report_path):
+        report = check_parity(model, model_id, cache_dir, min_cosine=0.99 if quantize else 0.999)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        if report["passed"]:
+            logger.info(f"ONNX parity check passed for {model_id}: min cosine {report['min_cosine']:.5f}")
+        else:
+            logger.warning(f"ONNX parity check failed for {model_id}: {report}")
+    
+    return model
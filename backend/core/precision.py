@@ -0,0 +1,253 @@
+"""Reduced-precision model loading for the Omnia AI platform.
+
+Each model can be loaded at a lower precision to save memory and CPU time:
+
+* causal language models: ``fp32`` (default), ``bf16`` weights, or ``int8``
+  dynamic quantization of the linear layers (GPT-2 style ``Conv1D`` layers
+  are converted to ``Linear`` first so they are quantized too);
+* embedding models: ``float32`` (default), ``float16`` or ``int8`` storage of
+  the output vectors, with one scale per vector for ``int8``.
+
+The precision of a model is chosen with the ``precision`` argument of
+``ModelLoader.load_model`` or per model id through ``MODEL_PRECISION``, a
+comma-separated list such as ``gpt2=int8,sentence-transformers/all-MiniLM-L6-v2=float16``.
+Run ``python -m core.precision`` to compare latency, memory and quality
+against full precision on a fixed prompt set.
+"""
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+import os
+import json
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = {
+    "causal_lm": ("fp32", "bf16", "int8"),
+    "embedding": ("float32", "float16", "int8"),
+}
+
+BENCHMARK_PROMPTS = [
+    "The capital of France is",
+    "Artificial intelligence is a field of computer science that",
+    "To reset your password, open the settings page and",
+    "Once upon a time, in a small village by the sea,",
+    "The three laws of thermodynamics state that",
+]
+
+
+def parse_precision_overrides(value: Optional[str] = None) -> Dict[str, str]:
+    """Precision per model id from a ``model_id=precision`` list."""
+    if value is None:
+        value = os.environ.get("MODEL_PRECISION", "")
+    
+    overrides = {}
+    for entry in value.split(","):
+        model_id, separator, precision = entry.strip().rpartition("=")
+        if separator and model_id.strip():
+            overrides[model_id.strip()] = precision.strip().lower()
+    return overrides
+
+
+def resolve_precision(model_type: str, precision: Optional[str] = None) -> str:
+    """Validate a precision for a model type, falling back to full precision."""
+    supported = PRECISIONS.get(model_type, ("fp32",))
+    if precision is None:
+        return supported[0]
+    if precision not in supported:
+        logger.warning(f"Unsupported precision {precision} for {model_type} models, using {supported[0]}")
+        return supported[0]
+    return precision
+
+
+def _conv1d_to_linear(model):
+    """Replace GPT-2 style ``Conv1D`` layers, which dynamic quantization skips, with ``Linear``."""
+    import torch
+    
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child).__name__ != "Conv1D" or not hasattr(child, "nf"):
+                continue
+            # Conv1D computes x @ W + b with W of shape (in, out)
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(parent, name, linear)
+    return model
+
+
+def apply_weight_precision(model, precision: str):
+    """Convert the weights of a causal language model; blocks for int8, so run it on the executor."""
+    if precision == "fp32":
+        return model
+    if not hasattr(model, "parameters"):
+        logger.info(f"Model {type(model).__name__} has no torch weights, keeping it at full precision")
+        return model
+    
+    import torch
+    
+    model.eval()
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    if precision == "int8":
+        model = _conv1d_to_linear(model.float())
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def module_size_bytes(model) -> int:
+    """Bytes held by the weights of a torch module, including quantized packed weights."""
+    seen = set()
+    
+    def size(value) -> int:
+        if isinstance(value, (tuple, list)):
+            return sum(size(item) for item in value)
+        if not hasattr(value, "element_size"):
+            return 0
+        # Tied weights are only counted once
+        if value.data_ptr() in seen:
+            return 0
+        seen.add(value.data_ptr())
+        return value.numel() * value.element_size()
+    
+    return sum(size(value) for value in model.state_dict().values())
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes and one float32 scale per row."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Float32 vectors from int8 codes and their scales."""
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+def round_trip(vectors: np.ndarray, precision: str) -> np.ndarray:
+    """Vectors as they come back after being stored at a precision."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if precision == "float16":
+        return vectors.astype(np.float16).astype(np.float32)
+    if precision == "int8":
+        return dequantize_int8(*quantize_int8(vectors)).reshape(vectors.shape)
+    return vectors
+
+
+def _benchmark_causal_lm(model, tokenizer, prompts: List[str], max_new_tokens: int) -> Dict[str, Any]:
+    """Greedy continuations, latency and prompt perplexity of one model variant."""
+    import torch
+    
+    latencies, continuations, losses = [], [], []
+    with torch.no_grad():
+        for prompt in prompts:
+            input_ids = tokenizer(prompt, return_tensors="pt").input_ids
+            start = time.perf_counter()
+            output = model.generate(
+                input_ids, max_new_tokens=max_new_tokens, do_sample=False,
+                pad_token_id=tokenizer.eos_token_id
+            )
+            latencies.append(time.perf_counter() - start)
+            continuations.append(output[0, input_ids.shape[1]:].tolist())
+            losses.append(float(model(input_ids, labels=input_ids).loss))
+    
+    return {
+        "memory_mb": round(module_size_bytes(model) / (1024 * 1024), 2),
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50) * 1000),
+            "mean": float(np.mean(latencies) * 1000),
+        },
+        "perplexity": float(np.exp(np.mean(losses))),
+        "continuations": continuations,
+    }
+
+
+def _benchmark_embeddings(reference: np.ndarray, precision: str) -> Dict[str, Any]:
+    """Storage size and similarity drift of embeddings stored at a precision."""
+    start = time.perf_counter()
+    stored = round_trip(reference, precision)
+    elapsed = time.perf_counter() - start
+    
+    def unit(vectors):
+        return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    
+    cosines = (unit(reference) * unit(stored)).sum(axis=1)
+    # Nearest other text of every text, before and after storage
+    expected = unit(reference) @ unit(reference).T
+    actual = unit(stored) @ unit(stored).T
+    np.fill_diagonal(expected, -np.inf)
+    np.fill_diagonal(actual, -np.inf)
+    
+    bytes_per_vector = {"float32": 4, "float16": 2, "int8": 1}[precision] * reference.shape[1]
+    return {
+        "bytes_per_vector": bytes_per_vector + (4 if precision == "int8" else 0),
+        "round_trip_ms": elapsed * 1000,
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "neighbour_agreement": float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))),
+    }
+
+
+def benchmark(model_id: str, embedding_model_id: Optional[str], cache_dir: str,
+              prompts: Optional[List[str]] = None, max_new_tokens: int = 32) -> Dict[str, Any]:
+    """Compare every precision of a causal language model and an embedding model with full precision."""
+    import copy
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    
+    prompts = prompts or BENCHMARK_PROMPTS
+    tokenizer = AutoTokenizer.from_pretrained(model_id, cache_dir=cache_dir)
+    base = AutoModelForCausalLM.from_pretrained(model_id, cache_dir=cache_dir)
+    base.eval()
+    
+    results: Dict[str, Any] = {"model_id": model_id, "prompts": len(prompts), "causal_lm": {}}
+    for precision in PRECISIONS["causal_lm"]:
+        model = apply_weight_precision(copy.deepcopy(base), precision)
+        results["causal_lm"][precision] = _benchmark_causal_lm(model, tokenizer, prompts, max_new_tokens)
+        del model
+    
+    reference = results["causal_lm"]["fp32"]
+    expected_continuations = reference["continuations"]
+    for result in results["causal_lm"].values():
+        # Share of generated tokens matching the full precision output position by position
+        matches = [
+            sum(a == b for a, b in zip(tokens, expected)) / max(1, len(expected))
+            for tokens, expected in zip(result.pop("continuations"), expected_continuations)
+        ]
+        result["token_agreement"] = float(np.mean(matches))
+        result["perplexity_delta"] = result["perplexity"] - reference["perplexity"]
+        result["memory_ratio"] = result["memory_mb"] / reference["memory_mb"] if reference["memory_mb"] else 0.0
+    
+    if embedding_model_id:
+        from sentence_transformers import SentenceTransformer
+        from .onnx_backend import PARITY_TEXTS
+        
+        encoder = SentenceTransformer(embedding_model_id, cache_folder=cache_dir)
+        vectors = np.asarray(encoder.encode(prompts + PARITY_TEXTS), dtype=np.float32)
+        results["embedding_model_id"] = embedding_model_id
+        results["embedding"] = {
+            precision: _benchmark_embeddings(vectors, precision) for precision in PRECISIONS["embedding"]
+        }
+    
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark reduced-precision models against full precision")
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--cache-dir", default=os.environ.get("MODEL_CACHE_DIR", "/tmp/omnia_ai/models"))
+    args = parser.parse_args()
+    
+    print(json.dumps(
+        benchmark(args.model, args.embedding_model or None, args.cache_dir, max_new_tokens=args.max_new_tokens),
+        indent=2
+    ))
@@ -0,0 +1,176 @@
+"""Prompt assembly for the Omnia AI platform."""
+from typing import Dict, List, Any, Optional, Tuple, Callable
+import logging
+import os
+import hashlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ROLE_PREFIXES = {"user": "User", "assistant": "Assistant", "system": "System"}
+REPLY_PREFIX = "Assistant: "
+
+
+def format_message(message: Dict[str, str]) -> str:
+    """Transcript line of a conversation message."""
+    role = message.get("role", "user")
+    content = message.get("content", "")
+    return f"{ROLE_PREFIXES.get(role, role)}: {content}\n"
+
+
+def extractive_summary(messages: List[Dict[str, str]], max_chars: int) -> str:
+    """Summarize dropped messages by the opening of each one."""
+    per_message = max(20, max_chars // max(1, len(messages)))
+    parts = []
+    for message in messages:
+        content = " ".join(message.get("content", "").split())
+        if len(content) > per_message:
+            content = content[:per_message].rsplit(" ", 1)[0] + "..."
+        parts.append(f"{ROLE_PREFIXES.get(message.get('role', 'user'), 'User')}: {content}")
+    return " | ".join(parts)[:max_chars]
+
+
+class PromptBuilder:
+    """Assemble conversation prompts that fit the model's context window.
+    
+    Token counts are computed once per distinct message and cached. When the
+    transcript does not fit in the context length minus the tokens reserved
+    for the reply, messages are dropped according to the truncation policy:
+    
+    ``drop_oldest``
+        Drop the oldest messages, whatever their role.
+    ``keep_system``
+        Always keep system messages and drop the oldest other messages.
+    ``summarize``
+        Like ``keep_system``, but the dropped messages are replaced by a
+        summary placed in a reserved slot after the system messages.
+    """
+    
+    POLICIES = ("drop_oldest", "keep_system", "summarize")
+    
+    def __init__(self, policy: Optional[str] = None, summary_tokens: Optional[int] = None,
+                 summarizer: Optional[Callable[[List[Dict[str, str]], int], str]] = None,
+                 cache_size: int = 4096):
+        """Initialize the prompt builder."""
+        policy = policy or os.environ.get("PROMPT_TRUNCATION_POLICY", "keep_system")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown truncation policy {policy}, expected one of {self.POLICIES}")
+        if summary_tokens is None:
+            summary_tokens = int(os.environ.get("PROMPT_SUMMARY_TOKENS", "128"))
+        
+        self.policy = policy
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer or extractive_summary
+        self.cache_size = cache_size
+        self._token_counts: "OrderedDict[bytes, int]" = OrderedDict()
+        
+        self.prompts = 0
+        self.truncated_prompts = 0
+        self.dropped_messages = 0
+        self.count_hits = 0
+        self.count_misses = 0
+    
+    def count_tokens(self, tokenizer, text: str) -> int:
+        """Number of tokens of a text, cached per distinct text."""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        count = self._token_counts.get(key)
+        if count is not None:
+            self._token_counts.move_to_end(key)
+            self.count_hits += 1
+            return count
+        
+        self.count_misses += 1
+        count = len(tokenizer.encode(text))
+        self._token_counts[key] = count
+        if len(self._token_counts) > self.cache_size:
+            self._token_counts.popitem(last=False)
+        return count
+    
+    @staticmethod
+    def _truncate(tokenizer, text: str, max_tokens: int, keep_end: bool = False) -> str:
+        """Cut a text down to ``max_tokens`` tokens from its start or its end."""
+        token_ids = list(tokenizer.encode(text))
+        if len(token_ids) <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        token_ids = token_ids[-max_tokens:] if keep_end else token_ids[:max_tokens]
+        return tokenizer.decode(token_ids, skip_special_tokens=True)
+    
+    def build(self, messages: List[Dict[str, str]], tokenizer, context_length: int,
+              max_new_tokens: int) -> Tuple[str, int]:
+        """Build the prompt for the next reply, returning it with its token count.
+        
+        Raises ``ValueError`` when ``max_new_tokens`` leaves no room for a prompt.
+        """
+        reply_tokens = self.count_tokens(tokenizer, REPLY_PREFIX)
+        budget = context_length - max_new_tokens - reply_tokens
+        if budget <= 0:
+            raise ValueError(
+                f"max_length {max_new_tokens} leaves no room for the prompt in a context of {context_length} tokens"
+            )
+        
+        self.prompts += 1
+        lines = [format_message(message) for message in messages]
+        counts = [self.count_tokens(tokenizer, line) for line in lines]
+        
+        if sum(counts) <= budget:
+            return "".join(lines) + REPLY_PREFIX, sum(counts) + reply_tokens
+        
+        self.truncated_prompts += 1
+        protected = set()
+        if self.policy in ("keep_system", "summarize"):
+            protected = {i for i, message in enumerate(messages) if message.get("role") == "system"}
+        # The latest message is what the reply answers, so it is never dropped
+        protected.add(len(messages) - 1)
+        
+        used = sum(counts[i] for i in protected)
+        if self.policy == "summarize":
+            used += self.summary_tokens
+        
+        # Keep the newest unprotected messages that still fit
+        kept = set(protected)
+        for i in reversed(range(len(messages))):
+            if i in kept:
+                continue
+            if used + counts[i] > budget:
+                break
+            kept.add(i)
+            used += counts[i]
+        
+        dropped = [i for i in range(len(messages)) if i not in kept]
+        self.dropped_messages += len(dropped)
+        
+        summary_line = ""
+        if self.policy == "summarize" and dropped:
+            summary = self.summarizer([messages[i] for i in dropped], self.summary_tokens * 4)
+            prefix = "System: Summary of earlier conversation: "
+            max_tokens = self.summary_tokens - self.count_tokens(tokenizer, prefix) - 1
+            summary_line = f"{prefix}{self._truncate(tokenizer, summary, max_tokens)}\n"
+        
+        prompt_lines = []
+        summary_position = max((i for i in protected if messages[i].get("role") == "system"), default=-1)
+        if summary_line and summary_position < 0:
+            prompt_lines.append(summary_line)
+        for i in sorted(kept):
+            line = lines[i]
+            if i == len(messages) - 1 and used > budget:
+                # Even the protected messages alone overflow: trim the latest one
+                line = self._truncate(tokenizer, line, counts[i] - (used - budget), keep_end=True)
+            prompt_lines.append(line)
+            if i == summary_position and summary_line:
+                prompt_lines.append(summary_line)
+        
+        prompt = "".join(prompt_lines) + REPLY_PREFIX
+        return prompt, min(used, budget) + reply_tokens
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prompt builder statistics."""
+        lookups = self.count_hits + self.count_misses
+        return {
+            "policy": self.policy,
+            "prompts": self.prompts,
+            "truncated_prompts": self.truncated_prompts,
+            "dropped_messages": self.dropped_messages,
+            "token_count_hit_rate": self.count_hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,253 @@
+"""Inference admission control for the Omnia AI platform.
+
+Without a limit, a burst of requests all run at once and all slow down
+together until clients time out. The scheduler admits at most
+``INFERENCE_MAX_CONCURRENCY`` requests at a time and queues the rest in one
+lane per ``TaskPriority``. Higher priorities are served first; within a lane
+users take turns. Requests are rejected up front, with a ``Retry-After``
+estimate, when the queue is full (503) or a user already has too many
+requests in flight (429), and dropped when their deadline passes while
+they wait.
+"""
+from typing import Dict, Any, Optional
+import logging
+import asyncio
+import os
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from models.task import TaskPriority
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away by the scheduler."""
+    
+    def __init__(self, status_code: int, reason: str, retry_after: Optional[float] = None):
+        """Initialize the rejection."""
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A request waiting for or holding an inference slot."""
+    
+    def __init__(self, user_id: str, priority: TaskPriority, deadline: Optional[float]):
+        """Initialize the ticket."""
+        self.user_id = user_id
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.future: Optional[asyncio.Future] = None
+
+
+class InferenceScheduler:
+    """Bounded, priority-aware queue in front of model inference.
+    
+    Deadlines are ``time.monotonic()`` timestamps.
+    """
+    
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 max_per_user: Optional[int] = None, window: int = 1000):
+        """Initialize the scheduler."""
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", "16"))
+        if max_queue is None:
+            max_queue = int(os.environ.get("INFERENCE_MAX_QUEUE", "64"))
+        if max_per_user is None:
+            max_per_user = int(os.environ.get("INFERENCE_MAX_PER_USER", "8"))
+        
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        
+        self.running = 0
+        self.queued = 0
+        # One lane per priority; each lane holds a queue per user, in turn order
+        self._lanes: Dict[TaskPriority, "OrderedDict[str, deque]"] = {
+            priority: OrderedDict() for priority in TaskPriority
+        }
+        self._per_user: Dict[str, int] = defaultdict(int)
+        
+        # Exponentially weighted mean service time, for Retry-After estimates
+        self._service_time = 1.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.expired = 0
+        self.recent_wait_times = deque(maxlen=window)
+    
+    def retry_after(self) -> float:
+        """Seconds until the queue has likely drained enough to admit a new request."""
+        backlog = self.queued + max(0, self.running - self.max_concurrency + 1)
+        return max(1.0, backlog * self._service_time / self.max_concurrency)
+    
+    async def acquire(self, user_id: str, priority: TaskPriority = TaskPriority.MEDIUM,
+                      deadline: Optional[float] = None) -> Ticket:
+        """Wait for an inference slot, raising ``AdmissionRejected`` if none can be had."""
+        ticket = Ticket(user_id, priority, deadline)
+        if deadline is not None and deadline <= ticket.enqueued_at:
+            self._reject("deadline", 504, "Request deadline already passed")
+        if self._per_user.get(user_id, 0) >= self.max_per_user:
+            self._reject("user_limit", 429, "Too many concurrent requests for this user", self.retry_after())
+        
+        if self.running < self.max_concurrency and self.queued == 0:
+            self._start(ticket)
+            return ticket
+        
+        if self.queued >= self.max_queue and not self._shed_for(priority):
+            self._reject("queue_full", 503, "Inference queue is full", self.retry_after())
+        
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._lanes[priority].setdefault(user_id, deque()).append(ticket)
+        self.queued += 1
+        self._per_user[user_id] += 1
+        
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not ticket.future.done():
+                self._dequeue(ticket)
+            elif ticket.future.exception() is None:
+                # The slot was granted just as the wait ended
+                self.release(ticket)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            if ticket.future.done() and ticket.future.exception() is not None:
+                raise ticket.future.exception()
+            self.expired += 1
+            raise AdmissionRejected(504, "Request deadline passed while queued")
+        
+        ticket.future.result()
+        return ticket
+    
+    def release(self, ticket: Ticket):
+        """Free the slot of a finished request and admit the next one in line."""
+        self.running -= 1
+        self._forget(ticket.user_id)
+        if ticket.started_at is not None:
+            elapsed = time.monotonic() - ticket.started_at
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+        self._dispatch()
+    
+    @asynccontextmanager
+    async def admit(self, user_id: str, priority: TaskPriority = TaskPriority.MEDIUM,
+                    deadline: Optional[float] = None):
+        """Hold an inference slot for the duration of a block."""
+        ticket = await self.acquire(user_id, priority, deadline)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+    
+    def _reject(self, reason: str, status_code: int, detail: str, retry_after: Optional[float] = None):
+        """Count and raise a rejection."""
+        self.rejected[reason] += 1
+        raise AdmissionRejected(status_code, detail, retry_after)
+    
+    def _start(self, ticket: Ticket):
+        """Give a ticket a running slot."""
+        if ticket.future is None:
+            # Admitted without queueing
+            self._per_user[ticket.user_id] += 1
+        ticket.started_at = time.monotonic()
+        self.running += 1
+        self.admitted += 1
+        self.recent_wait_times.append(ticket.started_at - ticket.enqueued_at)
+    
+    def _dequeue(self, ticket: Ticket):
+        """Remove a waiting ticket from its lane."""
+        lane = self._lanes[ticket.priority]
+        queue = lane.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del lane[ticket.user_id]
+        self.queued -= 1
+        self._forget(ticket.user_id)
+    
+    def _forget(self, user_id: str):
+        """Drop one request from a user's in-flight count."""
+        self._per_user[user_id] -= 1
+        if self._per_user[user_id] <= 0:
+            del self._per_user[user_id]
+    
+    def _pop_next(self) -> Optional[Ticket]:
+        """Take the next ticket: highest priority first, users in turn within a lane."""
+        for priority in sorted(self._lanes, reverse=True):
+            lane = self._lanes[priority]
+            if not lane:
+                continue
+            user_id, queue = next(iter(lane.items()))
+            ticket = queue.popleft()
+            # The user goes to the back of the lane
+            del lane[user_id]
+            if queue:
+                lane[user_id] = queue
+            self.queued -= 1
+            return ticket
+        return None
+    
+    def _dispatch(self):
+        """Admit queued requests while slots are free, dropping expired ones."""
+        now = time.monotonic()
+        while self.running < self.max_concurrency:
+            ticket = self._pop_next()
+            if ticket is None:
+                return
+            if ticket.deadline is not None and ticket.deadline <= now:
+                self._forget(ticket.user_id)
+                self.expired += 1
+                ticket.future.set_exception(AdmissionRejected(504, "Request deadline passed while queued"))
+                continue
+            self._start(ticket)
+            ticket.future.set_result(True)
+    
+    def _shed_for(self, priority: TaskPriority) -> bool:
+        """Make room in a full queue by dropping the newest request of a lower priority."""
+        for lower in sorted(self._lanes):
+            if lower >= priority:
+                return False
+            lane = self._lanes[lower]
+            if not lane:
+                continue
+            # The most recently served user is at the back of the lane
+            queue = lane[next(reversed(lane))]
+            victim = queue[-1]
+            self._dequeue(victim)
+            self.rejected["shed"] += 1
+            victim.future.set_exception(
+                AdmissionRejected(503, "Shed for a higher priority request", self.retry_after())
+            )
+            return True
+        return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics."""
+        recent = sorted(self.recent_wait_times)
+        
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(p * len(recent)))] * 1000
+        
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queued_by_priority": {
+                priority.name.lower(): sum(len(queue) for queue in lane.values())
+                for priority, lane in self._lanes.items()
+            },
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "expired": self.expired,
+            "mean_service_time_ms": self._service_time * 1000,
+            "queue_wait_ms": {"p50": percentile(0.50), "p99": percentile(0.99)},
+        }
@@ -0,0 +1,175 @@
+"""Semantic response cache for the Omnia AI platform.
+
+Prompts that differ only trivially ("What is AI?" / "what is AI") get the
+same answer. The cache embeds each prompt and returns the stored response of
+the most similar earlier prompt when their cosine similarity reaches
+``SEMANTIC_CACHE_THRESHOLD``, without running the language model.
+
+It is enabled per route through ``SEMANTIC_CACHE_ROUTES``, a comma-separated
+list such as ``generate,chat`` (empty by default, which disables it).
+Entries are only matched within the same scope (model, length limit,
+decoding parameters and, for chat, the earlier messages).
+"""
+from typing import Dict, List, Any, Optional, Hashable
+import logging
+import os
+import time
+import numpy as np
+from .similarity import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+# Upper edges of the similarity histogram buckets
+SIMILARITY_BUCKETS = (0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+
+
+class SemanticCache:
+    """Bounded in-memory index of prompt embeddings and their responses.
+    
+    Embeddings are kept in one preallocated matrix, so a lookup is a single
+    matrix-vector product. When the cache is full, expired entries are reused
+    first, then the least recently used one.
+    """
+    
+    def __init__(self, embedding_service, threshold: Optional[float] = None,
+                 max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 routes: Optional[List[str]] = None):
+        """Initialize the semantic cache."""
+        if threshold is None:
+            threshold = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        if max_entries is None:
+            max_entries = int(os.environ.get("SEMANTIC_CACHE_SIZE", "2048"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+        if routes is None:
+            routes = os.environ.get("SEMANTIC_CACHE_ROUTES", "").split(",")
+        
+        self.embedding_service = embedding_service
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.routes = {route.strip() for route in routes if route.strip()}
+        
+        # Slot arrays, allocated once the embedding dimension is known
+        self._vectors: Optional[np.ndarray] = None
+        self._scope_ids = np.full(max_entries, -1, dtype=np.int64)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._responses: List[Optional[str]] = [None] * max_entries
+        self._size = 0
+        self._model_id: Optional[str] = None
+        
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.histogram = [0] * len(SIMILARITY_BUCKETS)
+    
+    def enabled_for(self, route: str) -> bool:
+        """Whether the cache is enabled for a route."""
+        return route in self.routes
+    
+    @staticmethod
+    def _scope_id(route: str, scope: Hashable) -> int:
+        """Integer identifying a lookup scope; never -1, which marks empty slots."""
+        return hash((route, scope))
+    
+    async def _embed(self, prompt: str) -> Optional[np.ndarray]:
+        """Unit-length embedding of a prompt.
+        
+        Vectors of different embedding models cannot be compared, so the
+        cache is cleared when the embedding model changes.
+        """
+        if self._model_id != self.embedding_service.default_model_id:
+            self.clear()
+            self._model_id = self.embedding_service.default_model_id
+        
+        embeddings = await self.embedding_service.embed([prompt])
+        if embeddings is None:
+            return None
+        return normalize_rows(embeddings)[0]
+    
+    def _record_similarity(self, similarity: float):
+        """Add the best similarity of a lookup to the histogram."""
+        for i, edge in enumerate(SIMILARITY_BUCKETS):
+            if similarity <= edge or i == len(SIMILARITY_BUCKETS) - 1:
+                self.histogram[i] += 1
+                return
+    
+    async def lookup(self, route: str, prompt: str, scope: Hashable) -> Optional[str]:
+        """Get the response of the most similar cached prompt, if similar enough."""
+        if not self.enabled_for(route):
+            return None
+        
+        self.lookups += 1
+        vector = await self._embed(prompt)
+        if vector is None or self._vectors is None or self._size == 0:
+            return None
+        
+        n = self._size
+        scores = self._vectors[:n] @ vector
+        valid = (self._scope_ids[:n] == self._scope_id(route, scope)) & (self._expires_at[:n] > time.monotonic())
+        if not valid.any():
+            return None
+        
+        scores = np.where(valid, scores, -np.inf)
+        best = int(np.argmax(scores))
+        self._record_similarity(float(scores[best]))
+        if scores[best] < self.threshold:
+            return None
+        
+        self.hits += 1
+        self._last_used[best] = time.monotonic()
+        return self._responses[best]
+    
+    async def store(self, route: str, prompt: str, scope: Hashable, response: str):
+        """Cache the response to a prompt."""
+        if not self.enabled_for(route):
+            return
+        
+        vector = await self._embed(prompt)
+        if vector is None:
+            return
+        
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._size = 0
+        
+        now = time.monotonic()
+        if self._size < self.max_entries:
+            slot = self._size
+            self._size += 1
+        else:
+            # Prefer an expired slot, otherwise evict the least recently used entry
+            expired = np.flatnonzero(self._expires_at <= now)
+            slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+            self.evictions += 1
+        
+        self._vectors[slot] = vector
+        self._scope_ids[slot] = self._scope_id(route, scope)
+        self._expires_at[slot] = now + self.ttl_seconds
+        self._last_used[slot] = now
+        self._responses[slot] = response
+    
+    def clear(self):
+        """Drop every cached entry."""
+        self._size = 0
+        self._scope_ids[:] = -1
+        self._responses = [None] * self.max_entries
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get semantic cache statistics."""
+        lower_edges = (-1.0,) + SIMILARITY_BUCKETS[:-1]
+        return {
+            "routes": sorted(self.routes),
+            "threshold": self.threshold,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "evictions": self.evictions,
+            "best_similarity_histogram": {
+                f"{low:.2f}-{high:.2f}": count
+                for low, high, count in zip(lower_edges, SIMILARITY_BUCKETS, self.histogram)
+            },
+        }
@@ -0,0 +1,160 @@
+"""Conversation session cache for the Omnia AI platform.
+
+Multi-turn conversations resend the whole transcript on every turn. A
+session remembers, per conversation id, the token ids of the transcript so
+far and the model's past key/values for them, so the next turn only has to
+tokenize and run the model over the newly added text.
+"""
+from typing import Dict, List, Any, Optional, Iterator
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _kv_tensors(past_key_values) -> Iterator[Any]:
+    """Iterate over the key and value tensors of a cache."""
+    if past_key_values is None:
+        return
+    if hasattr(past_key_values, "layers"):
+        for layer in past_key_values.layers:
+            for tensor in (getattr(layer, "keys", None), getattr(layer, "values", None)):
+                if tensor is not None:
+                    yield tensor
+    elif hasattr(past_key_values, "key_cache"):
+        yield from past_key_values.key_cache
+        yield from past_key_values.value_cache
+    else:
+        for layer in past_key_values:
+            yield from layer
+
+
+def kv_cache_nbytes(past_key_values) -> int:
+    """Memory held by the tensors of a key/value cache."""
+    return sum(tensor.numel() * tensor.element_size() for tensor in _kv_tensors(past_key_values))
+
+
+def kv_cache_length(past_key_values) -> int:
+    """Number of tokens covered by a key/value cache."""
+    if past_key_values is None:
+        return 0
+    if hasattr(past_key_values, "get_seq_length"):
+        return int(past_key_values.get_seq_length())
+    return int(past_key_values[0][0].shape[-2])
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    """Length of the longest common prefix of two token sequences."""
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class ConversationSession:
+    """Cached state of one conversation."""
+    
+    def __init__(self, conversation_id: str, model_id: str):
+        """Initialize the conversation session."""
+        self.conversation_id = conversation_id
+        self.model_id = model_id
+        # Transcript text seen so far and its token ids
+        self.text = ""
+        self.text_ids: List[int] = []
+        # Token ids covered by past_key_values
+        self.cache_ids: List[int] = []
+        self.past_key_values = None
+        self.size_bytes = 0
+        self.last_used = time.monotonic()
+
+
+class SessionCache:
+    """LRU cache of conversation sessions bounded by count, age and memory."""
+    
+    def __init__(self, max_sessions: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 max_memory_mb: Optional[float] = None):
+        """Initialize the session cache."""
+        if max_sessions is None:
+            max_sessions = int(os.environ.get("SESSION_CACHE_MAX_SESSIONS", "256"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "1800"))
+        if max_memory_mb is None:
+            max_memory_mb = float(os.environ.get("SESSION_CACHE_MEMORY_MB", "512"))
+        
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.reused_tokens = 0
+        self.computed_tokens = 0
+    
+    @property
+    def memory_bytes(self) -> int:
+        """Memory held by cached sessions."""
+        return sum(session.size_bytes for session in self.sessions.values())
+    
+    def _expire(self):
+        """Drop sessions idle for longer than the TTL."""
+        now = time.monotonic()
+        for conversation_id in list(self.sessions):
+            if now - self.sessions[conversation_id].last_used <= self.ttl_seconds:
+                break
+            del self.sessions[conversation_id]
+            self.expirations += 1
+    
+    def take(self, conversation_id: str, model_id: str) -> ConversationSession:
+        """Check out the session of a conversation, starting a new one on a miss.
+        
+        The session leaves the cache while a turn is generated, so concurrent
+        turns of the same conversation never share a key/value cache.
+        """
+        self._expire()
+        session = self.sessions.pop(conversation_id, None)
+        if session is not None and session.model_id == model_id:
+            self.hits += 1
+            return session
+        
+        self.misses += 1
+        return ConversationSession(conversation_id, model_id)
+    
+    def put(self, session: ConversationSession):
+        """Return a session to the cache after a turn."""
+        session.size_bytes = kv_cache_nbytes(session.past_key_values)
+        session.last_used = time.monotonic()
+        self.sessions[session.conversation_id] = session
+        self.sessions.move_to_end(session.conversation_id)
+        
+        while self.sessions and (len(self.sessions) > self.max_sessions
+                                 or self.memory_bytes > self.max_memory_bytes):
+            conversation_id, _ = self.sessions.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"Evicted conversation session {conversation_id}")
+    
+    def record_turn(self, reused_tokens: int, computed_tokens: int):
+        """Account for the prompt tokens of a turn."""
+        self.reused_tokens += reused_tokens
+        self.computed_tokens += computed_tokens
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get session cache statistics."""
+        prompt_tokens = self.reused_tokens + self.computed_tokens
+        return {
+            "sessions": len(self.sessions),
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "reused_prompt_tokens": self.reused_tokens,
+            "computed_prompt_tokens": self.computed_tokens,
+            "prompt_reuse_rate": self.reused_tokens / prompt_tokens if prompt_tokens else 0.0,
+        }
@@ -0,0 +1,59 @@
+"""Vectorized similarity search for the Omnia AI platform."""
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length; all-zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_scores(queries: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every query against every candidate, shape (queries, candidates)."""
+    return normalize_rows(queries) @ normalize_rows(candidates).T
+
+
+def quantized_scores(queries: np.ndarray, codes: np.ndarray, scales: Optional[np.ndarray] = None,
+                     block_size: int = 65536) -> np.ndarray:
+    """Dot products of float32 queries with float32, float16 or int8 rows, shape (queries, rows).
+    
+    Rows are widened to float32 one block at a time, so the full-precision
+    matrix never exists. The per-row scale of int8 rows factors out of the
+    dot product and is applied to the scores instead of the rows.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), block_size):
+        block = np.asarray(codes[start:start + block_size])
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        scores[:, start:start + len(block)] = queries @ block.T
+    if scales is not None:
+        scores *= np.asarray(scales, dtype=np.float32)
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and scores of the ``k`` best candidates per query row, best first.
+    
+    Uses ``argpartition`` so only the selected ``k`` scores are sorted.
+    """
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(scores.dtype)
+    
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_scores, order, axis=1)
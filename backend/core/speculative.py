@@ -0,0 +1,186 @@
+"""Speculative decoding for the Omnia AI platform.
+
+On CPU, generating a token costs about as much as reading all the model's
+weights once, whether it scores one position or several. A small draft model
+therefore proposes ``k`` tokens cheaply and the main model scores all of
+them in a single forward pass. Each proposal ``x`` is accepted with
+probability ``min(1, p(x) / q(x))``, where ``p`` and ``q`` are the main and
+draft model distributions; the first rejected one is replaced by a sample
+from ``max(0, p - q)``. The output follows exactly the main model's
+(temperature and top_p adjusted) distribution, while the main model runs
+once per accepted run of tokens instead of once per token.
+"""
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _probabilities(logits, params: Dict[str, Any]):
+    """Next-token distribution after temperature and top_p; one-hot for greedy decoding."""
+    import torch
+    
+    if not params.get("do_sample", True):
+        return torch.nn.functional.one_hot(torch.argmax(logits), logits.shape[-1]).float()
+    
+    probs = torch.softmax(logits.float() / max(params.get("temperature", 0.7), 1e-5), dim=-1)
+    top_p = params.get("top_p", 0.9)
+    if top_p < 1.0:
+        sorted_probs, sorted_ids = torch.sort(probs, descending=True)
+        # Keep the smallest set of tokens whose probability reaches top_p
+        remove = torch.cumsum(sorted_probs, dim=-1) - sorted_probs >= top_p
+        probs = probs.scatter(-1, sorted_ids, sorted_probs.masked_fill(remove, 0.0))
+        probs = probs / probs.sum()
+    return probs
+
+
+class SpeculativeDecoder:
+    """Generate with a main model verifying tokens proposed by its draft model."""
+    
+    def __init__(self, model_loader, num_draft_tokens: Optional[int] = None):
+        """Initialize the speculative decoder."""
+        if num_draft_tokens is None:
+            num_draft_tokens = int(os.environ.get("SPECULATIVE_DRAFT_TOKENS", "4"))
+        
+        self.model_loader = model_loader
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        
+        self.requests = 0
+        self.fallback_requests = 0
+        self.target_forwards = 0
+        self.proposed_tokens = 0
+        self.accepted_tokens = 0
+        self.tokens_generated = 0
+    
+    async def generate(self, model_id: str, prompt: str, max_length: int = 100,
+                       params: Optional[Dict[str, Any]] = None,
+                       max_new_tokens: Optional[int] = None) -> Optional[str]:
+        """Generate text for a prompt, falling back to normal generation without a usable draft model."""
+        self.requests += 1
+        params = params or {"do_sample": True}
+        draft_model_id = self.model_loader.get_draft_model(model_id)
+        
+        loaded = await self.model_loader.ensure_loaded(model_id)
+        if loaded and draft_model_id is not None:
+            # The draft model is loaded on first use; later requests only reload it if evicted
+            if draft_model_id in self.model_loader.known_models:
+                loaded = await self.model_loader.ensure_loaded(draft_model_id)
+            else:
+                loaded = await self.model_loader.load_model(draft_model_id, model_type="causal_lm")
+        models = [self.model_loader.models.get(model_id), self.model_loader.models.get(draft_model_id)]
+        if not loaded or not all(hasattr(model, "forward") for model in models):
+            self.fallback_requests += 1
+            return await self.model_loader.generate_text(model_id, prompt, max_length, params, max_new_tokens)
+        
+        try:
+            text, stats = await self.model_loader.executor.run(
+                model_id, self._generate_sync, models[0], models[1],
+                self.model_loader.tokenizers[model_id], prompt, max_length, params, max_new_tokens
+            )
+        except Exception as e:
+            logger.exception(f"Error generating text with model {model_id}: {e}")
+            return None
+        
+        self.target_forwards += stats["target_forwards"]
+        self.proposed_tokens += stats["proposed"]
+        self.accepted_tokens += stats["accepted"]
+        self.tokens_generated += stats["generated"]
+        return text
+    
+    def _generate_sync(self, target, draft, tokenizer, prompt: str, max_length: int,
+                       params: Dict[str, Any], max_new_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+        """Run speculative decoding; blocks, so it is called on the inference executor."""
+        import torch
+        from transformers import DynamicCache
+        
+        eos_token_id = getattr(tokenizer, "eos_token_id", None)
+        ids: List[int] = list(tokenizer.encode(prompt))
+        if max_new_tokens is None:
+            max_new_tokens = max(1, max_length - len(ids))
+        if not ids:
+            # The models need at least one token to predict from
+            ids = [getattr(tokenizer, "bos_token_id", None) or eos_token_id or 0]
+        stats = {"target_forwards": 0, "proposed": 0, "accepted": 0, "generated": 0}
+        
+        # Each cache covers ids[:length]; the tokens after it are fed on the next call
+        caches = {"target": [DynamicCache(), 0], "draft": [DynamicCache(), 0]}
+        
+        def forward(name: str, model, tokens: List[int]):
+            cache = caches[name]
+            new_tokens = ids[cache[1]:] + tokens
+            output = model(input_ids=torch.tensor([new_tokens]), past_key_values=cache[0], use_cache=True)
+            cache[0] = output.past_key_values
+            cache[1] += len(new_tokens)
+            return output.logits[0, -len(new_tokens):]
+        
+        def crop(name: str, length: int):
+            cache = caches[name]
+            if cache[1] > length:
+                cache[0].crop(length)
+                cache[1] = length
+        
+        with torch.no_grad():
+            generated = 0
+            while generated < max_new_tokens:
+                k = min(self.num_draft_tokens, max_new_tokens - generated)
+                
+                # The draft model proposes k tokens one at a time
+                proposals, draft_probs = [], []
+                for _ in range(k):
+                    q = _probabilities(forward("draft", draft, proposals[-1:])[-1], params)
+                    proposals.append(int(torch.multinomial(q, 1)))
+                    draft_probs.append(q)
+                
+                # The main model scores every proposal, plus one more position, at once
+                logits = forward("target", target, proposals)[-(k + 1):]
+                stats["target_forwards"] += 1
+                stats["proposed"] += k
+                
+                new_tokens = []
+                for i, token in enumerate(proposals):
+                    p = _probabilities(logits[i], params)
+                    q = draft_probs[i]
+                    if torch.rand(()) < torch.clamp(p[token] / q[token], max=1.0):
+                        new_tokens.append(token)
+                        continue
+                    # Rejected: resample from where the main model puts more mass than the draft
+                    residual = torch.clamp(p - q, min=0.0)
+                    residual = residual / residual.sum() if residual.sum() > 0 else p
+                    new_tokens.append(int(torch.multinomial(residual, 1)))
+                    break
+                else:
+                    # Every proposal accepted: the extra position gives one more token for free
+                    new_tokens.append(int(torch.multinomial(_probabilities(logits[k], params), 1)))
+                stats["accepted"] += len(new_tokens) - 1
+                
+                # Drop cache entries of proposals that did not survive
+                accepted_length = len(ids) + len(new_tokens) - 1
+                crop("target", accepted_length)
+                crop("draft", accepted_length)
+                
+                if eos_token_id in new_tokens:
+                    new_tokens = new_tokens[:new_tokens.index(eos_token_id) + 1]
+                new_tokens = new_tokens[:max_new_tokens - generated]
+                ids.extend(new_tokens)
+                generated += len(new_tokens)
+                if new_tokens and new_tokens[-1] == eos_token_id:
+                    break
+        
+        stats["generated"] = generated
+        return tokenizer.decode(ids, skip_special_tokens=True), stats
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get speculative decoding statistics."""
+        return {
+            "num_draft_tokens": self.num_draft_tokens,
+            "draft_models": dict(self.model_loader.draft_models),
+            "requests": self.requests,
+            "fallback_requests": self.fallback_requests,
+            "proposed_tokens": self.proposed_tokens,
+            "accepted_tokens": self.accepted_tokens,
+            "acceptance_rate": self.accepted_tokens / self.proposed_tokens if self.proposed_tokens else 0.0,
+            "tokens_per_target_forward": (
+                self.tokens_generated / self.target_forwards if self.target_forwards else 0.0
+            ),
+        }
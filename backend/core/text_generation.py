@@ -1,8 +1,16 @@
 """Text generation utilities for the Omnia AI platform."""
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator
 import logging
 import asyncio
-from .model_loader import ModelLoader
+import threading
+import os
+from .model_loader import ModelLoader, generation_params
+from .batching import GenerationBatcher
+from .continuous_batching import ContinuousBatcher
+from .speculative import SpeculativeDecoder
+from .session_cache import SessionCache
+from .prompt_builder import PromptBuilder
+from .generation_cache import GenerationCache, create_generation_cache
 
 logger = logging.getLogger(__name__)
 
@@ -10,41 +18,135 @@ logger = logging.getLogger(__name__)
 class TextGenerationService:
     """Service for text generation."""
     
-    def __init__(self):
+    def __init__(self, result_cache: Optional[GenerationCache] = None):
         """Initialize the text generation service."""
         self.model_loader = ModelLoader()
         self.default_model_id = "gpt2"  # In a real implementation, use a more powerful model
+        if os.environ.get("GENERATION_SCHEDULER", "static") == "continuous":
+            self.batcher = ContinuousBatcher(self.model_loader)
+        else:
+            self.batcher = GenerationBatcher(self.model_loader)
+        self.sessions = SessionCache()
+        self.prompt_builder = PromptBuilder()
+        self.result_cache = result_cache or create_generation_cache()
+        
+        # Speculative decoding, used per request or by default with SPECULATIVE_DECODING=1
+        self.speculative = SpeculativeDecoder(self.model_loader)
+        self.speculative_by_default = os.environ.get("SPECULATIVE_DECODING", "0") == "1"
+        draft_model_id = os.environ.get("SPECULATIVE_DRAFT_MODEL", "distilgpt2")
+        if draft_model_id:
+            self.model_loader.register_draft_model(self.default_model_id, draft_model_id)
     
     async def initialize(self):
         """Initialize the text generation service."""
+        self.model_loader.pin(self.default_model_id)
         await self.model_loader.load_model(self.default_model_id, model_type="causal_lm")
     
-    async def generate_text(self, prompt: str, max_length: int = 100) -> Optional[str]:
-        """Generate text from a prompt."""
-        return await self.model_loader.generate_text(self.default_model_id, prompt, max_length)
+    async def generate_text(self, prompt: str, max_length: int = 100, temperature: float = 0.7,
+                            top_p: float = 0.9, do_sample: Optional[bool] = None,
+                            speculative: Optional[bool] = None,
+                            max_new_tokens: Optional[int] = None) -> Optional[str]:
+        """Generate text from a prompt.
+        
+        ``max_length`` counts the prompt tokens; ``max_new_tokens``, when
+        given, limits the generated tokens instead. Greedy requests (``temperature=0`` or ``do_sample=False``) are served
+        from the result cache when one is configured. With ``speculative``
+        the model's draft model proposes tokens for it to verify, which
+        gives the same output distribution with fewer full-model passes.
+        """
+        params = generation_params(temperature, top_p, do_sample)
+        cache_params = params
+        if max_new_tokens is not None:
+            max_length = None
+            cache_params = dict(params, max_new_tokens=max_new_tokens)
+        cached = await self.result_cache.get(self.default_model_id, prompt, max_length, cache_params)
+        if cached is not None:
+            return cached
+        
+        if speculative is None:
+            speculative = self.speculative_by_default
+        if speculative and self.model_loader.get_draft_model(self.default_model_id):
+            text = await self.speculative.generate(
+                self.default_model_id, prompt, max_length, params, max_new_tokens
+            )
+        else:
+            text = await self.batcher.generate(
+                self.default_model_id, prompt, max_length, params, max_new_tokens
+            )
+        if text is not None:
+            await self.result_cache.put(self.default_model_id, prompt, max_length, cache_params, text)
+        return text
+    
+    def stream_text(self, prompt: str, max_length: int = 100,
+                    cancel_event: Optional[threading.Event] = None,
+                    temperature: float = 0.7, top_p: float = 0.9,
+                    do_sample: Optional[bool] = None) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding it incrementally."""
+        return self.model_loader.stream_text(
+            self.default_model_id, prompt, max_length, cancel_event,
+            generation_params(temperature, top_p, do_sample)
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get generation statistics."""
+        return {
+            "batching": self.batcher.get_stats(),
+            "sessions": self.sessions.get_stats(),
+            "prompts": self.prompt_builder.get_stats(),
+            "result_cache": self.result_cache.get_stats(),
+            "speculative": self.speculative.get_stats(),
+        }
     
     async def generate_response(self, messages: List[Dict[str, str]], 
-                               max_length: int = 100) -> Optional[str]:
-        """Generate a response to a conversation."""
-        # Format messages as a conversation prompt
-        prompt = ""
-        for message in messages:
-            role = message.get("role", "user")
-            content = message.get("content", "")
-            
-            if role == "user":
-                prompt += f"User: {content}\n"
-            elif role == "assistant":
-                prompt += f"Assistant: {content}\n"
-            elif role == "system":
-                prompt += f"System: {content}\n"
-            else:
-                prompt += f"{role}: {content}\n"
-        
-        prompt += "Assistant: "
+                               max_length: int = 100,
+                               conversation_id: Optional[str] = None,
+                               temperature: float = 0.7, top_p: float = 0.9,
+                               do_sample: Optional[bool] = None) -> Optional[str]:
+        """Generate a response to a conversation.
+        
+        Returns the assistant's reply alone, without the transcript. The transcript is truncated to fit the model's context window with
+        ``max_length`` tokens left for the reply; raises ``ValueError`` when
+        ``max_length`` leaves no room for the prompt. With a ``conversation_id``
+        the model's key/values for the transcript are kept between turns, so
+        each turn only processes the new messages.
+        """
+        if not await self.model_loader.ensure_loaded(self.default_model_id):
+            logger.error(f"Model {self.default_model_id} not loaded")
+            return None
+        
+        prompt, _ = self.prompt_builder.build(
+            messages,
+            self.model_loader.tokenizers[self.default_model_id],
+            self.model_loader.get_context_length(self.default_model_id),
+            max_length,
+        )
+        
+        if conversation_id is not None:
+            session = self.sessions.take(conversation_id, self.default_model_id)
+            result = await self.model_loader.generate_with_session(
+                self.default_model_id, prompt, max_length, session,
+                generation_params(temperature, top_p, do_sample)
+            )
+            self.sessions.put(session)
+            if result is None:
+                return None
+            self.sessions.record_turn(result["reused_tokens"], result["computed_tokens"])
+            return result["text"]
         
         # Generate response
-        response = await self.generate_text(prompt, max_length)
+        response = await self.generate_text(
+            prompt, temperature=temperature, top_p=top_p, do_sample=do_sample,
+            max_new_tokens=max_length
+        )
+        if response is None:
+            return None
+        
+        # generate_text returns the prompt with its continuation; strip the
+        # prompt as the tokenizer decodes it, like the session path does
+        tokenizer = self.model_loader.tokenizers[self.default_model_id]
+        echoed = tokenizer.decode(tokenizer.encode(prompt), skip_special_tokens=True)
+        if response.startswith(echoed):
+            response = response[len(echoed):]
         
         # In a real implementation, post-process the response to ensure it's well-formed
         
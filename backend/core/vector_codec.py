@@ -0,0 +1,122 @@
+"""Compact vector storage for the Omnia AI platform.
+
+A ``VectorCodec`` turns unit-length float32 embeddings into the form they
+are stored in:
+
+* dimension reduction to ``dim`` components, by keeping the leading
+  components (``truncate``, for models trained to front-load information) or
+  by projecting onto the principal components of a sample (``pca``);
+* storage at ``float32``, ``float16``, or scalar ``int8`` with one float32
+  scale per vector.
+
+Reduced vectors are renormalized, so dot products of stored vectors remain
+cosine similarities. ``scores`` compares queries with stored vectors without
+decoding them first.
+"""
+from typing import Dict, Any, Optional, Tuple
+import logging
+import numpy as np
+from .precision import quantize_int8, dequantize_int8
+from .similarity import normalize_rows, quantized_scores
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+REDUCTIONS = ("truncate", "pca")
+
+
+class VectorCodec:
+    """Dimension reduction and quantization of embeddings."""
+    
+    def __init__(self, precision: str = "float32", dim: Optional[int] = None,
+                 reduction: str = "truncate"):
+        """Initialize the codec."""
+        if precision not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported vector precision: {precision}")
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unsupported dimension reduction: {reduction}")
+        
+        self.precision = precision
+        self.dim = dim or None
+        self.reduction = reduction
+        # Principal components, fitted by ``fit``
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+    
+    @property
+    def dtype(self) -> np.dtype:
+        """NumPy type of stored vectors."""
+        return np.dtype(STORAGE_DTYPES[self.precision])
+    
+    @property
+    def fitted(self) -> bool:
+        """Whether ``reduce`` is ready; only PCA needs a sample first."""
+        return self.dim is None or self.reduction != "pca" or self.components is not None
+    
+    def output_dim(self, input_dim: int) -> int:
+        """Dimension of stored vectors for inputs of ``input_dim``."""
+        return min(self.dim, input_dim) if self.dim else input_dim
+    
+    def bytes_per_vector(self, dim: int) -> int:
+        """Storage size of one stored vector of ``dim`` components, including its scale."""
+        scale_bytes = 4 if self.precision == "int8" else 0
+        return dim * self.dtype.itemsize + scale_bytes
+    
+    def fit(self, sample: np.ndarray):
+        """Fit the principal components of a sample of unit vectors."""
+        if self.reduction != "pca" or not self.dim:
+            return
+        
+        sample = np.asarray(sample, dtype=np.float32)
+        self.mean = sample.mean(axis=0)
+        # Rows of vt are the principal directions, strongest first
+        _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.dim], dtype=np.float32)
+        if len(self.components) < self.dim:
+            logger.warning(f"PCA sample of {len(sample)} vectors only yields {len(self.components)} components")
+            self.dim = len(self.components)
+    
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """Reduce unit vectors to the stored dimension and renormalize them."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if not self.dim or vectors.shape[1] <= self.dim:
+            return vectors
+        if self.reduction == "pca":
+            if self.components is None:
+                raise ValueError("PCA reduction used before fitting")
+            return normalize_rows((vectors - self.mean) @ self.components.T)
+        return normalize_rows(vectors[:, :self.dim])
+    
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Stored form of already reduced vectors: codes and, for int8, scales."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.precision == "int8":
+            return quantize_int8(vectors)
+        return np.ascontiguousarray(vectors, dtype=self.dtype), None
+    
+    def decode(self, codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        """Float32 vectors from their stored form."""
+        if scales is not None:
+            return dequantize_int8(np.asarray(codes), scales)
+        return np.asarray(codes, dtype=np.float32)
+    
+    def scores(self, queries: np.ndarray, codes: np.ndarray,
+               scales: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity of reduced queries with stored vectors, shape (queries, rows)."""
+        return quantized_scores(queries, codes, scales)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Settings of the codec, for index metadata."""
+        return {"precision": self.precision, "reduced_dim": self.dim, "reduction": self.reduction}
+    
+    def save(self, path: str):
+        """Write the fitted principal components."""
+        if self.components is not None:
+            with open(path, "wb") as f:
+                np.savez(f, mean=self.mean, components=self.components)
+    
+    def load(self, path: str):
+        """Read principal components written by ``save``."""
+        with np.load(path) as data:
+            self.mean = data["mean"]
+            self.components = data["components"]
@@ -0,0 +1,52 @@
+"""Gunicorn configuration for running the Omnia AI platform with several workers.
+
+Launch from the backend directory with::
+
+    gunicorn -c gunicorn.conf.py server:app
+
+The app and its models are loaded once in the master process before the
+workers are forked, so all workers share the model weights copy-on-write
+instead of each holding its own copy. Each worker still serves HTTP on its
+own event loop, and its inference thread pool is created after the fork.
+
+Settings (environment variables):
+
+- ``WEB_CONCURRENCY``: number of workers (default 2)
+- ``PORT``: port to bind on all interfaces (default 8001)
+- ``PRELOAD_MODELS``: load the default models in the master (default 1);
+  set to 0 to have every worker load its own copy at startup
+"""
+import asyncio
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8001')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = True
+
+# Collections in the master would leave freed holes in pages the workers
+# share; collection is frozen before forking and re-enabled in each worker
+gc.disable()
+
+
+def when_ready(server):
+    """Load the default models in the master, before any worker is forked."""
+    if os.environ.get("PRELOAD_MODELS", "1") != "1":
+        gc.enable()
+        return
+
+    import server as app_module
+
+    asyncio.run(app_module.warm_up_services())
+    server.log.info(f"Preloaded models: {app_module.model_loader.get_load_states()}")
+
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers never write to the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Re-enable garbage collection in the worker."""
+    gc.enable()
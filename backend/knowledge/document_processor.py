@@ -1,14 +1,58 @@
 """Document processor for the Omnia AI platform."""
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Union, AsyncIterable, AsyncIterator
 import logging
 import asyncio
+import codecs
 from datetime import datetime
 import os
-import json
 import uuid
+from .document_stats import DocumentStats
+from .json_stream import is_json, iter_records
 
 logger = logging.getLogger(__name__)
 
+# Read size for documents streamed from disk
+READ_SIZE = 1024 * 1024
+
+
+def _split_chunks(text: str, limit: int, final: bool = False) -> Tuple[List[str], str]:
+    """Cut text into chunks of at most ``limit`` characters, ending after a line break or space if possible.
+    
+    Returns the chunks and the unfinished remainder, which is empty when ``final``.
+    """
+    chunks = []
+    start = 0
+    while len(text) - start >= limit or (final and start < len(text)):
+        end = min(start + limit, len(text))
+        if end < len(text):
+            for separator in ("\n", " "):
+                position = text.rfind(separator, start, end)
+                # Only split at a separator in the second half, so chunks stay reasonably full
+                if position >= start + limit // 2:
+                    end = position + 1
+                    break
+        chunks.append(text[start:end])
+        start = end
+    return chunks, text[start:]
+
+
+async def _iter_once(data: bytes) -> AsyncIterator[bytes]:
+    """A document held in memory as a byte stream."""
+    yield data
+
+
+async def _iter_text(source: AsyncIterable[bytes], mime_type: str) -> AsyncIterator[str]:
+    """Text of a byte stream, decoded incrementally, or the records of a JSON document."""
+    if is_json(mime_type):
+        async for record in iter_records(source, mime_type):
+            yield record + "\n"
+        return
+    
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for data in source:
+        yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
 
 class DocumentProcessor:
     """Process and understand documents."""
@@ -21,27 +65,76 @@ class DocumentProcessor:
         
         if mime_type == "text/plain":
             return document_data.decode("utf-8")
-        elif mime_type == "application/json":
-            return json.dumps(json.loads(document_data.decode("utf-8")), indent=2)
+        elif is_json(mime_type):
+            # One compact record per line
+            return "\n".join([record async for record in iter_records(_iter_once(document_data), mime_type)])
         else:
             logger.warning(f"Unsupported MIME type: {mime_type}")
             return f"[Document of type {mime_type}, size {len(document_data)} bytes]"
     
     @staticmethod
-    async def understand_document(text: str) -> Dict[str, Any]:
-        """Understand the content of a document."""
+    async def iter_file(path: Union[str, os.PathLike], read_size: int = READ_SIZE) -> AsyncIterator[bytes]:
+        """Read a file block by block without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as f:
+            while True:
+                data = await loop.run_in_executor(None, f.read, read_size)
+                if not data:
+                    return
+                yield data
+    
+    @staticmethod
+    async def iter_text_chunks(source: Union[str, os.PathLike, AsyncIterable[bytes]],
+                               mime_type: str = "text/plain",
+                               chunk_chars: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream the text of a document as chunks of at most ``chunk_chars`` characters.
+        
+        ``source`` is a file path or an async iterator of bytes, such as a
+        request body. Bytes are decoded incrementally, so multi-byte
+        characters split across blocks are handled and memory stays bounded
+        by the chunk and block sizes, whatever the document size. JSON
+        documents are streamed one compact record per chunk, ending with a
+        line break, and a record is only split when it is longer than
+        ``chunk_chars``.
+        """
+        if chunk_chars is None:
+            chunk_chars = int(os.environ.get("DOCUMENT_CHUNK_CHARS", "4096"))
+        if isinstance(source, (str, os.PathLike)):
+            source = DocumentProcessor.iter_file(source)
+        
+        if not (mime_type.startswith("text/") or is_json(mime_type)):
+            logger.warning(f"Unsupported MIME type: {mime_type}")
+            size = 0
+            async for data in source:
+                size += len(data)
+            yield f"[Document of type {mime_type}, size {size} bytes]"
+            return
+        
+        records = is_json(mime_type)
+        pending = ""
+        async for text in _iter_text(source, mime_type):
+            chunks, pending = _split_chunks(pending + text, chunk_chars, final=records)
+            for chunk in chunks:
+                yield chunk
+        
+        chunks, _ = _split_chunks(pending, chunk_chars, final=True)
+        for chunk in chunks:
+            yield chunk
+    
+    @staticmethod
+    async def understand_document(text: Union[str, AsyncIterable[str]]) -> Dict[str, Any]:
+        """Understand the content of a document, given as a string or a stream of text chunks."""
         # In a real implementation, this would use AI models to analyze
         # and understand the document content
         
         # For demonstration, we'll just return some basic stats
-        words = text.split()
-        return {
-            "word_count": len(words),
-            "character_count": len(text),
-            "first_few_words": " ".join(words[:10]) if len(words) > 10 else text,
-            "analysis_id": str(uuid.uuid4()),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        if isinstance(text, str):
+            stats = DocumentStats.analyze(text)
+        else:
+            stats = await DocumentStats.analyze_stream(text)
+        stats["analysis_id"] = str(uuid.uuid4())
+        stats["timestamp"] = datetime.utcnow().isoformat()
+        return stats
     
     @staticmethod
     async def extract_application_instructions(text: str, app_name: str) -> Dict[str, Any]:
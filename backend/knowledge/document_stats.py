@@ -0,0 +1,141 @@
+"""Streaming document statistics for the Omnia AI platform.
+
+``DocumentStats`` reads a text in pieces, such as the chunks of
+``DocumentProcessor.iter_text_chunks``, and keeps only counters:
+
+* words (runs of non-whitespace, as ``str.split`` counts them), characters
+  and lines;
+* a token estimate from ``TOKEN_PATTERN``, where words, single CJK
+  characters and single punctuation marks each count as one token;
+* the most frequent terms, from a Misra-Gries summary of ``max_terms``
+  counters, whose counts are lower bounds of the true counts;
+* a preview of the first words.
+
+Memory depends on the piece size and ``max_terms``, not on the text size.
+"""
+from typing import Dict, List, Any, AsyncIterable, AsyncIterator
+from collections import Counter
+import re
+
+# Words, single CJK characters and single punctuation marks each count as a token
+TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]|[^\W\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+|[^\w\s]")
+WORD_PATTERN = re.compile(r"\S+")
+
+# Common English words left out of the top terms
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with"
+    .split()
+)
+
+PREVIEW_WORDS = 10
+# Longest preview kept, for texts with few but very long words
+PREVIEW_CHARS = 1024
+# Longest unfinished word held back between pieces
+MAX_CARRY_CHARS = 256
+# Piece size when analyzing a whole text
+PIECE_CHARS = 65536
+
+
+def _merge_terms(terms: Dict[str, int], tokens: List[str], max_terms: int) -> Dict[str, int]:
+    """Misra-Gries summary of ``terms`` extended with the terms among ``tokens``."""
+    merged = dict(terms)
+    counts = Counter(
+        token for token in (token.lower() for token in tokens)
+        if token[0].isalnum() and not token.isdigit() and token not in STOP_WORDS
+    )
+    for term, count in counts.items():
+        merged[term] = merged.get(term, 0) + count
+    if len(merged) <= max_terms:
+        return merged
+    # Subtracting the count of the first term beyond capacity leaves at most max_terms counters
+    cutoff = sorted(merged.values(), reverse=True)[max_terms]
+    return {term: count - cutoff for term, count in merged.items() if count > cutoff}
+
+
+class DocumentStats:
+    """Single-pass statistics of a text read in pieces."""
+    
+    def __init__(self, top_terms: int = 10, max_terms: int = 256):
+        """Initialize the counters."""
+        self.top_terms = top_terms
+        self.max_terms = max(max_terms, top_terms)
+        
+        self.words = 0
+        self.characters = 0
+        self.lines = 0
+        self.tokens = 0
+        self.terms: Dict[str, int] = {}
+        self._head = ""
+        # Trailing word of the last piece, tokenized once it is complete
+        self._carry = ""
+        self._last_char = ""
+    
+    def update(self, text: str):
+        """Add the next piece of the text."""
+        if not text:
+            return
+        
+        words_before = self.words
+        self.characters += len(text)
+        self.lines += text.count("\n")
+        self.words += sum(1 for _ in WORD_PATTERN.finditer(text))
+        # A word split across pieces was counted in both
+        if self._last_char and not self._last_char.isspace() and not text[0].isspace():
+            self.words -= 1
+        self._last_char = text[-1]
+        
+        if words_before <= PREVIEW_WORDS and len(self._head) < PREVIEW_CHARS:
+            self._head += text[:PREVIEW_CHARS - len(self._head)]
+        
+        text = self._carry + text
+        end = len(text)
+        while end and not text[end - 1].isspace() and len(text) - end < MAX_CARRY_CHARS:
+            end -= 1
+        self._carry = text[end:]
+        tokens = TOKEN_PATTERN.findall(text[:end])
+        self.tokens += len(tokens)
+        self.terms = _merge_terms(self.terms, tokens, self.max_terms)
+    
+    async def observe(self, texts: AsyncIterable[str]) -> AsyncIterator[str]:
+        """Pass a stream of pieces through, adding each one."""
+        async for text in texts:
+            self.update(text)
+            yield text
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Statistics of the text read so far."""
+        tokens = TOKEN_PATTERN.findall(self._carry)
+        terms = _merge_terms(self.terms, tokens, self.max_terms) if tokens else self.terms
+        
+        if self.words > PREVIEW_WORDS:
+            preview = " ".join(self._head.split()[:PREVIEW_WORDS])
+        else:
+            preview = self._head
+        top: List[Dict[str, Any]] = [
+            {"term": term, "count": count}
+            for term, count in sorted(terms.items(), key=lambda item: (-item[1], item[0]))[:self.top_terms]
+        ]
+        return {
+            "word_count": self.words,
+            "character_count": self.characters,
+            "line_count": self.lines + (1 if self._last_char and self._last_char != "\n" else 0),
+            "token_estimate": self.tokens + len(tokens),
+            "top_terms": top,
+            "first_few_words": preview,
+        }
+    
+    @classmethod
+    def analyze(cls, text: str, **kwargs) -> Dict[str, Any]:
+        """Statistics of a whole text, read in pieces of ``PIECE_CHARS``."""
+        stats = cls(**kwargs)
+        for start in range(0, len(text), PIECE_CHARS):
+            stats.update(text[start:start + PIECE_CHARS])
+        return stats.to_dict()
+    
+    @classmethod
+    async def analyze_stream(cls, texts: AsyncIterable[str], **kwargs) -> Dict[str, Any]:
+        """Statistics of a text arriving in pieces."""
+        stats = cls(**kwargs)
+        async for text in texts:
+            stats.update(text)
+        return stats.to_dict()
@@ -0,0 +1,394 @@
+"""Document ingestion pipeline for the Omnia AI platform knowledge base.
+
+A document flows through four stages connected by bounded queues:
+
+    extract   stream the document's text (``DocumentProcessor.iter_text_chunks``)
+    chunk     split it into overlapping chunks of at most ``chunk_tokens`` tokens
+    embed     embed batches of new chunks, ``concurrency`` batches at a time
+    write     add the vectors to the ``VectorStore`` as ``<document_id>#chunk:<hash>``
+
+A full queue makes the stage before it wait, so a fast reader never runs
+ahead of embedding and memory stays bounded.
+
+Chunk ids carry a hash of the chunk text, and chunk boundaries depend only on
+the surrounding text, so re-ingesting an edited document only embeds the
+chunks around the edits; the others are skipped, and chunks that no longer
+occur are deleted. An interrupted ingestion resumes the same way. Progress
+is recorded per job in the ``ingestion_jobs`` collection.
+"""
+from typing import Dict, List, Any, Optional, Tuple, Union, Callable, AsyncContextManager, AsyncIterable, AsyncIterator
+import logging
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from .document_processor import DocumentProcessor
+from .document_stats import DocumentStats, TOKEN_PATTERN
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash of a chunk."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _ChunkState:
+    """Position of a ``TokenChunker`` in the text it has buffered."""
+    
+    def __init__(self):
+        """Initialize the state at the start of a text."""
+        # Token the current chunk's text starts at, overlap included
+        self.start = 0
+        # First token of the current chunk that is not overlap
+        self.first = 0
+        # Next token to look at
+        self.position = 0
+        # Tokens since the last line break, and since the last candidate boundary
+        self.line_tokens = 0
+        self.since_candidate = 0
+        # Last token of the current chunk that ends a line, if any
+        self.line_end: Optional[int] = None
+    
+    def shift(self, tokens: int):
+        """Account for ``tokens`` tokens dropped from the front of the buffer."""
+        self.start -= tokens
+        self.first -= tokens
+        self.position -= tokens
+        if self.line_end is not None:
+            self.line_end -= tokens
+
+
+class TokenChunker:
+    """Split streamed text into token-bounded chunks at content-defined boundaries.
+    
+    Chunks end at line breaks where possible, so each line, or each record
+    of a JSON document, stays whole. A line break is a candidate boundary
+    with a probability proportional to the length of its line, decided by a
+    hash of the ``WINDOW_TOKENS`` tokens before it; candidates therefore
+    come about every ``max_new_tokens / 2`` tokens whatever the line lengths,
+    and a long line always ends its chunk. Lines longer than that are also
+    cut inside, after tokens whose hash hits zero.
+    
+    A candidate is taken when it is at least ``max_new_tokens / 4`` tokens
+    after the candidate before it. Neither rule depends on where the current
+    chunk started, so after an edit the boundaries fall back in place at
+    the next candidate and only the chunks around the edit change. A chunk
+    that reaches the maximum size without a boundary is cut after its last
+    line break, or there if it has none in its second half. A chunk cut
+    inside a line starts with the last ``overlap_tokens`` tokens of the
+    chunk before it.
+    
+    Tokens come from the embedding model's tokenizer when it reports
+    character offsets, otherwise from ``TOKEN_PATTERN``.
+    """
+    
+    WINDOW_TOKENS = 16
+    
+    def __init__(self, chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None,
+                 tokenizer=None):
+        """Initialize the chunker."""
+        if chunk_tokens is None:
+            chunk_tokens = int(os.environ.get("INGESTION_CHUNK_TOKENS", "256"))
+        if overlap_tokens is None:
+            overlap_tokens = int(os.environ.get("INGESTION_CHUNK_OVERLAP", "32"))
+        
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.overlap_tokens = min(max(0, overlap_tokens), self.chunk_tokens - 1)
+        # Tokens of a chunk that are not taken from the chunk before it
+        self.max_new_tokens = self.chunk_tokens - self.overlap_tokens
+        self.min_new_tokens = max(1, self.max_new_tokens // 4)
+        self.divisor = max(1, self.max_new_tokens // 2)
+        self.tokenizer = tokenizer
+    
+    def token_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character offsets of the tokens of a text."""
+        if self.tokenizer is not None:
+            try:
+                encoded = self.tokenizer(
+                    text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+                )
+                return [tuple(span) for span in encoded["offset_mapping"] if span[1] > span[0]]
+            except Exception as e:
+                # Slow tokenizers cannot report offsets
+                logger.warning(f"Tokenizer cannot be used for chunking, estimating tokens instead: {e}")
+                self.tokenizer = None
+        return [match.span() for match in TOKEN_PATTERN.finditer(text)]
+    
+    def _is_candidate(self, text: str, spans: List[Tuple[int, int]], i: int,
+                      line_tokens: int, ends_line: bool) -> bool:
+        """Whether token ``i``, the ``line_tokens``-th of its line, is a candidate boundary."""
+        window = text[spans[max(0, i - self.WINDOW_TOKENS + 1)][0]:spans[i][1]]
+        value = zlib.crc32(window.encode("utf-8")) % self.divisor
+        if ends_line:
+            return value < line_tokens
+        return line_tokens >= self.divisor and value == 0
+    
+    def _cut(self, text: str, spans: List[Tuple[int, int]], state: _ChunkState, final: bool) -> List[str]:
+        """Chunks ending in the tokens from ``state.position`` on, advancing the state."""
+        chunks = []
+        # The last token may continue in the next piece of text, so only the final call looks at it
+        limit = len(spans) if final else len(spans) - 1
+        for i in range(state.position, limit):
+            next_start = spans[i + 1][0] if i + 1 < len(spans) else len(text)
+            ends_line = "\n" in text[spans[i][1]:next_start]
+            state.line_tokens += 1
+            state.since_candidate += 1
+            
+            end = None
+            if self._is_candidate(text, spans, i, state.line_tokens, ends_line):
+                if state.since_candidate >= self.min_new_tokens:
+                    end = i
+                state.since_candidate = 0
+            if end is None and i - state.first + 1 >= self.max_new_tokens:
+                # Full: repeated lines give the same chunks whatever the phase if cut at a line break
+                half = state.first + self.max_new_tokens // 2
+                end = state.line_end if not ends_line and state.line_end is not None and state.line_end >= half else i
+            if ends_line:
+                state.line_tokens = 0
+                state.line_end = i
+            if end is not None:
+                chunks.append(text[spans[state.start][0]:spans[end][1]])
+                at_line_end = end == state.line_end
+                state.first = end + 1
+                state.start = state.first if at_line_end else max(0, state.first - self.overlap_tokens)
+                state.line_end = None
+        state.position = max(state.position, limit)
+        
+        if final and state.first < len(spans):
+            chunks.append(text[spans[state.start][0]:spans[-1][1]])
+        return chunks
+    
+    async def chunks(self, texts: AsyncIterable[str]) -> AsyncIterator[str]:
+        """Chunks of a text arriving in pieces."""
+        buffer = ""
+        state = _ChunkState()
+        async for text in texts:
+            buffer += text
+            spans = self.token_spans(buffer)
+            for chunk in self._cut(buffer, spans, state, final=False):
+                yield chunk
+            
+            # Keep the current chunk and the window the boundary hash looks back on
+            keep = min(state.start, state.position - self.WINDOW_TOKENS + 1)
+            if keep > 0:
+                buffer = buffer[spans[keep][0]:]
+                state.shift(keep)
+        
+        for chunk in self._cut(buffer, self.token_spans(buffer), state, final=True):
+            yield chunk
+
+
+class IngestionPipeline:
+    """Extract, chunk, embed and index documents with backpressure between stages."""
+    
+    def __init__(self, vector_store, collection=None, batch_size: Optional[int] = None,
+                 concurrency: Optional[int] = None, queue_size: Optional[int] = None,
+                 max_jobs: int = 100):
+        """Initialize the pipeline; without a collection, progress is only kept in memory."""
+        if batch_size is None:
+            batch_size = int(os.environ.get("INGESTION_BATCH_SIZE", "32"))
+        if concurrency is None:
+            concurrency = int(os.environ.get("INGESTION_CONCURRENCY", "4"))
+        if queue_size is None:
+            queue_size = int(os.environ.get("INGESTION_QUEUE_SIZE", "8"))
+        
+        self.vector_store = vector_store
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.max_jobs = max_jobs
+        # Recent jobs, oldest first
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        
+        self.documents = 0
+        self.failed = 0
+        self.chunks_embedded = 0
+        self.chunks_skipped = 0
+        self.chunks_deleted = 0
+        self.busy_seconds = 0.0
+    
+    def _tokenizer(self):
+        """Tokenizer of the current embedding model, if it has one."""
+        embedding_service = self.vector_store.embedding_service
+        model = embedding_service.model_loader.embedding_models.get(embedding_service.default_model_id)
+        return getattr(model, "tokenizer", None)
+    
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of an ingestion job."""
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        if self.collection is None:
+            return None
+        try:
+            document = await self.collection.find_one({"_id": job_id})
+        except Exception as e:
+            logger.exception(f"Error loading ingestion job {job_id}: {e}")
+            return None
+        if document is None:
+            return None
+        document.pop("_id", None)
+        return document
+    
+    async def _save_job(self, job: Dict[str, Any]):
+        """Record the progress of a job."""
+        job["updated_at"] = datetime.utcnow()
+        self.jobs[job["job_id"]] = job
+        self.jobs.move_to_end(job["job_id"])
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one({"_id": job["job_id"]}, dict(job, _id=job["job_id"]), upsert=True)
+        except Exception as e:
+            logger.exception(f"Error saving ingestion job {job['job_id']}: {e}")
+    
+    async def ingest(self, document_id: str, source: Union[str, os.PathLike, AsyncIterable[bytes]],
+                     mime_type: str = "text/plain", job_id: Optional[str] = None,
+                     admission: Optional[Callable[[], AsyncContextManager]] = None) -> Dict[str, Any]:
+        """Ingest a document from a file path or an async iterator of bytes.
+        
+        Chunks already in the index under the same content hash are skipped,
+        and chunks of the previous version that no longer occur are deleted
+        once the whole document has been read. With ``admission``, each
+        embedding batch runs inside the context it returns, such as an
+        inference slot. Returns the job record; its ``status`` is
+        ``completed`` or ``failed``, including when ingestion is cancelled.
+        """
+        job = {
+            "job_id": job_id or str(uuid.uuid4()),
+            "document_id": document_id,
+            "mime_type": mime_type,
+            "status": "running",
+            "chunks": 0,
+            "chunks_embedded": 0,
+            "chunks_skipped": 0,
+            "chunks_deleted": 0,
+            "error": None,
+            "created_at": datetime.utcnow(),
+        }
+        await self._save_job(job)
+        
+        try:
+            existing = set(await self.vector_store.chunk_ids(document_id))
+            seen = set()
+            stats = DocumentStats()
+            batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+            embedded: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+            embedders_left = [self.concurrency]
+            
+            async def extract_and_chunk():
+                chunker = TokenChunker(tokenizer=self._tokenizer())
+                texts = DocumentProcessor.iter_text_chunks(source, mime_type)
+                batch = []
+                async for chunk in chunker.chunks(stats.observe(texts)):
+                    chunk_id = self.vector_store.chunk_id(document_id, chunk_hash(chunk))
+                    job["chunks"] += 1
+                    # Unchanged chunks, and repeats within the document, keep their vectors
+                    if chunk_id in existing or chunk_id in seen:
+                        job["chunks_skipped"] += 1
+                    else:
+                        batch.append((chunk_id, chunk))
+                    seen.add(chunk_id)
+                    if len(batch) >= self.batch_size:
+                        await batches.put(batch)
+                        batch = []
+                if batch:
+                    await batches.put(batch)
+                for _ in range(self.concurrency):
+                    await batches.put(None)
+            
+            async def embed():
+                while True:
+                    batch = await batches.get()
+                    if batch is None:
+                        break
+                    texts = [chunk for _, chunk in batch]
+                    if admission is None:
+                        embeddings = await self.vector_store.embedding_service.embed(texts)
+                    else:
+                        async with admission():
+                            embeddings = await self.vector_store.embedding_service.embed(texts)
+                    if embeddings is None:
+                        raise RuntimeError(f"Failed to embed {len(batch)} chunks")
+                    await embedded.put(([chunk_id for chunk_id, _ in batch], embeddings))
+                embedders_left[0] -= 1
+                if embedders_left[0] == 0:
+                    await embedded.put(None)
+            
+            async def write():
+                while True:
+                    item = await embedded.get()
+                    if item is None:
+                        break
+                    chunk_ids, embeddings = item
+                    await self.vector_store.add_vectors(chunk_ids, embeddings)
+                    job["chunks_embedded"] += len(chunk_ids)
+                    self.chunks_embedded += len(chunk_ids)
+                    await self._save_job(job)
+            
+            start = time.perf_counter()
+            tasks = [asyncio.create_task(extract_and_chunk()), asyncio.create_task(write())]
+            tasks += [asyncio.create_task(embed()) for _ in range(self.concurrency)]
+            try:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            errors = [task.exception() for task in done if not task.cancelled() and task.exception()]
+            
+            if errors or pending:
+                # Chunks written so far stay indexed, so ingesting again only embeds the rest
+                error = errors[0] if errors else RuntimeError("Ingestion stopped early")
+                logger.error(f"Ingestion job {job['job_id']} of {document_id} failed: {error}")
+                job.update(status="failed", error=str(error))
+                self.failed += 1
+            else:
+                vanished = list(existing - seen)
+                if vanished:
+                    job["chunks_deleted"] = await self.vector_store.delete_documents(vanished)
+                job["status"] = "completed"
+                job["document_stats"] = stats.to_dict()
+                self.documents += 1
+                self.chunks_skipped += job["chunks_skipped"]
+                self.chunks_deleted += job["chunks_deleted"]
+            
+            elapsed = time.perf_counter() - start
+            self.busy_seconds += elapsed
+            job["elapsed_seconds"] = round(elapsed, 3)
+            job["chunks_per_second"] = job["chunks"] / elapsed if elapsed else 0.0
+            if job["status"] == "completed":
+                logger.info(
+                    f"Ingested {job['chunks']} chunks of {document_id} at {job['chunks_per_second']:.1f} chunks/s: "
+                    f"{job['chunks_embedded']} embedded, {job['chunks_skipped']} unchanged, "
+                    f"{job['chunks_deleted']} deleted"
+                )
+            await self._save_job(job)
+            return job
+        finally:
+            if job["status"] == "running":
+                # Cancelled, e.g. when the client went away mid-upload
+                job.update(status="failed", error="Ingestion cancelled")
+                self.failed += 1
+                await asyncio.shield(self._save_job(job))
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get ingestion statistics."""
+        return {
+            "documents": self.documents,
+            "failed": self.failed,
+            "running": sum(1 for job in self.jobs.values() if job["status"] == "running"),
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_skipped": self.chunks_skipped,
+            "chunks_deleted": self.chunks_deleted,
+            "embedded_per_second": self.chunks_embedded / self.busy_seconds if self.busy_seconds else 0.0,
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+        }
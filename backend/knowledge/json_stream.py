@@ -0,0 +1,218 @@
+"""Streaming JSON extraction for the Omnia AI platform.
+
+JSON documents are turned into one compact line of text per record, without
+loading the whole document:
+
+* JSON Lines (``application/x-ndjson``, ``application/jsonl``) are read line
+  by line;
+* a JSON array is read element by element, and a JSON object member by
+  member as single-member objects, with members holding an array read
+  element by element too (``{"items": [1, 2]}`` gives ``{"items":1}`` and
+  ``{"items":2}``), all with ``json.JSONDecoder.raw_decode``, which accepts
+  the same values as ``loads``;
+* a scalar is a single record.
+
+Memory is bounded by the largest element or member value, which is read
+whole: an array nested two levels down, for instance, is not split.
+
+Records are parsed and serialized with ``orjson`` when it is installed and
+with ``json`` otherwise.
+"""
+from typing import Any, Optional, AsyncIterable, AsyncIterator
+import logging
+import codecs
+import json
+
+logger = logging.getLogger(__name__)
+
+JSON_MIME_TYPES = ("application/json",)
+JSON_LINES_MIME_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+
+_decoder = json.JSONDecoder()
+# Characters that can follow a complete number
+NUMBER_DELIMITERS = frozenset(",]} \t\r\n")
+
+
+def is_json(mime_type: str) -> bool:
+    """Whether a MIME type is handled by ``iter_records``."""
+    return mime_type in JSON_MIME_TYPES or mime_type in JSON_LINES_MIME_TYPES
+
+
+def loads(data: bytes) -> Any:
+    """Parse a JSON value."""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson rejects integers beyond 64 bits and NaN, which json accepts
+        return json.loads(data)
+
+
+def dumps(value: Any) -> str:
+    """Serialize a JSON value compactly."""
+    try:
+        import orjson
+        return orjson.dumps(value).decode("utf-8")
+    except (ImportError, TypeError):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+async def _iter_lines(source: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Records of a JSON Lines document; lines that are not valid JSON are skipped."""
+    pending = b""
+    number = 0
+    async for data in source:
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            record = _parse_line(line, number)
+            if record is not None:
+                yield record
+    record = _parse_line(pending, number + 1)
+    if record is not None:
+        yield record
+
+
+def _parse_line(line: bytes, number: int) -> Optional[str]:
+    """Compact text of one JSON Lines record, or None for blank and invalid lines."""
+    if not line.strip():
+        return None
+    try:
+        return dumps(loads(line))
+    except ValueError as e:
+        logger.warning(f"Skipping invalid JSON on line {number}: {e}")
+        return None
+
+
+async def _iter_container(first: bytes, source: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Records of a top-level JSON array or object, parsed with ``raw_decode``.
+    
+    The elements of an array are records as they are. An object gives one
+    single-member object per member, and a member holding an array gives
+    one per element, so ``{"items": [...]}`` streams element by element too.
+    Only one element or member value is held in memory at a time.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = decoder.decode(first)
+    position = len(buffer) - len(buffer.lstrip())
+    # Open containers, outermost first, as [closing character, values read]
+    stack = [["]" if buffer[position] == "[" else "}", 0]]
+    in_object = stack[0][0] == "}"
+    position += 1
+    # What comes next: "key", "colon", "value" or "separator"
+    expected = "key" if in_object else "value"
+    # Key of the object member being read
+    key = None
+    # A value cut off at the end of the buffer is retried once the buffer has doubled
+    retry_at = 0
+    final = False
+    
+    async def more():
+        nonlocal buffer, position, final
+        try:
+            text = decoder.decode(await source.__anext__())
+        except StopAsyncIteration:
+            text = decoder.decode(b"", final=True)
+            final = True
+        buffer = buffer[position:] + text
+        position = 0
+    
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n":
+            position += 1
+        if position == len(buffer):
+            if final:
+                raise ValueError("JSON document is not closed")
+            await more()
+            continue
+        
+        char = buffer[position]
+        closing, values = stack[-1]
+        if char == closing and expected in (("key", "separator") if closing == "}" else ("value", "separator")):
+            position += 1
+            stack.pop()
+            if not stack:
+                return
+            if values == 0:
+                yield dumps({key: []})
+            expected = "separator"
+            continue
+        if expected == "separator":
+            if char != ",":
+                raise ValueError(f"Expected ',' or {closing!r} in JSON document, found {char!r}")
+            position += 1
+            expected = "key" if closing == "}" else "value"
+            continue
+        if expected == "colon":
+            if char != ":":
+                raise ValueError(f"Expected ':' in JSON object, found {char!r}")
+            position += 1
+            expected = "value"
+            continue
+        if expected == "value" and char == "[" and in_object and len(stack) == 1:
+            # Stream the elements of an array member
+            stack.append(["]", 0])
+            position += 1
+            continue
+        
+        if len(buffer) - position >= retry_at or final:
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+            else:
+                # A number is only complete once a delimiter follows it; until
+                # then the next block may continue it (1 -> 1.5, 1 -> 1e5)
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if final or (end < len(buffer) and (not number or buffer[end] in NUMBER_DELIMITERS)):
+                    position = end
+                    retry_at = 0
+                    if expected == "key":
+                        if not isinstance(value, str):
+                            raise ValueError(f"Expected a string key in JSON object, found {value!r}")
+                        key = value
+                        expected = "colon"
+                        continue
+                    stack[-1][1] += 1
+                    expected = "separator"
+                    yield dumps({key: value}) if in_object else dumps(value)
+                    continue
+            retry_at = 2 * (len(buffer) - position)
+        await more()
+
+
+async def iter_records(source: AsyncIterable[bytes], mime_type: str = "application/json") -> AsyncIterator[str]:
+    """Stream the records of a JSON or JSON Lines document as compact JSON text.
+    
+    A leading UTF-8 byte order mark is skipped.
+    """
+    if mime_type in JSON_LINES_MIME_TYPES:
+        async for record in _iter_lines(source):
+            yield record
+        return
+    
+    source = source.__aiter__()
+    first = bytearray()
+    async for data in source:
+        first += data
+        # Read on until the first character after a byte order mark, which may be split across blocks
+        if first.startswith(codecs.BOM_UTF8):
+            del first[:len(codecs.BOM_UTF8)]
+        if first.strip() and not codecs.BOM_UTF8.startswith(first):
+            break
+    
+    if not first.lstrip().startswith((b"[", b"{")):
+        # A scalar cannot be split into records
+        async for data in source:
+            first += data
+        if first.strip():
+            yield dumps(loads(bytes(first)))
+        return
+    
+    async for record in _iter_container(bytes(first), source):
+        yield record
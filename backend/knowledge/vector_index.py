@@ -0,0 +1,583 @@
+"""Vector index for the Omnia AI platform knowledge base.
+
+An inverted-file (IVF) approximate nearest-neighbour index over
+unit-normalized vectors, in pure NumPy. Vectors are assigned to the nearest
+of ``nlist`` k-means centroids and a query only scans the ``nprobe`` lists
+closest to it. Until enough vectors have been added to train the centroids
+the index answers queries by brute force.
+
+Vectors are stored through a ``VectorCodec``: at ``VECTOR_INDEX_PRECISION``
+(``float32``, ``float16`` or ``int8``) and, when ``VECTOR_INDEX_DIM`` is set,
+reduced to that many dimensions by ``VECTOR_INDEX_REDUCTION`` (``truncate``
+or ``pca``). Principal components are fitted on the training sample, so a
+PCA index stores full-dimension vectors until it is first trained and then
+rewrites them. Queries are scored directly against the stored form.
+
+On-disk layout of an index directory:
+    
+    meta.json      dimensions, row count, capacity, storage settings
+    vectors.*      memory-mapped matrix, one row per vector (.f32, .f16 or .i8)
+    scales.f32     memory-mapped scale of every row of an int8 index
+    lists.i32      memory-mapped inverted-list id of every row (-1 before training)
+    deleted.u8     memory-mapped tombstones
+    centroids.npy  trained centroids
+    reduction.npz  principal components of a PCA index
+    ids.jsonl      external id of every row, append-only
+
+Deleting or replacing a vector only tombstones its row. Once tombstones
+make up more than ``VECTOR_INDEX_COMPACT_RATIO`` of the rows (0.5 by
+default) the live rows are rewritten without them, so repeatedly
+re-indexed documents do not grow the index without bound.
+
+Ids of the form ``<document_id>#chunk:<name>`` are chunks of a document; the
+index keeps the chunk ids of every document so they can be listed without
+scanning all ids.
+
+An index directory must only be written by one process at a time.
+"""
+from typing import Dict, List, Any, Optional, Tuple, Set
+import logging
+import os
+import json
+import time
+import threading
+import numpy as np
+from core.vector_codec import VectorCodec
+
+logger = logging.getLogger(__name__)
+
+VECTOR_FILES = {"float32": "vectors.f32", "float16": "vectors.f16", "int8": "vectors.i8"}
+
+# Separates a document id from the name of one of its chunks
+CHUNK_SEPARATOR = "#chunk:"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the ``k`` highest scores, best first."""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class VectorIndex:
+    """Persistent IVF index with incremental inserts and deletes."""
+    
+    BLOCK_SIZE = 65536
+    # Fewer tombstones than this are never worth a rewrite
+    COMPACT_MIN_ROWS = 1024
+    
+    def __init__(self, directory: str, nlist: Optional[int] = None, nprobe: Optional[int] = None,
+                 train_threshold: Optional[int] = None, precision: Optional[str] = None,
+                 reduced_dim: Optional[int] = None, reduction: Optional[str] = None,
+                 compact_ratio: Optional[float] = None):
+        """Open the index stored in ``directory``, creating it if needed.
+        
+        The storage settings only apply to a new index; an existing one keeps
+        those it was created with.
+        """
+        self.directory = directory
+        self.nlist = nlist
+        self.nprobe = nprobe or int(os.environ.get("VECTOR_INDEX_NPROBE", "8"))
+        self.train_threshold = train_threshold or int(os.environ.get("VECTOR_INDEX_TRAIN_THRESHOLD", "50000"))
+        self.compact_ratio = compact_ratio or float(os.environ.get("VECTOR_INDEX_COMPACT_RATIO", "0.5"))
+        self.codec = VectorCodec(
+            precision or os.environ.get("VECTOR_INDEX_PRECISION", "float32"),
+            reduced_dim or int(os.environ.get("VECTOR_INDEX_DIM", "0")),
+            reduction or os.environ.get("VECTOR_INDEX_REDUCTION", "truncate"),
+        )
+        os.makedirs(directory, exist_ok=True)
+        
+        # Dimension of added vectors, and of stored vectors after reduction
+        self.input_dim: Optional[int] = None
+        self.dim: Optional[int] = None
+        self.count = 0
+        self.capacity = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.vectors: Optional[np.memmap] = None
+        self.scales: Optional[np.memmap] = None
+        self.lists: Optional[np.memmap] = None
+        self.deleted: Optional[np.memmap] = None
+        self.id_to_row: Dict[str, int] = {}
+        self.row_ids: List[str] = []
+        # Live chunk ids of each document
+        self.document_chunks: Dict[str, Set[str]] = {}
+        self._inverted: List[List[np.ndarray]] = []
+        self._lock = threading.RLock()
+        
+        if os.path.exists(self._path("meta.json")):
+            self._open()
+    
+    def _path(self, name: str) -> str:
+        """Path of a file of the index."""
+        return os.path.join(self.directory, name)
+    
+    @property
+    def size(self) -> int:
+        """Number of live vectors."""
+        return len(self.id_to_row)
+    
+    @property
+    def trained(self) -> bool:
+        """Whether the inverted lists are in use."""
+        return self.centroids is not None
+    
+    def _map(self, capacity: int):
+        """Map the row files, growing them to ``capacity`` rows."""
+        files = [
+            ("vectors", VECTOR_FILES[self.codec.precision], self.codec.dtype, (capacity, self.dim)),
+            ("lists", "lists.i32", np.int32, (capacity,)),
+            ("deleted", "deleted.u8", np.uint8, (capacity,)),
+        ]
+        if self.codec.precision == "int8":
+            files.append(("scales", "scales.f32", np.float32, (capacity,)))
+        for attribute, name, dtype, shape in files:
+            current = getattr(self, attribute)
+            if current is not None:
+                current.flush()
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(self._path(name), "a+b") as f:
+                if os.fstat(f.fileno()).st_size < nbytes:
+                    f.truncate(nbytes)
+            setattr(self, attribute, np.memmap(self._path(name), dtype=dtype, mode="r+", shape=shape))
+        self.capacity = capacity
+    
+    def _open(self):
+        """Load an existing index from disk."""
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        # Indexes written before storage settings existed hold float32 vectors
+        self.codec = VectorCodec(
+            meta.get("precision", "float32"), meta.get("reduced_dim"), meta.get("reduction", "truncate")
+        )
+        if os.path.exists(self._path("reduction.npz")):
+            self.codec.load(self._path("reduction.npz"))
+        self.dim = meta["dim"]
+        self.input_dim = meta.get("input_dim", self.dim)
+        self.count = meta["count"]
+        self._map(meta["capacity"])
+        
+        if os.path.exists(self._path("centroids.npy")):
+            self.centroids = np.load(self._path("centroids.npy"))
+        
+        self.row_ids = [""] * self.count
+        if os.path.exists(self._path("ids.jsonl")):
+            with open(self._path("ids.jsonl")) as f:
+                for line in f:
+                    row, external_id = json.loads(line)
+                    if row < self.count:
+                        self.row_ids[row] = external_id
+        live = np.flatnonzero(self.deleted[:self.count] == 0)
+        self.id_to_row = {self.row_ids[row]: int(row) for row in live}
+        self.document_chunks = {}
+        for external_id in self.id_to_row:
+            self._track_chunk(external_id)
+        self._rebuild_inverted()
+        logger.info(f"Opened vector index {self.directory} with {self.size} vectors")
+    
+    def _write_meta(self):
+        """Persist the index metadata."""
+        meta = {"dim": self.dim, "input_dim": self.input_dim, "count": self.count, "capacity": self.capacity}
+        meta.update(self.codec.to_dict())
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path("meta.json"))
+    
+    def _rebuild_inverted(self):
+        """Group row numbers by inverted list."""
+        self._inverted = []
+        if not self.trained:
+            return
+        lists = np.asarray(self.lists[:self.count])
+        order = np.argsort(lists, kind="stable")
+        bounds = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1))
+        self._inverted = [[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.centroids))]
+    
+    def _reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """Unit vectors brought to the stored dimension."""
+        return self.codec.reduce(vectors) if self.codec.fitted else vectors
+    
+    def _write_rows(self, rows: np.ndarray, vectors: np.ndarray):
+        """Store reduced vectors in rows."""
+        codes, scales = self.codec.encode(vectors)
+        self.vectors[rows] = codes
+        if scales is not None:
+            self.scales[rows] = scales
+    
+    def _read_rows(self, rows) -> np.ndarray:
+        """Decoded float32 vectors of rows, given as a slice or an index array."""
+        return self.codec.decode(self.vectors[rows], None if self.scales is None else self.scales[rows])
+    
+    def _scores(self, queries: np.ndarray, rows) -> np.ndarray:
+        """Scores of reduced queries against the stored vectors of rows."""
+        return self.codec.scores(queries, self.vectors[rows], None if self.scales is None else self.scales[rows])
+    
+    def _fit_reduction(self, sample: np.ndarray):
+        """Fit principal components and rewrite every stored vector at the reduced dimension."""
+        self.codec.fit(sample)
+        dim = self.codec.output_dim(self.input_dim)
+        tmp_path = self._path("vectors.tmp")
+        vectors = np.memmap(tmp_path, dtype=self.codec.dtype, mode="w+", shape=(self.capacity, dim))
+        scales = None
+        if self.scales is not None:
+            scales = np.memmap(self._path("scales.tmp"), dtype=np.float32, mode="w+", shape=(self.capacity,))
+        for start in range(0, self.count, self.BLOCK_SIZE):
+            stop = min(start + self.BLOCK_SIZE, self.count)
+            codes, block_scales = self.codec.encode(self.codec.reduce(self._read_rows(slice(start, stop))))
+            vectors[start:stop] = codes
+            if scales is not None:
+                scales[start:stop] = block_scales
+        vectors.flush()
+        if scales is not None:
+            scales.flush()
+        
+        self.vectors, self.scales = None, None
+        os.replace(tmp_path, self._path(VECTOR_FILES[self.codec.precision]))
+        if scales is not None:
+            os.replace(self._path("scales.tmp"), self._path("scales.f32"))
+        self.codec.save(self._path("reduction.npz"))
+        self.dim = dim
+        self._map(self.capacity)
+        self._write_meta()
+        logger.info(f"Reduced vector index from {self.input_dim} to {dim} dimensions")
+    
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Nearest centroid of each vector."""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), self.BLOCK_SIZE):
+            block = vectors[start:start + self.BLOCK_SIZE]
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+    
+    def add(self, ids: List[str], vectors: np.ndarray):
+        """Add or replace vectors under external ids."""
+        vectors = _normalize(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("Number of ids and vectors must match")
+        if len(set(ids)) < len(ids):
+            # Within one batch the last vector of a repeated id wins
+            last = {external_id: i for i, external_id in enumerate(ids)}
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+        
+        with self._lock:
+            if self.input_dim is None:
+                self.input_dim = vectors.shape[1]
+                self.dim = self.codec.output_dim(self.input_dim) if self.codec.fitted else self.input_dim
+            elif vectors.shape[1] != self.input_dim:
+                raise ValueError(f"Expected vectors of dimension {self.input_dim}, got {vectors.shape[1]}")
+            vectors = self._reduce(vectors)
+            
+            # Re-adding an id replaces its previous vector
+            self.delete([external_id for external_id in ids if external_id in self.id_to_row])
+            
+            needed = self.count + len(ids)
+            if needed > self.capacity:
+                self._map(max(needed, 2 * self.capacity, 1024))
+            
+            rows = np.arange(self.count, needed)
+            self._write_rows(rows, vectors)
+            self.deleted[rows] = 0
+            if self.trained:
+                assignments = self._assign(vectors)
+                self.lists[rows] = assignments
+                order = np.argsort(assignments, kind="stable")
+                bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+                for list_id in range(len(self.centroids)):
+                    if bounds[list_id + 1] > bounds[list_id]:
+                        self._inverted[list_id].append(rows[order[bounds[list_id]:bounds[list_id + 1]]])
+            else:
+                self.lists[rows] = -1
+            
+            with open(self._path("ids.jsonl"), "a") as f:
+                for row, external_id in zip(rows, ids):
+                    f.write(json.dumps([int(row), external_id]) + "\n")
+                    self.id_to_row[external_id] = int(row)
+                    self.row_ids.append(external_id)
+                    self._track_chunk(external_id)
+            
+            self.count = needed
+            self._write_meta()
+            
+            if not self.trained and self.size >= self.train_threshold:
+                self.train()
+    
+    def delete(self, ids: List[str]) -> int:
+        """Delete vectors by external id, returning how many were removed."""
+        with self._lock:
+            rows = []
+            for external_id in ids:
+                if external_id in self.id_to_row:
+                    rows.append(self.id_to_row.pop(external_id))
+                    self._untrack_chunk(external_id)
+            if rows:
+                self.deleted[rows] = 1
+                tombstones = self.count - self.size
+                if tombstones >= self.COMPACT_MIN_ROWS and tombstones > self.compact_ratio * self.count:
+                    self.compact()
+            return len(rows)
+    
+    def compact(self):
+        """Rewrite the live rows without tombstones, renumbering them in order."""
+        with self._lock:
+            if self.dim is None:
+                return
+            started = time.perf_counter()
+            live = np.flatnonzero(self.deleted[:self.count] == 0)
+            capacity = max(len(live), 1024)
+            files = [
+                ("vectors", VECTOR_FILES[self.codec.precision]),
+                ("lists", "lists.i32"),
+                ("deleted", "deleted.u8"),
+            ]
+            if self.scales is not None:
+                files.append(("scales", "scales.f32"))
+            for attribute, name in files:
+                current = getattr(self, attribute)
+                rewritten = np.memmap(self._path(f"{name}.tmp"), dtype=current.dtype, mode="w+",
+                                      shape=(capacity,) + current.shape[1:])
+                for start in range(0, len(live), self.BLOCK_SIZE):
+                    rows = live[start:start + self.BLOCK_SIZE]
+                    rewritten[start:start + len(rows)] = current[rows]
+                rewritten.flush()
+            
+            row_ids = [self.row_ids[row] for row in live]
+            with open(self._path("ids.jsonl.tmp"), "w") as f:
+                for row, external_id in enumerate(row_ids):
+                    f.write(json.dumps([row, external_id]) + "\n")
+            
+            removed = self.count - len(live)
+            self.vectors = self.scales = self.lists = self.deleted = None
+            for _, name in files:
+                os.replace(self._path(f"{name}.tmp"), self._path(name))
+            os.replace(self._path("ids.jsonl.tmp"), self._path("ids.jsonl"))
+            self.count = len(live)
+            self.row_ids = row_ids
+            self.id_to_row = {external_id: row for row, external_id in enumerate(row_ids)}
+            self._map(capacity)
+            self._rebuild_inverted()
+            self._write_meta()
+            logger.info(
+                f"Compacted vector index {self.directory}, removing {removed} deleted rows "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+    
+    def _track_chunk(self, external_id: str):
+        """Record a live id in its document's chunks if it is a chunk id."""
+        document_id, separator, _ = external_id.partition(CHUNK_SEPARATOR)
+        if separator:
+            self.document_chunks.setdefault(document_id, set()).add(external_id)
+    
+    def _untrack_chunk(self, external_id: str):
+        """Forget a deleted chunk id."""
+        document_id, separator, _ = external_id.partition(CHUNK_SEPARATOR)
+        chunks = self.document_chunks.get(document_id) if separator else None
+        if chunks is not None:
+            chunks.discard(external_id)
+            if not chunks:
+                del self.document_chunks[document_id]
+    
+    def chunk_ids(self, document_id: str) -> List[str]:
+        """Live chunk ids of a document."""
+        with self._lock:
+            return list(self.document_chunks.get(document_id, ()))
+    
+    def train(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        """Train the coarse quantizer with spherical k-means and assign every row."""
+        with self._lock:
+            live = np.flatnonzero(self.deleted[:self.count] == 0)
+            if len(live) == 0:
+                return
+            
+            nlist = nlist or self.nlist or max(1, int(4 * np.sqrt(len(live))))
+            nlist = min(nlist, len(live))
+            rng = np.random.default_rng(seed)
+            sample = self._read_rows(np.sort(rng.choice(live, min(len(live), nlist * 64), replace=False)))
+            if not self.codec.fitted and self.codec.output_dim(self.input_dim) < self.dim:
+                self._fit_reduction(sample)
+                sample = self.codec.reduce(sample)
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            
+            started = time.perf_counter()
+            for _ in range(iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, sample)
+                counts = np.bincount(assignments, minlength=nlist)
+                empty = counts == 0
+                # Restart empty clusters from random sample points
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+                centroids = _normalize(sums)
+            
+            self.centroids = centroids.astype(np.float32)
+            for start in range(0, self.count, self.BLOCK_SIZE):
+                stop = min(start + self.BLOCK_SIZE, self.count)
+                self.lists[start:stop] = self._assign(self._read_rows(slice(start, stop)))
+            np.save(self._path("centroids.npy"), self.centroids)
+            self._rebuild_inverted()
+            self.flush()
+            logger.info(
+                f"Trained vector index with {nlist} lists on {len(sample)} vectors "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+    
+    def _probe_rows(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the inverted lists closest to a query."""
+        nearest = _top_k(self.centroids @ query, nprobe)
+        rows = []
+        for list_id in nearest:
+            segments = self._inverted[list_id]
+            if len(segments) > 1:
+                # Merge segments added incrementally since the last query
+                segments[:] = [np.concatenate(segments)]
+            if segments:
+                rows.append(segments[0])
+        return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    
+    def search(self, queries: np.ndarray, k: int = 10,
+               nprobe: Optional[int] = None) -> List[List[Tuple[str, float]]]:
+        """Approximate ``k`` nearest neighbours of each query as (id, cosine score)."""
+        if not self.trained:
+            return self.search_exact(queries, k)
+        
+        nprobe = nprobe or self.nprobe
+        results = []
+        with self._lock:
+            queries = self._reduce(_normalize(queries))
+            for query in queries:
+                rows = self._probe_rows(query, nprobe)
+                rows = rows[self.deleted[rows] == 0]
+                scores = self._scores(query, rows)[0]
+                best = _top_k(scores, k)
+                results.append([(self.row_ids[rows[i]], float(scores[i])) for i in best])
+        return results
+    
+    def search_exact(self, queries: np.ndarray, k: int = 10) -> List[List[Tuple[str, float]]]:
+        """Exact ``k`` nearest neighbours of each query by brute force."""
+        queries = _normalize(queries)
+        with self._lock:
+            if self.count == 0:
+                return [[] for _ in queries]
+            
+            queries = self._reduce(queries)
+            best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+            best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+            for start in range(0, self.count, self.BLOCK_SIZE):
+                stop = min(start + self.BLOCK_SIZE, self.count)
+                scores = self._scores(queries, slice(start, stop))
+                scores[:, np.asarray(self.deleted[start:stop]) == 1] = -np.inf
+                best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), scores.shape)], axis=1)
+                best_scores = np.concatenate([best_scores, scores], axis=1)
+                keep = np.stack([_top_k(row, k) for row in best_scores])
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            
+            return [
+                [(self.row_ids[row], float(score)) for row, score in zip(rows, scores) if np.isfinite(score)]
+                for rows, scores in zip(best_rows, best_scores)
+            ]
+    
+    def flush(self):
+        """Write pending changes to disk."""
+        with self._lock:
+            for mapped in (self.vectors, self.scales, self.lists, self.deleted):
+                if mapped is not None:
+                    mapped.flush()
+            if self.dim is not None:
+                self._write_meta()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics."""
+        bytes_per_vector = self.codec.bytes_per_vector(self.dim) if self.dim else 0
+        return {
+            "directory": self.directory,
+            "vectors": self.size,
+            "rows": self.count,
+            "dim": self.dim,
+            "input_dim": self.input_dim,
+            "precision": self.codec.precision,
+            "reduction": self.codec.reduction if self.dim != self.input_dim else None,
+            "bytes_per_vector": bytes_per_vector,
+            "storage_mb": round(self.count * bytes_per_vector / (1024 * 1024), 2),
+            "trained": self.trained,
+            "nlist": len(self.centroids) if self.trained else 0,
+            "nprobe": self.nprobe,
+        }
+
+
+def benchmark(index: VectorIndex, queries: np.ndarray, k: int = 10,
+              nprobe: Optional[int] = None) -> Dict[str, Any]:
+    """Measure recall and latency of the index against brute force search."""
+    ann_latencies = []
+    exact_latencies = []
+    recalls = []
+    for query in queries:
+        started = time.perf_counter()
+        approximate = index.search(query, k, nprobe=nprobe)[0]
+        ann_latencies.append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        exact = index.search_exact(query, k)[0]
+        exact_latencies.append(time.perf_counter() - started)
+        
+        expected = {external_id for external_id, _ in exact}
+        found = {external_id for external_id, _ in approximate}
+        recalls.append(len(expected & found) / max(1, len(expected)))
+    
+    def latency_ms(latencies: List[float]) -> Dict[str, float]:
+        return {
+            "p50": float(np.percentile(latencies, 50) * 1000),
+            "p99": float(np.percentile(latencies, 99) * 1000),
+        }
+    
+    return {
+        "vectors": index.size,
+        "queries": len(queries),
+        "k": k,
+        "nprobe": nprobe or index.nprobe,
+        "recall": float(np.mean(recalls)),
+        "ann_latency_ms": latency_ms(ann_latencies),
+        "exact_latency_ms": latency_ms(exact_latencies),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    
+    parser = argparse.ArgumentParser(description="Benchmark the vector index against brute force")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--precision", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--reduced-dim", type=int, default=0)
+    parser.add_argument("--reduction", default="truncate", choices=["truncate", "pca"])
+    args = parser.parse_args()
+    
+    # Clustered synthetic data resembles real embeddings better than uniform noise
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((max(1, args.vectors // 1000), args.dim)).astype(np.float32)
+    index = VectorIndex(tempfile.mkdtemp(prefix="omnia_index_"), nprobe=args.nprobe,
+                        train_threshold=args.vectors, precision=args.precision,
+                        reduced_dim=args.reduced_dim, reduction=args.reduction)
+    for start in range(0, args.vectors, 50000):
+        n = min(50000, args.vectors - start)
+        vectors = topics[rng.integers(len(topics), size=n)] + 0.5 * rng.standard_normal((n, args.dim)).astype(np.float32)
+        index.add([f"doc-{i}" for i in range(start, start + n)], vectors)
+    
+    queries = topics[rng.integers(len(topics), size=args.queries)] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    results = benchmark(index, queries, args.k)
+    results["storage_mb"] = index.get_stats()["storage_mb"]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,91 @@
+"""Vector store for the Omnia AI platform knowledge base."""
+from typing import Dict, List, Any, Optional
+import logging
+import asyncio
+import os
+import re
+from .vector_index import VectorIndex, CHUNK_SEPARATOR
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """Documents embedded once and searchable through a persistent vector index.
+    
+    Each embedding model gets its own index under
+    ``MODEL_CACHE_DIR/knowledge/<model>``, since vectors of different models
+    cannot be compared.
+    """
+    
+    def __init__(self, embedding_service, base_dir: Optional[str] = None):
+        """Initialize the vector store."""
+        self.embedding_service = embedding_service
+        self.base_dir = base_dir or os.path.join(embedding_service.model_loader.model_cache_dir, "knowledge")
+        self._indexes: Dict[str, VectorIndex] = {}
+    
+    @property
+    def index(self) -> VectorIndex:
+        """Index of the current embedding model, opened on first use."""
+        model_id = self.embedding_service.default_model_id
+        if model_id not in self._indexes:
+            directory = os.path.join(self.base_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_id))
+            self._indexes[model_id] = VectorIndex(directory)
+        return self._indexes[model_id]
+    
+    async def add_documents(self, ids: List[str], texts: List[str]) -> int:
+        """Embed documents and add them to the index, replacing existing ids."""
+        if not ids:
+            return 0
+        
+        embeddings = await self.embedding_service.embed(texts)
+        if embeddings is None:
+            logger.error(f"Failed to embed {len(texts)} documents")
+            return 0
+        
+        return await self.add_vectors(ids, embeddings)
+    
+    async def add_vectors(self, ids: List[str], embeddings) -> int:
+        """Add already computed embeddings to the index, replacing existing ids."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.index.add, ids, embeddings)
+        return len(ids)
+    
+    async def delete_documents(self, ids: List[str]) -> int:
+        """Remove documents from the index."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.index.delete, ids)
+    
+    @staticmethod
+    def chunk_id(document_id: str, name: str) -> str:
+        """Id of a chunk of a document, ``<document_id>#chunk:<name>``."""
+        return f"{document_id}{CHUNK_SEPARATOR}{name}"
+    
+    @staticmethod
+    def is_reserved_id(document_id: str) -> bool:
+        """Whether an id falls in the namespace of chunk ids."""
+        return CHUNK_SEPARATOR in document_id
+    
+    async def chunk_ids(self, document_id: str) -> List[str]:
+        """Ids of the indexed chunks of a document."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.index.chunk_ids, document_id)
+    
+    async def search(self, query: str, top_k: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Find the documents most similar to a query."""
+        embeddings = await self.embedding_service.embed([query])
+        if embeddings is None:
+            return None
+        
+        # The index lock may be held by an add that is training or growing the index
+        loop = asyncio.get_running_loop()
+        results = (await loop.run_in_executor(None, self.index.search, embeddings, top_k))[0]
+        return [{"id": document_id, "score": score} for document_id, score in results]
+    
+    def flush(self):
+        """Write pending index changes to disk."""
+        for index in self._indexes.values():
+            index.flush()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get vector store statistics."""
+        return {model_id: index.get_stats() for model_id, index in self._indexes.items()}
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -9,6 +11,11 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import uuid
+import json
+import threading
+import asyncio
+import math
+import time
 from datetime import datetime
 import sys
 
@@ -16,15 +23,21 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import API routes
-from api.auth import router as auth_router
+from api.auth import router as auth_router, user_from_token
 from api.agents import router as agents_router
 from api.tools import router as tools_router
 from api.tasks import router as tasks_router
 
-# Import core services
-from core.model_loader import ModelLoader
+# Import core services; ML libraries are imported lazily by the model loader
+from core.model_loader import ModelLoader, import_ml_libraries
 from core.embeddings import EmbeddingService
 from core.text_generation import TextGenerationService
+from core.generation_cache import create_generation_cache
+from core.semantic_cache import SemanticCache
+from core.scheduler import InferenceScheduler, AdmissionRejected
+from models.task import TaskPriority
+from knowledge.vector_store import VectorStore
+from knowledge.ingestion import IngestionPipeline
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -43,7 +56,11 @@ api_router = APIRouter(prefix="/api")
 # Create core services
 model_loader = ModelLoader()
 embedding_service = EmbeddingService()
-text_generation_service = TextGenerationService()
+text_generation_service = TextGenerationService(result_cache=create_generation_cache(db))
+vector_store = VectorStore(embedding_service)
+ingestion_pipeline = IngestionPipeline(vector_store, db[os.environ.get("INGESTION_JOBS_COLLECTION", "ingestion_jobs")])
+semantic_cache = SemanticCache(embedding_service)
+inference_scheduler = InferenceScheduler()
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -54,6 +71,60 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+# Admission control for inference routes
+# Highest priority a client may ask for; anything above is capped
+MAX_CLIENT_PRIORITY = TaskPriority[os.environ.get("INFERENCE_MAX_CLIENT_PRIORITY", "MEDIUM").upper()]
+
+def admission_params(request: Request):
+    """User, priority and deadline of a request.
+    
+    The user is the subject of a valid bearer token, otherwise the client
+    address, so per-user limits cannot be dodged by changing a header.
+    ``X-Priority`` takes a ``TaskPriority`` name or value, capped at
+    ``INFERENCE_MAX_CLIENT_PRIORITY``. The deadline is either
+    ``X-Request-Deadline`` (Unix time in seconds) or ``X-Request-Timeout``
+    (seconds from now).
+    """
+    user_id = None
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        user_id = user_from_token(token)
+    if user_id is None:
+        user_id = f"ip:{request.client.host}" if request.client else "anonymous"
+    
+    priority = TaskPriority.MEDIUM
+    priority_header = request.headers.get("X-Priority")
+    if priority_header:
+        try:
+            if priority_header.isdigit():
+                priority = TaskPriority(int(priority_header))
+            else:
+                priority = TaskPriority[priority_header.upper()]
+        except (KeyError, ValueError):
+            pass
+    priority = min(priority, MAX_CLIENT_PRIORITY)
+    
+    deadline = None
+    try:
+        if request.headers.get("X-Request-Deadline"):
+            deadline = time.monotonic() + float(request.headers["X-Request-Deadline"]) - time.time()
+        elif request.headers.get("X-Request-Timeout"):
+            deadline = time.monotonic() + float(request.headers["X-Request-Timeout"])
+    except ValueError:
+        pass
+    
+    return user_id, priority, deadline
+
+async def inference_slot(request: Request):
+    """Hold an inference slot while the route runs."""
+    async with inference_scheduler.admit(*admission_params(request)):
+        yield
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.reason}, headers=headers)
+
 # Add base routes to the router
 @api_router.get("/")
 async def root():
@@ -67,6 +138,26 @@ async def health_check():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@api_router.get("/ready")
+async def readiness_check():
+    """Report whether the default models are loaded and requests can be served."""
+    models = model_loader.get_load_states()
+    if warmup_task is None or not warmup_task.done():
+        ready_status = "starting"
+    elif all(models.get(model_id, {}).get("state") == "loaded" for model_id in model_loader.pinned):
+        ready_status = "ready"
+    else:
+        ready_status = "degraded"
+    
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready_status == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": ready_status,
+            "models": models,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    )
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
@@ -83,34 +174,183 @@ async def get_status_checks():
 class GenerateTextRequest(BaseModel):
     prompt: str
     max_length: int = 100
+    # temperature 0 or do_sample false selects greedy decoding, which is cacheable
+    temperature: float = Field(default=0.7, ge=0.0)
+    top_p: float = Field(default=0.9, gt=0.0, le=1.0)
+    do_sample: Optional[bool] = None
+    # Draft-and-verify decoding; same output distribution, defaults to SPECULATIVE_DECODING
+    speculative: Optional[bool] = None
 
 class GenerateTextResponse(BaseModel):
     text: str
     model_id: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
-@api_router.post("/ai/generate", response_model=GenerateTextResponse)
+@api_router.post("/ai/generate", response_model=GenerateTextResponse, dependencies=[Depends(inference_slot)])
 async def generate_text(request: GenerateTextRequest):
     """Generate text using the default AI model."""
     # Initialize the service if needed
     await text_generation_service.initialize()
     
-    # Generate text
-    generated_text = await text_generation_service.generate_text(
-        request.prompt, request.max_length
+    # Similar prompts with the same settings are answered from the semantic cache
+    cache_scope = (
+        text_generation_service.default_model_id, request.max_length,
+        request.temperature, request.top_p, request.do_sample
     )
+    generated_text = await semantic_cache.lookup("generate", request.prompt, cache_scope)
     
+    # Generate text
     if generated_text is None:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to generate text"
+        generated_text = await text_generation_service.generate_text(
+            request.prompt, request.max_length,
+            temperature=request.temperature, top_p=request.top_p, do_sample=request.do_sample,
+            speculative=request.speculative
         )
+        
+        if generated_text is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to generate text"
+            )
+        
+        await semantic_cache.store("generate", request.prompt, cache_scope, generated_text)
     
     return GenerateTextResponse(
         text=generated_text,
         model_id=text_generation_service.default_model_id
     )
 
+class ChatMessage(BaseModel):
+    role: str = "user"
+    content: str
+
+class ChatRequest(BaseModel):
+    messages: List[ChatMessage]
+    max_length: int = 100
+    conversation_id: Optional[str] = None
+    # Same decoding settings as GenerateTextRequest
+    temperature: float = Field(default=0.7, ge=0.0)
+    top_p: float = Field(default=0.9, gt=0.0, le=1.0)
+    do_sample: Optional[bool] = None
+
+class ChatResponse(BaseModel):
+    text: str
+    model_id: str
+    conversation_id: Optional[str] = None
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+@api_router.post("/ai/chat", response_model=ChatResponse, dependencies=[Depends(inference_slot)])
+async def chat(request: ChatRequest):
+    """Generate the next assistant message of a conversation."""
+    # Initialize the service if needed
+    await text_generation_service.initialize()
+    
+    messages = [message.dict() for message in request.messages]
+    
+    # Only the latest message is matched semantically; the earlier ones
+    # must be identical
+    cache_scope = (
+        text_generation_service.default_model_id, request.max_length,
+        request.temperature, request.top_p, request.do_sample,
+        tuple((message["role"], message["content"]) for message in messages[:-1])
+    )
+    latest = messages[-1]["content"] if messages else ""
+    response = await semantic_cache.lookup("chat", latest, cache_scope)
+    
+    if response is None:
+        try:
+            response = await text_generation_service.generate_response(
+                messages,
+                request.max_length,
+                conversation_id=request.conversation_id,
+                temperature=request.temperature, top_p=request.top_p, do_sample=request.do_sample
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        
+        if response is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to generate response"
+            )
+        
+        await semantic_cache.store("chat", latest, cache_scope, response)
+    
+    return ChatResponse(
+        text=response,
+        model_id=text_generation_service.default_model_id,
+        conversation_id=request.conversation_id
+    )
+
+class StreamTextRequest(BaseModel):
+    # Speculative decoding is not offered for streams
+    prompt: str
+    max_length: int = 100
+    temperature: float = Field(default=0.7, ge=0.0)
+    top_p: float = Field(default=0.9, gt=0.0, le=1.0)
+    do_sample: Optional[bool] = None
+
+@api_router.post("/ai/generate/stream")
+async def stream_text(request: StreamTextRequest, http_request: Request):
+    """Generate text, streaming it to the client as server-sent events."""
+    # Initialize the service if needed
+    await text_generation_service.initialize()
+    
+    # The slot is held until the stream ends. It is released on the event
+    # loop, by the stream itself or, if the stream never started, by the
+    # response's background task
+    ticket = await inference_scheduler.acquire(*admission_params(http_request))
+    cancel_event = threading.Event()
+    released = False
+    
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            inference_scheduler.release(ticket)
+    
+    async def release_after_response():
+        release_slot()
+    
+    async def event_stream():
+        try:
+            async for text in text_generation_service.stream_text(
+                request.prompt, request.max_length, cancel_event,
+                temperature=request.temperature, top_p=request.top_p, do_sample=request.do_sample
+            ):
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, aborting text generation")
+                    return
+                yield f"data: {json.dumps({'text': text})}\n\n"
+            
+            done = {"model_id": text_generation_service.default_model_id}
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        finally:
+            # Stops generation when the client goes away mid-stream
+            cancel_event.set()
+            release_slot()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_after_response)
+    )
+
+@api_router.get("/ai/metrics")
+async def get_ai_metrics():
+    """Get performance metrics of the AI services."""
+    return {
+        "inference": model_loader.get_stats(),
+        "generation": text_generation_service.get_stats(),
+        "embeddings": embedding_service.get_stats(),
+        "semantic_cache": semantic_cache.get_stats(),
+        "scheduler": inference_scheduler.get_stats(),
+        "knowledge": vector_store.get_stats(),
+        "ingestion": ingestion_pipeline.get_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 class ComputeSimilarityRequest(BaseModel):
     text1: str
     text2: str
@@ -120,7 +360,7 @@ class ComputeSimilarityResponse(BaseModel):
     model_id: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
-@api_router.post("/ai/similarity", response_model=ComputeSimilarityResponse)
+@api_router.post("/ai/similarity", response_model=ComputeSimilarityResponse, dependencies=[Depends(inference_slot)])
 async def compute_similarity(request: ComputeSimilarityRequest):
     """Compute similarity between two texts."""
     # Initialize the service if needed
@@ -136,6 +376,193 @@ async def compute_similarity(request: ComputeSimilarityRequest):
         model_id=embedding_service.default_model_id
     )
 
+class SearchRequest(BaseModel):
+    queries: List[str]
+    candidates: List[str]
+    top_k: int = Field(5, ge=1)
+
+class SearchHit(BaseModel):
+    text: str
+    index: int
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[List[SearchHit]]
+    model_id: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+@api_router.post("/ai/search", response_model=SearchResponse, dependencies=[Depends(inference_slot)])
+async def search(request: SearchRequest):
+    """Find the candidates most similar to each query."""
+    # Initialize the service if needed
+    await embedding_service.initialize()
+    
+    results = await embedding_service.search(
+        request.queries, request.candidates, request.top_k
+    )
+    
+    if results is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute embeddings"
+        )
+    
+    return SearchResponse(
+        results=results,
+        model_id=embedding_service.default_model_id
+    )
+
+# Knowledge base endpoints
+class KnowledgeDocument(BaseModel):
+    id: str
+    text: str
+
+class AddDocumentsRequest(BaseModel):
+    documents: List[KnowledgeDocument]
+
+class AddDocumentsResponse(BaseModel):
+    added: int
+    total: int
+    model_id: str
+
+class KnowledgeSearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(10, ge=1)
+
+class KnowledgeHit(BaseModel):
+    id: str
+    score: float
+
+class KnowledgeSearchResponse(BaseModel):
+    results: List[KnowledgeHit]
+    model_id: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+@api_router.post("/knowledge/documents", response_model=AddDocumentsResponse, dependencies=[Depends(inference_slot)])
+async def add_knowledge_documents(request: AddDocumentsRequest):
+    """Embed documents and add them to the knowledge base index."""
+    reserved = [document.id for document in request.documents if vector_store.is_reserved_id(document.id)]
+    if reserved:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Document ids must not contain '#chunk:': {reserved[0]}"
+        )
+    
+    await embedding_service.initialize()
+    
+    added = await vector_store.add_documents(
+        [document.id for document in request.documents],
+        [document.text for document in request.documents]
+    )
+    
+    if added < len(request.documents):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to index documents"
+        )
+    
+    return AddDocumentsResponse(
+        added=added,
+        total=vector_store.index.size,
+        model_id=embedding_service.default_model_id
+    )
+
+class UploadDocumentResponse(BaseModel):
+    document_id: str
+    job_id: str
+    status: str
+    chunks: int
+    chunks_embedded: int
+    chunks_skipped: int
+    chunks_deleted: int
+    chunks_per_second: float
+    total: int
+    model_id: str
+
+@api_router.post("/knowledge/upload/{document_id}", response_model=UploadDocumentResponse)
+async def upload_knowledge_document(document_id: str, request: Request, job_id: Optional[str] = None):
+    """Stream a raw document body through the ingestion pipeline as ``<document_id>#chunk:<hash>`` chunks.
+    
+    The body is decoded, chunked and indexed as it arrives, so memory use
+    does not grow with the document size. Each embedding batch takes its
+    own inference slot, rather than one slot for the whole upload. The MIME
+    type comes from ``Content-Type``. Uploading a new version of a document only embeds its
+    changed chunks and deletes the chunks that are gone.
+    """
+    if vector_store.is_reserved_id(document_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document ids must not contain '#chunk:'"
+        )
+    
+    await embedding_service.initialize()
+    
+    mime_type = request.headers.get("Content-Type", "text/plain").split(";")[0].strip()
+    params = admission_params(request)
+    job = await ingestion_pipeline.ingest(
+        document_id, request.stream(), mime_type, job_id=job_id,
+        admission=lambda: inference_scheduler.admit(*params)
+    )
+    
+    if job["status"] != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to index document (job {job['job_id']}): {job['error']}"
+        )
+    
+    return UploadDocumentResponse(
+        document_id=document_id,
+        job_id=job["job_id"],
+        status=job["status"],
+        chunks=job["chunks"],
+        chunks_embedded=job["chunks_embedded"],
+        chunks_skipped=job["chunks_skipped"],
+        chunks_deleted=job["chunks_deleted"],
+        chunks_per_second=job["chunks_per_second"],
+        total=vector_store.index.size,
+        model_id=embedding_service.default_model_id
+    )
+
+@api_router.get("/knowledge/ingestion/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Progress of a document ingestion job."""
+    job = await ingestion_pipeline.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Ingestion job not found"
+        )
+    return job
+
+@api_router.delete("/knowledge/documents/{document_id}")
+async def delete_knowledge_document(document_id: str):
+    """Remove a document, or all chunks of an uploaded document, from the knowledge base index."""
+    deleted = await vector_store.delete_documents([document_id] + await vector_store.chunk_ids(document_id))
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    return {"deleted": deleted}
+
+@api_router.post("/knowledge/search", response_model=KnowledgeSearchResponse, dependencies=[Depends(inference_slot)])
+async def search_knowledge(request: KnowledgeSearchRequest):
+    """Find the knowledge base documents most similar to a query."""
+    await embedding_service.initialize()
+    
+    results = await vector_store.search(request.query, request.top_k)
+    
+    if results is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to compute embeddings"
+        )
+    
+    return KnowledgeSearchResponse(
+        results=results,
+        model_id=embedding_service.default_model_id
+    )
+
 # Include all routers
 api_router.include_router(auth_router)
 api_router.include_router(agents_router)
@@ -165,21 +592,36 @@ logger = logging.getLogger(__name__)
 async def get_db():
     return db
 
-# Events
-@app.on_event("startup")
-async def startup_db_client():
-    """Initialize services on startup."""
-    logger.info("Starting up Omnia AI Platform")
-    # Initialize AI services
+# Background warm-up of the AI services, tracked by /api/ready
+warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up_services():
+    """Import ML libraries off the event loop, then load the default models."""
     try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, import_ml_libraries)
         await embedding_service.initialize()
         await text_generation_service.initialize()
         logger.info("AI services initialized")
     except Exception as e:
         logger.exception(f"Error initializing AI services: {e}")
 
+# Events
+@app.on_event("startup")
+async def startup_db_client():
+    """Start warming up services without blocking startup."""
+    global warmup_task
+    logger.info("Starting up Omnia AI Platform")
+    # The server answers /api/health right away; /api/ready turns healthy
+    # once the default models are loaded
+    warmup_task = asyncio.create_task(warm_up_services())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Shutdown services."""
     logger.info("Shutting down Omnia AI Platform")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    vector_store.flush()
+    model_loader.executor.shutdown(wait=False)
     client.close()
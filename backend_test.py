@@ -11,7 +11,7 @@ class OmniaAITester:
         self.tests_passed = 0
         self.token = None
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
+    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None, body=None):
         """Run a single API test"""
         url = f"{self.base_url}/{endpoint}"
         if headers is None:
@@ -27,7 +27,7 @@ class OmniaAITester:
             if method == 'GET':
                 response = requests.get(url, headers=headers)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=headers)
+                response = requests.post(url, json=data, data=body, headers=headers)
             elif method == 'PUT':
                 response = requests.put(url, json=data, headers=headers)
             elif method == 'DELETE':
@@ -64,6 +64,15 @@ class OmniaAITester:
             200
         )
 
+    def test_readiness_check(self):
+        """Test the readiness endpoint"""
+        return self.run_test(
+            "Readiness Endpoint",
+            "GET",
+            "api/ready",
+            200
+        )
+
     def test_base_api(self):
         """Test the base API endpoint"""
         return self.run_test(
@@ -83,6 +92,43 @@ class OmniaAITester:
             data={"prompt": prompt, "max_length": max_length}
         )
 
+    def test_greedy_text_generation(self, prompt="List three planning steps.", max_length=50):
+        """Test greedy text generation, which is served from the result cache when enabled"""
+        return self.run_test(
+            "Greedy Text Generation Endpoint",
+            "POST",
+            "api/ai/generate",
+            200,
+            data={"prompt": prompt, "max_length": max_length, "temperature": 0}
+        )
+
+    def test_text_generation_stream(self, prompt="Hello, how are you?", max_length=100):
+        """Test the streaming text generation endpoint"""
+        return self.run_test(
+            "Streaming Text Generation Endpoint",
+            "POST",
+            "api/ai/generate/stream",
+            200,
+            data={"prompt": prompt, "max_length": max_length}
+        )
+
+    def test_chat(self, conversation_id="backend-test-conversation"):
+        """Test the chat endpoint"""
+        return self.run_test(
+            "Chat Endpoint",
+            "POST",
+            "api/ai/chat",
+            200,
+            data={
+                "messages": [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": "What is AI?"}
+                ],
+                "max_length": 50,
+                "conversation_id": conversation_id
+            }
+        )
+
     def test_similarity_computation(self, text1="Hello world", text2="Hi there"):
         """Test the similarity computation endpoint"""
         return self.run_test(
@@ -93,6 +139,76 @@ class OmniaAITester:
             data={"text1": text1, "text2": text2}
         )
 
+    def test_similarity_search(self, queries=None, candidates=None, top_k=2):
+        """Test the similarity search endpoint"""
+        return self.run_test(
+            "Similarity Search Endpoint",
+            "POST",
+            "api/ai/search",
+            200,
+            data={
+                "queries": queries or ["What is AI?"],
+                "candidates": candidates or ["AI is artificial intelligence.", "Cats are pets.", "Machine learning"],
+                "top_k": top_k
+            }
+        )
+
+    def test_knowledge_add_documents(self):
+        """Test adding documents to the knowledge base"""
+        return self.run_test(
+            "Knowledge Add Documents Endpoint",
+            "POST",
+            "api/knowledge/documents",
+            200,
+            data={"documents": [
+                {"id": "doc-ai", "text": "Artificial intelligence lets machines learn from data."},
+                {"id": "doc-cats", "text": "Cats are popular pets."}
+            ]}
+        )
+
+    def test_knowledge_upload(self, document_id="doc-upload", edited=False):
+        """Test streaming a raw document into the knowledge base"""
+        lines = [f"Line {i}: Omnia AI indexes uploaded documents chunk by chunk." for i in range(200)]
+        if edited:
+            lines[100] = "This line was edited, so only the chunks around it are embedded again."
+        text = "\n".join(lines)
+        return self.run_test(
+            "Knowledge Upload Endpoint",
+            "POST",
+            f"api/knowledge/upload/{document_id}",
+            200,
+            headers={'Content-Type': 'text/plain; charset=utf-8'},
+            body=text.encode("utf-8")
+        )
+
+    def test_ingestion_job(self, job_id):
+        """Test reading the progress of an ingestion job"""
+        return self.run_test(
+            "Ingestion Job Endpoint",
+            "GET",
+            f"api/knowledge/ingestion/{job_id}",
+            200
+        )
+
+    def test_knowledge_search(self, query="What is machine learning?", top_k=1):
+        """Test searching the knowledge base"""
+        return self.run_test(
+            "Knowledge Search Endpoint",
+            "POST",
+            "api/knowledge/search",
+            200,
+            data={"query": query, "top_k": top_k}
+        )
+
+    def test_ai_metrics(self):
+        """Test the AI metrics endpoint"""
+        return self.run_test(
+            "AI Metrics Endpoint",
+            "GET",
+            "api/ai/metrics",
+            200
+        )
+
 def main():
     # Get the backend URL from the environment variable
     backend_url = "https://b132d8d3-0684-4b93-a4ae-e53b212f986d.preview.emergentagent.com"
@@ -104,6 +220,10 @@ def main():
     
     # Run tests
     health_success, health_data = tester.test_health_check()
+    ready_success, ready_data = tester.test_readiness_check()
+
+    if not ready_success:
+        print(f"Readiness: {ready_data}")
     base_success, base_data = tester.test_base_api()
     
     # Test AI endpoints
@@ -116,6 +236,23 @@ def main():
         print(f"Generated text: {gen_data.get('text', 'No text generated')[:50]}...")
         print(f"Model ID: {gen_data.get('model_id', 'Unknown')}")
     
+    # Run twice so the second request can hit the result cache
+    tester.test_greedy_text_generation()
+    greedy_success, greedy_data = tester.test_greedy_text_generation()
+
+    if greedy_success:
+        print(f"Greedy text: {greedy_data.get('text', 'No text generated')[:50]}...")
+
+    stream_success, _ = tester.test_text_generation_stream(
+        prompt="Explain what artificial intelligence is in simple terms.",
+        max_length=150
+    )
+
+    chat_success, chat_data = tester.test_chat()
+
+    if chat_success:
+        print(f"Chat response: {chat_data.get('text', 'No response')[:50]}...")
+
     sim_success, sim_data = tester.test_similarity_computation(
         text1="Artificial intelligence is transforming our world.",
         text2="AI is changing how we live and work."
@@ -124,6 +261,35 @@ def main():
     if sim_success:
         print(f"Similarity score: {sim_data.get('similarity', 'No score calculated')}")
         print(f"Model ID: {sim_data.get('model_id', 'Unknown')}")
+
+    search_success, search_data = tester.test_similarity_search()
+
+    if search_success:
+        print(f"Search results: {search_data.get('results')}")
+
+    tester.test_knowledge_add_documents()
+    upload_success, upload_data = tester.test_knowledge_upload()
+
+    if upload_success:
+        print(f"Uploaded chunks: {upload_data.get('chunks')} at {upload_data.get('chunks_per_second')} chunks/s")
+        tester.test_ingestion_job(upload_data.get('job_id'))
+
+    reupload_success, reupload_data = tester.test_knowledge_upload(edited=True)
+
+    if reupload_success:
+        print(f"Re-uploaded chunks: {reupload_data.get('chunks_embedded')} embedded, "
+              f"{reupload_data.get('chunks_skipped')} skipped, {reupload_data.get('chunks_deleted')} deleted")
+
+    knowledge_success, knowledge_data = tester.test_knowledge_search()
+
+    if knowledge_success:
+        print(f"Knowledge results: {knowledge_data.get('results')}")
+
+    metrics_success, metrics_data = tester.test_ai_metrics()
+
+    if metrics_success:
+        print(f"Generation batching: {metrics_data.get('generation', {}).get('batching')}")
+        print(f"Generation result cache: {metrics_data.get('generation', {}).get('result_cache')}")
     
     # Print results
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
@@ -5,8 +5,13 @@ set -e
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# Start Uvicorn with proper host binding; with WEB_CONCURRENCY above 1, run
+# that many workers under Gunicorn, sharing models preloaded in the master
+if [ "${WEB_CONCURRENCY:-1}" -gt 1 ]; then
+    gunicorn -c gunicorn.conf.py server:app &
+else
+    uvicorn server:app --host 0.0.0.0 --port 8001 &
+fi
 BACKEND_PID=$!
 
 echo "Waiting for backend to start..."
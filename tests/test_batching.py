@@ -0,0 +1,125 @@
+"""Tests for micro-batching of generation and embedding requests."""
+import asyncio
+
+import numpy as np
+
+from core.batching import EmbeddingBatcher, GenerationBatcher
+from core.model_loader import ModelLoader, generation_params
+
+
+class RecordingLoader:
+    """Model loader stand-in that records every batched call."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    async def generate_batch(self, model_id, prompts, max_length, params, max_new_tokens):
+        self.calls.append((model_id, list(prompts), max_length, params, max_new_tokens))
+        if "fail" in prompts:
+            raise RuntimeError("generation failed")
+        return [f"{prompt}!" for prompt in prompts]
+
+
+def test_concurrent_requests_share_one_batch():
+    loader = RecordingLoader()
+    batcher = GenerationBatcher(loader, max_batch_size=8, max_wait_ms=50)
+    
+    async def run():
+        return await asyncio.gather(*[batcher.generate("m", f"p{i}", 20) for i in range(5)])
+    
+    assert asyncio.run(run()) == [f"p{i}!" for i in range(5)]
+    assert loader.calls == [("m", [f"p{i}" for i in range(5)], 20, None, None)]
+    assert batcher.get_stats()["batch_size_histogram"] == {5: 1}
+
+
+def test_batches_are_grouped_by_settings():
+    loader = RecordingLoader()
+    batcher = GenerationBatcher(loader, max_batch_size=8, max_wait_ms=50)
+    greedy = generation_params(temperature=0)
+    
+    async def run():
+        return await asyncio.gather(
+            batcher.generate("m", "a", 20),
+            batcher.generate("m", "b", 20, greedy),
+            batcher.generate("m", "c", 20),
+            batcher.generate("m", "d", max_new_tokens=5),
+            batcher.generate("m", "e", 30, max_new_tokens=5),
+        )
+    
+    assert asyncio.run(run()) == ["a!", "b!", "c!", "d!", "e!"]
+    assert sorted(loader.calls, key=lambda call: call[1]) == [
+        ("m", ["a", "c"], 20, None, None),
+        ("m", ["b"], 20, greedy, None),
+        ("m", ["d", "e"], None, None, 5),
+    ]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    loader = RecordingLoader()
+    batcher = GenerationBatcher(loader, max_batch_size=2, max_wait_ms=50)
+    
+    async def run():
+        return await asyncio.gather(*[batcher.generate("m", f"p{i}", 20) for i in range(5)])
+    
+    assert asyncio.run(run()) == [f"p{i}!" for i in range(5)]
+    assert [call[1] for call in loader.calls] == [["p0", "p1"], ["p2", "p3"], ["p4"]]
+
+
+def test_errors_reach_every_request_of_the_group():
+    batcher = GenerationBatcher(RecordingLoader(), max_batch_size=8, max_wait_ms=50)
+    
+    async def run():
+        return await asyncio.gather(
+            batcher.generate("m", "ok", 20), batcher.generate("m", "fail", 20),
+            batcher.generate("m", "other", 30), return_exceptions=True
+        )
+    first, second, third = asyncio.run(run())
+    
+    assert isinstance(first, RuntimeError) and isinstance(second, RuntimeError)
+    assert third == "other!"
+
+
+def test_batched_greedy_generation_matches_single_requests(causal_lm):
+    model, tokenizer = causal_lm
+    prompts = ["Hi", "A much longer prompt than the first", "Mid length one"]
+    greedy = generation_params(temperature=0)
+    
+    batched = ModelLoader._generate_batch_sync(model, tokenizer, prompts, None, greedy, 8)
+    single = [ModelLoader._generate_batch_sync(model, tokenizer, [prompt], None, greedy, 8)[0]
+              for prompt in prompts]
+    assert batched == single
+    
+    # With max_length each prompt only gets the tokens its own length leaves
+    limited = ModelLoader._generate_batch_sync(model, tokenizer, prompts, 40, greedy)
+    assert limited == [ModelLoader._generate_batch_sync(model, tokenizer, [prompt], 40, greedy)[0]
+                       for prompt in prompts]
+
+
+class EmbeddingLoader:
+    """Model loader stand-in whose embedding of a text is its length and first character."""
+    
+    def __init__(self):
+        self.calls = []
+    
+    async def get_embedding(self, model_id, texts):
+        self.calls.append((model_id, list(texts)))
+        return np.array([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+
+def test_embedding_requests_are_merged_and_deduplicated():
+    loader = EmbeddingLoader()
+    batcher = EmbeddingBatcher(loader, max_batch_size=8, max_wait_ms=50)
+    
+    async def run():
+        return await asyncio.gather(
+            batcher.embed("m", ["a", "bb"]), batcher.embed("m", ["bb", "ccc", "a"]),
+            batcher.embed("other", ["a"]),
+        )
+    first, second, other = asyncio.run(run())
+    
+    assert sorted(loader.calls) == [("m", ["a", "bb", "ccc"]), ("other", ["a"])]
+    np.testing.assert_array_equal(first, [[1, 97], [2, 98]])
+    np.testing.assert_array_equal(second, [[2, 98], [3, 99], [1, 97]])
+    np.testing.assert_array_equal(other, [[1, 97]])
+    stats = batcher.get_stats()
+    assert (stats["texts_requested"], stats["texts_encoded"]) == (6, 4)
@@ -0,0 +1,73 @@
+"""Tests for continuous batching of text generation."""
+import asyncio
+
+from core.continuous_batching import ContinuousBatcher
+from core.model_loader import ModelLoader, generation_params
+
+
+def _loader(model, tokenizer):
+    loader = ModelLoader()
+    loader.models["m"] = model
+    loader.tokenizers["m"] = tokenizer
+    
+    async def ensure_loaded(model_id):
+        return True
+    loader.ensure_loaded = ensure_loaded
+    return loader
+
+
+def test_greedy_output_matches_static_generation(causal_lm):
+    model, tokenizer = causal_lm
+    batcher = ContinuousBatcher(_loader(model, tokenizer), max_batch_size=3)
+    greedy = generation_params(temperature=0)
+    requests = [("Hello there", 6), ("A longer prompt for the batch", 12), ("?", 4), ("x", 9), ("Late", 5)]
+    
+    async def run():
+        tasks = []
+        for position, (prompt, max_new_tokens) in enumerate(requests):
+            tasks.append(asyncio.ensure_future(batcher.generate("m", prompt, params=greedy, max_new_tokens=max_new_tokens)))
+            if position == 3:
+                # Join a batch that is already decoding
+                await asyncio.sleep(0.05)
+        return await asyncio.gather(*tasks)
+    results = asyncio.run(run())
+    
+    expected = [ModelLoader._generate_batch_sync(model, tokenizer, [prompt], None, greedy, max_new_tokens)[0]
+                for prompt, max_new_tokens in requests]
+    assert results == expected
+    stats = batcher.get_stats()
+    assert stats["requests"] == 5 and stats["fallback_requests"] == 0
+    assert 1 < stats["mean_batch_size"] <= 3
+
+
+def test_cancelled_request_leaves_the_batch(causal_lm):
+    model, tokenizer = causal_lm
+    batcher = ContinuousBatcher(_loader(model, tokenizer), max_batch_size=4)
+    greedy = generation_params(temperature=0)
+    
+    async def run():
+        long = asyncio.ensure_future(batcher.generate("m", "Endless", params=greedy, max_new_tokens=200))
+        short = asyncio.ensure_future(batcher.generate("m", "Short", params=greedy, max_new_tokens=5))
+        await asyncio.sleep(0.05)
+        long.cancel()
+        return await short, await asyncio.gather(long, return_exceptions=True)
+    short, (long,) = asyncio.run(run())
+    
+    assert short == ModelLoader._generate_batch_sync(model, tokenizer, ["Short"], None, greedy, 5)[0]
+    assert isinstance(long, asyncio.CancelledError)
+    assert batcher.get_stats()["tokens_generated"] < 200
+
+
+def test_models_without_forward_fall_back_to_generate_text():
+    class Loader:
+        models = {"m": object()}
+        
+        async def ensure_loaded(self, model_id):
+            return True
+        
+        async def generate_text(self, model_id, prompt, max_length, params, max_new_tokens):
+            return f"{prompt}:{max_length}:{max_new_tokens}"
+    batcher = ContinuousBatcher(Loader())
+    
+    assert asyncio.run(batcher.generate("m", "p", 20, max_new_tokens=3)) == "p:20:3"
+    assert batcher.get_stats()["fallback_requests"] == 1
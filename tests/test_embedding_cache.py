@@ -0,0 +1,91 @@
+"""Tests for the two-tier embedding cache."""
+import asyncio
+
+import numpy as np
+import pytest
+
+from core.embedding_cache import DiskEmbeddingStore, EmbeddingCache, encode_vector, decode_vector
+
+
+def _digest(home: int, tag: int) -> bytes:
+    """A digest whose home slot is ``home``, told apart by ``tag``."""
+    return home.to_bytes(8, "little") + tag.to_bytes(8, "little")
+
+
+@pytest.mark.parametrize("precision", ["float32", "float16", "int8"])
+def test_disk_store_round_trip_and_reopen(tmp_path, precision):
+    rng = np.random.default_rng(0)
+    digests = [_digest(index * 3, index + 1) for index in range(5)]
+    vectors = [encode_vector(vector, precision) for vector in rng.normal(size=(5, 6)).astype(np.float32)]
+    DiskEmbeddingStore(str(tmp_path), 64, precision).put_many(digests, vectors)
+    
+    found = DiskEmbeddingStore(str(tmp_path), 64, precision).get_many(digests + [_digest(1, 99)])
+    assert found[-1] is None
+    for stored, vector in zip(found, vectors):
+        np.testing.assert_array_equal(decode_vector(stored), decode_vector(vector))
+
+
+def test_disk_store_overwrites_home_slot_when_probes_are_full(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), 16, "float32")
+    digests = [_digest(0, tag) for tag in range(1, store.PROBES + 2)]
+    vectors = [np.full(2, tag, dtype=np.float32) for tag in range(len(digests))]
+    store.put_many(digests, vectors)
+    
+    found = store.get_many(digests)
+    assert store.evictions == 1
+    assert found[0] is None
+    np.testing.assert_array_equal(found[-1], vectors[-1])
+    for stored, vector in zip(found[1:-1], vectors[1:-1]):
+        np.testing.assert_array_equal(stored, vector)
+
+
+def test_disk_store_discards_table_of_another_precision(tmp_path):
+    digest = _digest(5, 1)
+    DiskEmbeddingStore(str(tmp_path), 32, "float32").put_many([digest], [np.ones(4, dtype=np.float32)])
+    
+    assert DiskEmbeddingStore(str(tmp_path), 32, "float16").get_many([digest]) == [None]
+    assert DiskEmbeddingStore(str(tmp_path), 32, "float32").get_many([digest])[0] is not None
+
+
+def test_memory_tier_is_keyed_by_precision():
+    cache = EmbeddingCache("/nonexistent", max_entries=10, disk_capacity=0)
+    vectors = np.array([[0.5, -1.0, 2.0]], dtype=np.float32)
+    
+    async def run():
+        await cache.put_many("m", ["text"], vectors, precision="float32")
+        return (await cache.get_many("m", ["text"], precision="int8"),
+                await cache.get_many("m", ["text"], precision="float32"),
+                await cache.get_many("m", ["text"], precision="float32", backend="onnx"))
+    int8, float32, other_backend = asyncio.run(run())
+    
+    assert int8 == [None] and other_backend == [None]
+    np.testing.assert_array_equal(float32[0], vectors[0])
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = EmbeddingCache("/nonexistent", max_entries=2, disk_capacity=0)
+    vectors = np.eye(3, dtype=np.float32)
+    
+    async def run():
+        await cache.put_many("m", ["a", "b"], vectors[:2])
+        await cache.get_many("m", ["a"])
+        await cache.put_many("m", ["c"], vectors[2:])
+        return await cache.get_many("m", ["a", "b", "c"])
+    a, b, c = asyncio.run(run())
+    
+    assert b is None and a is not None and c is not None
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_disk_tier_serves_a_fresh_cache(tmp_path):
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    
+    async def run():
+        await EmbeddingCache(str(tmp_path), disk_capacity=64).put_many("m", ["a", "b"], vectors, "float16")
+        cache = EmbeddingCache(str(tmp_path), disk_capacity=64)
+        return cache, await cache.get_many("m", ["a", "b", "c"], "float16")
+    cache, found = asyncio.run(run())
+    
+    np.testing.assert_array_equal(np.stack(found[:2]), vectors)
+    assert found[2] is None
+    assert cache.get_stats()["disk_hits"] == 2
@@ -0,0 +1,56 @@
+"""Tests for the inference executor."""
+import asyncio
+import threading
+
+from core.executor import InferenceExecutor
+
+
+def test_cancelled_call_keeps_its_slot_until_it_returns():
+    executor = InferenceExecutor(max_workers=2, model_concurrency=1)
+    release = threading.Event()
+    started = []
+    
+    def blocking(name):
+        started.append(name)
+        release.wait(5)
+        return name
+    
+    async def run():
+        first = asyncio.ensure_future(executor.run("m", blocking, "first"))
+        while not started:
+            await asyncio.sleep(0.01)
+        first.cancel()
+        second = asyncio.ensure_future(executor.run("m", blocking, "second"))
+        await asyncio.sleep(0.1)
+        # The first call still runs on its thread, so the second one waits
+        assert started == ["first"]
+        assert executor.get_stats()["models"]["m"] == {"active": 1, "waiting": 1, "completed": 0}
+        release.set()
+        return await second, first.cancelled()
+    try:
+        assert asyncio.run(run()) == ("second", True)
+    finally:
+        release.set()
+        executor.shutdown()
+    
+    assert started == ["first", "second"]
+    assert executor.get_stats()["models"]["m"] == {"active": 0, "waiting": 0, "completed": 2}
+
+
+def test_errors_release_the_slot():
+    executor = InferenceExecutor(max_workers=1, model_concurrency=1)
+    
+    def failing():
+        raise RuntimeError("boom")
+    
+    async def run():
+        for _ in range(3):
+            try:
+                await executor.run("m", failing)
+            except RuntimeError:
+                pass
+        return await executor.run("m", sum, [1, 2])
+    try:
+        assert asyncio.run(run()) == 3
+    finally:
+        executor.shutdown()
@@ -0,0 +1,90 @@
+"""Tests for document chunking and ingestion."""
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+
+from knowledge.ingestion import TokenChunker, chunk_hash
+
+
+async def _pieces(text: str, size: int):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def _chunks(text: str, size: int = 997, **kwargs):
+    async def collect():
+        return [chunk async for chunk in TokenChunker(**kwargs).chunks(_pieces(text, size))]
+    return asyncio.run(collect())
+
+
+def _changed(before: str, after: str) -> int:
+    """Number of chunks of ``after`` that are not chunks of ``before``."""
+    old = Counter(chunk_hash(chunk) for chunk in _chunks(before))
+    new = Counter(chunk_hash(chunk) for chunk in _chunks(after))
+    return sum((new - old).values())
+
+
+def _templated_lines():
+    rng = random.Random(0)
+    return [
+        f"Order {i}: customer {rng.choice(['alice', 'bob', 'carol'])} bought {rng.randint(1, 9)} items "
+        f"at {rng.randint(1, 99)}.99 USD\n"
+        for i in range(2000)
+    ]
+
+
+def _prose():
+    rng = random.Random(1)
+    words = ["alpha", "beta", "gamma", "delta", "omega", "model", "data", "index", "chunk", "the", "of"]
+    return " ".join(rng.choice(words) + str(rng.randint(0, 99)) for _ in range(50000)) + "."
+
+
+def test_chunks_do_not_depend_on_piece_size():
+    text = "".join(_templated_lines()[:500]) + _prose()[:20000]
+    assert _chunks(text, 50) == _chunks(text, 997) == _chunks(text, len(text))
+
+
+def test_chunks_stay_within_the_token_limit():
+    chunker = TokenChunker()
+    for chunk in _chunks(_prose() + "".join(_templated_lines())):
+        assert len(chunker.token_spans(chunk)) <= chunker.chunk_tokens
+
+
+@pytest.mark.parametrize("edit", ["replace", "insert", "delete"])
+def test_local_edit_of_templated_lines_changes_few_chunks(edit):
+    lines = _templated_lines()
+    edited = list(lines)
+    if edit == "replace":
+        edited[1000] = "Order 1000: customer dave bought 3 items at 12.99 USD\n"
+    elif edit == "insert":
+        edited.insert(1000, "A note inserted between two orders.\n")
+    else:
+        del edited[1000]
+    assert _changed("".join(lines), "".join(edited)) <= 2
+
+
+def test_local_edit_of_repeated_lines_changes_few_chunks():
+    lines = ["status=ok value=1\n"] * 2000
+    edited = lines[:1000] + ["status=bad\n"] + lines[1000:]
+    assert _changed("".join(lines), "".join(edited)) <= 2
+
+
+def test_local_edit_of_backend_test_document_changes_few_chunks():
+    lines = [f"Line {i}: Omnia AI indexes uploaded documents chunk by chunk." for i in range(200)]
+    edited = list(lines)
+    edited[100] = "This line was edited, so only the chunks around it are embedded again."
+    assert _changed("\n".join(lines), "\n".join(edited)) <= 2
+
+
+def test_local_edit_of_prose_changes_few_chunks():
+    text = _prose()
+    middle = len(text) // 2
+    assert _changed(text, text[:middle] + " inserted sentence here. " + text[middle + 30:]) <= 2
+
+
+def test_short_lines_are_kept_whole():
+    lines = [f'{{"id": {i}, "name": "record {i}"}}\n' for i in range(300)]
+    for chunk in _chunks("".join(lines)):
+        assert all(line + "\n" in lines for line in chunk.split("\n") if line)
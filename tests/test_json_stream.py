@@ -0,0 +1,96 @@
+"""Tests for streaming JSON extraction."""
+import asyncio
+import json
+
+import pytest
+
+from knowledge.json_stream import iter_records
+
+
+async def _blocks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _records(data: bytes, size: int, mime_type: str = "application/json"):
+    async def collect():
+        return [json.loads(record) async for record in iter_records(_blocks(data, size), mime_type)]
+    return asyncio.run(collect())
+
+
+ARRAYS = [
+    b"[1.5]",
+    b"[1e5]",
+    b"[10.25]",
+    b"[-3, 2.5E-3, 1e+2, 0, -0.0]",
+    b'[1, "a,b]", {"x": [1.25, null]}, true, false, null, 12345678901234567890123]',
+    b'  [ {"n": 10.5} , 7 , [] ]  ',
+]
+
+
+@pytest.mark.parametrize("data", ARRAYS)
+def test_array_matches_json_loads_at_every_block_size(data):
+    expected = json.loads(data)
+    for size in range(1, len(data) + 1):
+        assert _records(data, size) == expected, size
+
+
+def test_byte_order_mark_is_skipped():
+    data = b"\xef\xbb\xbf" + b'[{"a": 1}, 2.5]'
+    for size in range(1, len(data) + 1):
+        assert _records(data, size) == [{"a": 1}, 2.5]
+
+
+def _members(value):
+    """Records expected for a top-level object: one per member, or per element of an array member."""
+    records = []
+    for key, member in value.items():
+        if isinstance(member, list):
+            records.extend([{key: element} for element in member] or [{key: []}])
+        else:
+            records.append({key: member})
+    return records
+
+
+OBJECTS = [
+    b"{}",
+    b'{"a": 1.5}',
+    b'{"a": 1e5, "b": "x}", "c": {"d": [1, 2.25]}}',
+    b'{"items": [1, {"n": 10.5}, [3]], "empty": [], "total": 12}',
+    b' { "k" : true , "l" : null } ',
+]
+
+
+@pytest.mark.parametrize("data", OBJECTS)
+def test_object_streams_members_at_every_block_size(data):
+    expected = _members(json.loads(data))
+    for size in range(1, len(data) + 1):
+        assert _records(data, size) == expected, size
+
+
+def test_scalar_is_one_record():
+    assert _records(b' "text" ', 2) == ["text"]
+    assert _records(b"12.5", 1) == [12.5]
+
+
+@pytest.mark.parametrize("data", [b"[1, 2", b"[1 2]", b"[1, }", b'{"a" 1}', b'{"a": }', b"{1: 2}", b'{"a": [1}'])
+def test_invalid_array_raises(data):
+    with pytest.raises(ValueError):
+        _records(data, 2)
+
+
+def test_json_lines_skip_invalid_lines():
+    data = b'{"a": 1}\n\nnot json\n{"b": [1, 2]}\n"\xc3\xa9"'
+    assert _records(data, 3, "application/x-ndjson") == [{"a": 1}, {"b": [1, 2]}, "é"]
+
+
+def test_document_chunks_hold_whole_records():
+    from knowledge.document_processor import DocumentProcessor
+    
+    data = json.dumps({"items": [{"id": index, "text": "x" * (index % 7)} for index in range(50)]}).encode()
+    
+    async def collect():
+        return [chunk async for chunk in DocumentProcessor.iter_text_chunks(_blocks(data, 5), "application/json", 64)]
+    chunks = asyncio.run(collect())
+    assert [json.loads(chunk) for chunk in chunks] == _members(json.loads(data))
+    assert all(chunk.endswith("\n") for chunk in chunks)
@@ -0,0 +1,108 @@
+"""Tests for inference admission control."""
+import asyncio
+import time
+
+import pytest
+
+from core.scheduler import AdmissionRejected, InferenceScheduler
+from models.task import TaskPriority
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queued_requests_are_served_by_priority_then_in_turn():
+    scheduler = InferenceScheduler(max_concurrency=1, max_queue=10, max_per_user=10)
+    order = []
+    
+    async def request(user_id, priority, name):
+        async with scheduler.admit(user_id, priority):
+            order.append(name)
+            await asyncio.sleep(0)
+    
+    async def run():
+        holder = await scheduler.acquire("holder")
+        tasks = [
+            asyncio.ensure_future(request("a", TaskPriority.LOW, "a-low")),
+            asyncio.ensure_future(request("a", TaskPriority.MEDIUM, "a1")),
+            asyncio.ensure_future(request("a", TaskPriority.MEDIUM, "a2")),
+            asyncio.ensure_future(request("b", TaskPriority.MEDIUM, "b1")),
+            asyncio.ensure_future(request("c", TaskPriority.HIGH, "c-high")),
+        ]
+        await _settle()
+        assert scheduler.get_stats()["queued"] == 5
+        scheduler.release(holder)
+        await asyncio.gather(*tasks)
+    asyncio.run(run())
+    
+    assert order == ["c-high", "a1", "b1", "a2", "a-low"]
+    assert scheduler.running == 0 and scheduler.queued == 0
+
+
+def test_full_queue_and_busy_user_are_rejected():
+    scheduler = InferenceScheduler(max_concurrency=1, max_queue=1, max_per_user=2)
+    
+    async def run():
+        holder = await scheduler.acquire("a")
+        waiting = asyncio.ensure_future(scheduler.acquire("a"))
+        await _settle()
+        with pytest.raises(AdmissionRejected) as user_limit:
+            await scheduler.acquire("a")
+        with pytest.raises(AdmissionRejected) as queue_full:
+            await scheduler.acquire("b")
+        scheduler.release(holder)
+        scheduler.release(await waiting)
+        return user_limit.value, queue_full.value
+    user_limit, queue_full = asyncio.run(run())
+    
+    assert user_limit.status_code == 429 and user_limit.retry_after >= 1.0
+    assert queue_full.status_code == 503 and queue_full.retry_after >= 1.0
+    assert scheduler.get_stats()["rejected"] == {"user_limit": 1, "queue_full": 1}
+
+
+def test_higher_priority_sheds_the_newest_lower_priority_request():
+    scheduler = InferenceScheduler(max_concurrency=1, max_queue=2, max_per_user=10)
+    
+    async def run():
+        holder = await scheduler.acquire("x")
+        older = asyncio.ensure_future(scheduler.acquire("a", TaskPriority.LOW))
+        newer = asyncio.ensure_future(scheduler.acquire("b", TaskPriority.LOW))
+        await _settle()
+        urgent = asyncio.ensure_future(scheduler.acquire("c", TaskPriority.HIGH))
+        await _settle()
+        with pytest.raises(AdmissionRejected) as shed:
+            await newer
+        scheduler.release(holder)
+        scheduler.release(await urgent)
+        scheduler.release(await older)
+        return shed.value
+    shed = asyncio.run(run())
+    
+    assert shed.status_code == 503
+    assert scheduler.get_stats()["rejected"] == {"shed": 1}
+    assert scheduler.running == 0 and scheduler.queued == 0
+
+
+def test_deadlines_and_cancellation_free_the_queue():
+    scheduler = InferenceScheduler(max_concurrency=1, max_queue=4, max_per_user=10)
+    
+    async def run():
+        holder = await scheduler.acquire("x")
+        with pytest.raises(AdmissionRejected) as expired:
+            await scheduler.acquire("a", deadline=time.monotonic() + 0.05)
+        cancelled = asyncio.ensure_future(scheduler.acquire("b"))
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+        assert scheduler.queued == 0
+        with pytest.raises(AdmissionRejected) as passed:
+            await scheduler.acquire("c", deadline=time.monotonic() - 1)
+        scheduler.release(holder)
+        return expired.value, passed.value
+    expired, passed = asyncio.run(run())
+    
+    assert expired.status_code == 504 and passed.status_code == 504
+    stats = scheduler.get_stats()
+    assert stats["expired"] == 1 and stats["running"] == 0 and stats["queued"] == 0
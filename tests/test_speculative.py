@@ -0,0 +1,84 @@
+"""Tests for speculative decoding."""
+import asyncio
+
+import pytest
+
+from core.model_loader import ModelLoader, generation_params
+from core.speculative import SpeculativeDecoder, _probabilities
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+
+@pytest.fixture(scope="module")
+def draft_lm(causal_lm):
+    """A draft model that disagrees with ``causal_lm``: same shape, other random weights."""
+    model, _ = causal_lm
+    torch.manual_seed(1)
+    draft = transformers.GPT2LMHeadModel(model.config)
+    draft.eval()
+    return draft
+
+
+def test_greedy_output_matches_the_main_model(causal_lm, draft_lm):
+    model, tokenizer = causal_lm
+    decoder = SpeculativeDecoder(ModelLoader(), num_draft_tokens=3)
+    greedy = generation_params(temperature=0)
+    
+    for prompt, max_new_tokens in [("Speculation", 10), ("A", 7), ("Another prompt", 1)]:
+        text, stats = decoder._generate_sync(model, draft_lm, tokenizer, prompt, None, greedy, max_new_tokens)
+        assert text == ModelLoader._generate_batch_sync(model, tokenizer, [prompt], None, greedy, max_new_tokens)[0]
+        assert stats["generated"] == max_new_tokens
+    
+    # A draft that always agrees has every proposal accepted
+    text, stats = decoder._generate_sync(model, model, tokenizer, "Same model", None, greedy, 12)
+    assert stats["accepted"] == stats["proposed"]
+    assert stats["target_forwards"] == 3
+
+
+def test_sampled_tokens_follow_the_main_model_distribution(causal_lm, draft_lm):
+    model, tokenizer = causal_lm
+    decoder = SpeculativeDecoder(ModelLoader(), num_draft_tokens=1)
+    # Sharp enough that the draft model's distribution is far from the main model's
+    params = generation_params(temperature=0.1, top_p=0.5)
+    prompt = "Sample"
+    with torch.no_grad():
+        logits = model(input_ids=torch.tensor([tokenizer.encode(prompt)])).logits[0, -1]
+    expected = _probabilities(logits, params)
+    
+    # Bytes that are not valid UTF-8 on their own decode alike, so compare decoded texts
+    expected_texts = {}
+    for token in expected.nonzero().flatten().tolist():
+        text = tokenizer.decode(tokenizer.encode(prompt) + [token])
+        expected_texts[text] = expected_texts.get(text, 0.0) + float(expected[token])
+    
+    torch.manual_seed(0)
+    samples = 1500
+    texts = [decoder._generate_sync(model, draft_lm, tokenizer, prompt, None, params, 1)[0]
+             for _ in range(samples)]
+    
+    total_variation = 0.5 * sum(
+        abs(texts.count(text) / samples - expected_texts.get(text, 0.0))
+        for text in set(texts) | set(expected_texts)
+    )
+    assert total_variation < 0.15
+
+
+def test_generate_uses_the_registered_draft_model(causal_lm, draft_lm):
+    model, tokenizer = causal_lm
+    loader = ModelLoader()
+    loader.models.update({"m": model, "d": draft_lm})
+    loader.tokenizers["m"] = tokenizer
+    loader.known_models.update({"m": {}, "d": {}})
+    
+    async def ensure_loaded(model_id):
+        return True
+    loader.ensure_loaded = ensure_loaded
+    loader.register_draft_model("m", "d")
+    decoder = SpeculativeDecoder(loader, num_draft_tokens=2)
+    greedy = generation_params(temperature=0)
+    
+    text = asyncio.run(decoder.generate("m", "Hello", params=greedy, max_new_tokens=6))
+    assert text == ModelLoader._generate_batch_sync(model, tokenizer, ["Hello"], None, greedy, 6)[0]
+    stats = decoder.get_stats()
+    assert stats["fallback_requests"] == 0 and stats["proposed_tokens"] > 0
@@ -0,0 +1,46 @@
+"""Tests for token streaming."""
+import asyncio
+
+from core.model_loader import ModelLoader, generation_params
+
+
+def _loader(causal_lm):
+    model, tokenizer = causal_lm
+    loader = ModelLoader()
+    loader.models["m"] = model
+    loader.tokenizers["m"] = tokenizer
+    loader.records["m"] = object()
+    loader.known_models["m"] = {"model_type": "causal_lm"}
+    loader._touch = lambda model_id: None
+    return loader
+
+
+def test_greedy_stream_matches_generate(causal_lm):
+    loader = _loader(causal_lm)
+    prompt = "Streaming is"
+    greedy = generation_params(temperature=0)
+    
+    async def run():
+        streamed = [text async for text in loader.stream_text("m", prompt, 30, params=greedy)]
+        generated = await loader.generate_text("m", prompt, 30, greedy)
+        return "".join(streamed), generated
+    streamed, generated = asyncio.run(run())
+    
+    assert streamed and generated == prompt + streamed
+
+
+def test_stream_passes_decoding_params(causal_lm):
+    loader = _loader(causal_lm)
+    calls = []
+    generate = loader._stream_generate_sync
+    
+    def record(*args):
+        calls.append(args[-1])
+        return generate(*args)
+    loader._stream_generate_sync = record
+    
+    async def run(params):
+        return [text async for text in loader.stream_text("m", "Hi", 6, params=params)]
+    asyncio.run(run(generation_params(temperature=1.3, top_p=0.4)))
+    asyncio.run(run(None))
+    assert calls == [{"do_sample": True, "temperature": 1.3, "top_p": 0.4}, generation_params()]
@@ -0,0 +1,47 @@
+"""Tests for conversation replies with and without a session."""
+import asyncio
+
+from core.text_generation import TextGenerationService
+
+
+def _service(causal_lm):
+    model, tokenizer = causal_lm
+    service = TextGenerationService()
+    loader = service.model_loader
+    model_id = service.default_model_id
+    loader.models[model_id] = model
+    loader.tokenizers[model_id] = tokenizer
+    loader.records[model_id] = object()
+    loader.known_models[model_id] = {"model_type": "causal_lm"}
+    loader._touch = lambda model_id: None
+    return service
+
+
+def test_session_and_plain_replies_match(causal_lm):
+    service = _service(causal_lm)
+    messages = [{"role": "user", "content": "Hello, how are you?"}]
+    
+    async def replies():
+        plain = await service.generate_response(messages, 12, temperature=0)
+        session = await service.generate_response(messages, 12, conversation_id="c", temperature=0)
+        return plain, session
+    plain, session = asyncio.run(replies())
+    
+    assert plain == session
+    assert plain and "Hello, how are you?" not in plain
+
+
+def test_session_uses_request_decoding_params(causal_lm):
+    service = _service(causal_lm)
+    calls = []
+    generate = service.model_loader._generate_with_session_sync
+    
+    def record(model, tokenizer, prompt, max_new_tokens, session, params):
+        calls.append(params)
+        return generate(model, tokenizer, prompt, max_new_tokens, session, params)
+    service.model_loader._generate_with_session_sync = record
+    
+    messages = [{"role": "user", "content": "Hi"}]
+    asyncio.run(service.generate_response(messages, 4, conversation_id="c", do_sample=False))
+    asyncio.run(service.generate_response(messages, 4, conversation_id="d", temperature=1.2, top_p=0.5))
+    assert calls == [{"do_sample": False}, {"do_sample": True, "temperature": 1.2, "top_p": 0.5}]
@@ -0,0 +1,74 @@
+"""Tests for the persistent IVF vector index."""
+import numpy as np
+import pytest
+
+from knowledge.vector_index import VectorIndex
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("precision", ["float32", "int8"])
+def test_add_delete_and_reopen(tmp_path, precision):
+    vectors = _vectors(200)
+    ids = [f"v{i}" for i in range(200)]
+    index = VectorIndex(str(tmp_path), train_threshold=100, nlist=8, nprobe=8, precision=precision)
+    index.add(ids[:150], vectors[:150])
+    assert index.trained
+    index.add(ids[150:], vectors[150:])
+    assert index.delete(["v3", "v170", "missing"]) == 2
+    index.flush()
+    
+    reopened = VectorIndex(str(tmp_path))
+    assert reopened.size == 198
+    assert reopened.trained
+    for position in (0, 42, 199):
+        assert reopened.search(vectors[position], k=1)[0][0][0] == ids[position]
+    found = {external_id for external_id, _ in reopened.search(vectors[3], k=200)[0]}
+    assert "v3" not in found and "v170" not in found
+
+
+def test_search_before_training_is_exact(tmp_path):
+    vectors = _vectors(20)
+    index = VectorIndex(str(tmp_path), train_threshold=1000)
+    index.add([f"v{i}" for i in range(20)], vectors)
+    
+    assert not index.trained
+    assert index.search(vectors[[5, 7]], k=1) == index.search_exact(vectors[[5, 7]], k=1)
+    assert index.search(vectors[5], k=1)[0][0][0] == "v5"
+
+
+def test_repeated_replacement_is_compacted(tmp_path):
+    index = VectorIndex(str(tmp_path), train_threshold=50, nlist=4, nprobe=4)
+    index.COMPACT_MIN_ROWS = 10
+    ids = [f"doc#chunk:{i}" for i in range(40)]
+    for round_number in range(30):
+        index.add(ids, _vectors(40, seed=round_number))
+        assert index.count <= 2 * 40 + 40
+    
+    latest = _vectors(40, seed=29)
+    assert index.size == 40
+    assert sorted(index.chunk_ids("doc")) == sorted(ids)
+    assert index.search(latest[11], k=1)[0][0][0] == ids[11]
+    
+    index.flush()
+    reopened = VectorIndex(str(tmp_path))
+    assert reopened.size == 40 and reopened.count == index.count
+    assert reopened.search(latest[11], k=1)[0][0][0] == ids[11]
+    with open(tmp_path / "ids.jsonl") as f:
+        assert sum(1 for _ in f) == index.count
+
+
+def test_compact_keeps_live_rows(tmp_path):
+    vectors = _vectors(60)
+    ids = [f"v{i}" for i in range(60)]
+    index = VectorIndex(str(tmp_path), train_threshold=1000, precision="float16")
+    index.add(ids, vectors)
+    index.delete(ids[::2])
+    before = index.search_exact(vectors[:10], k=5)
+    
+    index.compact()
+    assert index.count == 30 and index.size == 30
+    assert index.search_exact(vectors[:10], k=5) == before
+    assert VectorIndex(str(tmp_path)).search_exact(vectors[:10], k=5) == before